@@ -8,36 +8,58 @@ import json
 from groq import Groq
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.cli import read_payload, read_phase, write_result
+from src.utils.documentStore import load_documents
+from src.utils.documentArea import parse_area_sqm, area_mismatch
+from src.services.modelRouter import estimate_tokens, prescreen_documents, route_request, track_route
+from src.utils.llmStream import JsonVerdictScanner, parse_json_text, stream_completion
+from src.services.duplicateIndex import check_documents, duplicate_rejection, duplicate_red_flag
+from src.utils.profiling import profile_request
+from src.utils import metrics
+
 load_dotenv()
 
-def analyze_property(data):
-    """Analyze property and return valuation"""
+AGENT_NAME = 'groq'
+
+def verify_documents(data):
+    """
+    Phase 1: document type and mandatory-field verification.
+    
+    Needs only the documents, so it can start before satellite data exists.
+    """
     try:
         client = Groq(api_key=os.getenv('GROQ_API_KEY'))
         
-        # Get document contents
-        document_contents = data.get('document_contents', [])
-        has_documents = len(document_contents) > 0
+        # Get documents (inline contents or lazily loaded references)
+        documents = load_documents(data)
+        has_documents = len(documents) > 0
         
         # Debug log to stderr
-        print(f"[Agent1 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-        for i, content in enumerate(document_contents):
-            print(f"[Agent1 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
+        print(f"[Agent1 DEBUG] Received {len(documents)} documents", file=sys.stderr)
+        for i, document in enumerate(documents):
+            print(f"[Agent1 DEBUG] Doc {i+1}: {len(document)} chars, preview: {document.preview(100)}", file=sys.stderr)
+        
+        # Deed text reused from an earlier submission is rejected without a model call
+        duplicates = check_documents((document.text for document in documents), data.get('request_id'), submission=data)
+        if duplicates['reject']:
+            verification = duplicate_rejection(duplicates)
+            verification['agent'] = AGENT_NAME
+            return verification
         
         document_analysis = ""
         if has_documents:
-            document_analysis = f"\n\nDOCUMENT CONTENTS TO ANALYZE:\n"
-            for i, content in enumerate(document_contents):
+            sections = ["\n\nDOCUMENT CONTENTS TO ANALYZE:\n"]
+            for i, document in enumerate(documents):
                 # Analyze FULL document text, not just first 1000 chars
-                document_analysis += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
+                sections.append(f"\nDocument {i+1} (FULL TEXT - {len(document)} characters):\n{document.text}\n")
+            document_analysis = "".join(sections)
         
         prompt = f"""
-Analyze this real estate property according to land document verification standards and provide a valuation in JSON format.
+Verify these real estate documents according to land document verification standards. Return your findings in JSON format.
 
 PROPERTY DATA:
 Location: {data.get('latitude')}, {data.get('longitude')}
-Satellite Area: {data.get('satellite_data', {}).get('area_sqm', 'N/A')} sqm
-NDVI (vegetation): {data.get('satellite_data', {}).get('ndvi', 'N/A')}
 Documents: {data.get('document_count', 0)} files
 {document_analysis}
 
@@ -62,8 +84,6 @@ STEP 3: VALIDATION RULES
 - If missing ANY mandatory field → authenticity_score = 0-30, list in missing_fields
 - If contains placeholders (TODO, TBD, N/A) → authenticity_score = 0, red_flags: ["Contains placeholder data"]
 - If document appears forged or fraudulent → authenticity_score = 0-20
-- Compare documented area with satellite area ({data.get('satellite_data', {}).get('area_sqm', 'N/A')} sqm)
-- If area mismatch > 20% → Add "Area mismatch >20% with satellite data" to red_flags
 
 REJECTION CRITERIA (authenticity_score MUST be 0-40 if ANY apply):
 ❌ Document is NOT a land/property deed
@@ -75,55 +95,205 @@ REJECTION CRITERIA (authenticity_score MUST be 0-40 if ANY apply):
 ❌ Contains placeholder or incomplete data
 ❌ Document appears forged or fraudulent
 
-Provide comprehensive analysis. Return ONLY valid JSON:
+Return ONLY valid JSON:
+{{
+    "is_land_document": <true/false>,
+    "document_type_found": "<what type of document this appears to be>",
+    "authenticity_score": <0-100, MUST be 0-30 if not land document or missing mandatory fields>,
+    "missing_fields": ["<field1>", "<field2>"],
+    "red_flags": ["<flag1>", "<flag2>"],
+    "documented_area": "<total area exactly as written in the document, with units, or null>",
+    "findings": "<SPECIFIC findings from the document analysis>"
+}}
+"""
+        
+        # Pick the model and completion budget for this request
+        screen = prescreen_documents(document.text for document in documents)
+        document_tokens = sum(estimate_tokens(len(document)) for document in documents)
+        route = route_request(
+            AGENT_NAME, estimate_tokens(prompt), screen['confidence'],
+            data.get('budget'), 'document_verification', document_tokens,
+            land_score=screen['land_score']
+        )
+        
+        # Streamed so a hard reject can stop the generation as soon as the verdict is in
+        with track_route(route):
+            completion = stream_completion(
+                client, 'groq', 'document_verification', AGENT_NAME, route.model,
+                [
+                    {
+                        "role": "system",
+                        "content": "You are an expert real estate document examiner. Verify land documents strictly against the stated standards."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                JsonVerdictScanner(),
+                temperature=0.3,
+                max_tokens=route.max_tokens
+            )
+            route.record_usage(completion.usage, completion.completion_tokens)
+        
+        if completion.aborted:
+            # Keep the fields that arrived before the cut-off
+            verification = dict(completion.fields)
+            verification.setdefault('missing_fields', [])
+            verification.setdefault('red_flags', ["NOT A LAND DOCUMENT"])
+            verification.setdefault('findings', "Rejected early: document is not a land/property deed")
+            verification['aborted_early'] = True
+        else:
+            verification = parse_json_text(completion.text)
+        if duplicates['duplicate'] or duplicates['error']:
+            verification['red_flags'] = list(verification.get('red_flags') or []) + [duplicate_red_flag(duplicates)]
+            verification['duplicate_matches'] = duplicates['matches']
+        verification['documented_area_sqm'] = parse_area_sqm(verification.get('documented_area'))
+        verification['model'] = route.model
+        verification['agent'] = AGENT_NAME
+        return verification
+    
+    except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='documents').inc()
+        return {
+            "error": str(e),
+            "agent": AGENT_NAME
+        }
+
+def value_property(data, verification):
+    """
+    Phase 2: valuation and area reconciliation once satellite metrics are in.
+    
+    Works from the phase 1 findings, so the documents are not sent again.
+    """
+    try:
+        if verification.get('error'):
+            raise ValueError(f"Document verification failed: {verification['error']}")
+        
+        # A duplicate submission gets no valuation
+        if 'duplicate_of' in verification:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": verification['findings'],
+                "risk_factors": ["DUPLICATE DOCUMENT"],
+                "document_verification": {
+                    key: verification[key]
+                    for key in ('is_land_document', 'document_type_found', 'authenticity_score', 'missing_fields', 'red_flags')
+                },
+                "agent": AGENT_NAME
+            }
+        
+        satellite_data = data.get('satellite_data', {})
+        satellite_area = satellite_data.get('area_sqm')
+        
+        document_verification = {
+            "is_land_document": verification.get('is_land_document', False),
+            "document_type_found": verification.get('document_type_found', 'unknown'),
+            "authenticity_score": verification.get('authenticity_score', 0),
+            "missing_fields": list(verification.get('missing_fields') or []),
+            "red_flags": list(verification.get('red_flags') or [])
+        }
+        
+        # Compare documented area with satellite area locally
+        mismatch = area_mismatch(verification.get('documented_area_sqm'), satellite_area)
+        if mismatch is not None:
+            document_verification['red_flags'].append("Area mismatch >20% with satellite data")
+        
+        # A document that is not a land deed gets no valuation call at all
+        if not document_verification['is_land_document']:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": f"Rejected: {verification.get('findings') or 'document is not a land/property deed'}",
+                "risk_factors": ["NOT A LAND DOCUMENT"],
+                "document_verification": document_verification,
+                "agent": AGENT_NAME
+            }
+        
+        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+        
+        prompt = f"""
+Provide a valuation in JSON format for this real estate property, using the completed document verification below.
+
+PROPERTY DATA:
+Location: {data.get('latitude')}, {data.get('longitude')}
+Satellite Area: {satellite_data.get('area_sqm', 'N/A')} sqm
+NDVI (vegetation): {satellite_data.get('ndvi', 'N/A')}
+Documents: {data.get('document_count', 0)} files
+
+DOCUMENT VERIFICATION RESULT:
+Document type: {document_verification['document_type_found']}
+Authenticity score: {document_verification['authenticity_score']}
+Documented area: {verification.get('documented_area') or 'not stated'}
+Missing fields: {', '.join(document_verification['missing_fields']) or 'none'}
+Red flags: {', '.join(document_verification['red_flags']) or 'none'}
+Findings: {verification.get('findings', '')}
+
+RULES:
+- If authenticity_score is 0-40 → valuation 0 and confidence 0-30
+- If area mismatch >20% with satellite data is flagged → lower confidence and explain it
+
+Return ONLY valid JSON:
 {{
     "valuation": <number in USD, use 0 if rejecting>,
     "confidence": <number 0-100, use 0-30 if rejecting>,
     "reasoning": "<detailed explanation including SPECIFIC findings from document analysis>",
-    "risk_factors": ["<risk1>", "<risk2>"],
-    "document_verification": {{
-        "is_land_document": <true/false>,
-        "document_type_found": "<what type of document this appears to be>",
-        "authenticity_score": <0-100, MUST be 0-30 if not land document or missing mandatory fields>,
-        "missing_fields": ["<field1>", "<field2>"],
-        "red_flags": ["<flag1>", "<flag2>"]
-    }}
+    "risk_factors": ["<risk1>", "<risk2>"]
 }}
 """
         
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert real estate appraiser. Analyze property data and provide accurate valuations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,
-            max_tokens=2000,
-            response_format={"type": "json_object"}
-        )
+        route = route_request(AGENT_NAME, estimate_tokens(prompt), budget=data.get('budget'), phase='valuation')
+        with track_route(route), metrics.track_call('groq', 'valuation'):
+            completion = client.chat.completions.create(
+                model=route.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are an expert real estate appraiser. Analyze property data and provide accurate valuations."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.3,
+                max_tokens=route.max_tokens,
+                response_format={"type": "json_object"}
+            )
+            route.record_usage(completion.usage)
+        metrics.record_usage(AGENT_NAME, route.model, completion.usage)
         
         result = json.loads(completion.choices[0].message.content)
-        result['agent'] = 'groq'
+        result['document_verification'] = document_verification
+        result['agent'] = AGENT_NAME
         return result
-        
+    
     except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='valuation').inc()
         return {
             "error": str(e),
-            "agent": "groq"
+            "agent": AGENT_NAME
         }
 
+def analyze_property(data):
+    """Analyze property and return valuation"""
+    verification = data.get('document_verification') or verify_documents(data)
+    return value_property(data, verification)
+
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    metrics.start_exporters()
+    
+    # Read input from a file, args or stdin
+    input_data = read_payload()
     
-    result = analyze_property(input_data)
-    print(json.dumps(result))
+    # --phase documents runs verification only; --phase valuation expects its output
+    # in the payload's "document_verification" field
+    # --profile (or "profile": true) writes a flamegraph profile (see src/utils/profiling.py)
+    phase = read_phase()
+    with profile_request(f"{AGENT_NAME}-{phase or 'analysis'}", input_data):
+        if phase == 'documents':
+            result = verify_documents(input_data)
+        else:
+            result = analyze_property(input_data)
+    write_result(result)
@@ -4,17 +4,25 @@ Property analysis using OpenRouter API with Google Custom Search price data
 """
 import os
 import sys
-import json
-from datetime import datetime
 from dotenv import load_dotenv
 from openai import OpenAI
 
 # Import price oracle
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.services.priceOracle import get_market_valuation
+from src.utils.cli import read_payload, read_phase, write_result
+from src.utils.documentStore import load_documents
+from src.utils.documentArea import split_documented_area, area_mismatch
+from src.services.modelRouter import estimate_tokens, prescreen_documents, route_request, track_route
+from src.utils.llmStream import ProseVerdictScanner, stream_completion, strip_verdict_lines
+from src.services.duplicateIndex import check_documents, duplicate_rejection, duplicate_red_flag
+from src.utils.profiling import profile_request
+from src.utils import metrics
 
 load_dotenv()
 
+AGENT_NAME = 'openrouter'
+
 # Configure OpenAI client for OpenRouter
 client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
@@ -73,90 +81,49 @@ def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, doc
     
     return result
 
-def analyze_property(data):
-    """Analyze property using OpenRouter with direct API call and market price data"""
+def verify_documents(data):
+    """
+    Phase 1: document type and mandatory-field verification.
+    
+    Needs only the documents, so it can start before satellite data exists.
+    """
     try:
         api_key = os.getenv('OPENROUTER_API_KEY')
         
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY not configured")
         
-        # Extract data
-        satellite_data = data.get('satellite_data', {})
-        area_sqm = satellite_data.get('area_sqm', 200)
-        ndvi = satellite_data.get('ndvi', 0.5)
-        cloud_coverage = satellite_data.get('cloud_coverage', 5)
         document_count = data.get('document_count', 0)
-        latitude = data.get('latitude', 0)
-        longitude = data.get('longitude', 0)
-        location = data.get('location', f"{latitude},{longitude}")
         
-        # Fetch market price data from Google Custom Search
-        market_data = {}
-        try:
-            market_data = get_market_valuation(location, latitude, longitude, area_sqm)
-            if not market_data.get('error'):
-                print(f"✓ Market data: ${market_data.get('average_price', 0):,} avg, {market_data.get('price_count', 0)} sources", file=sys.stderr)
-        except Exception as e:
-            print(f"⚠️  Market price fetch failed: {e}", file=sys.stderr)
+        # Get document contents for analysis
+        documents = load_documents(data)
+        has_documents = len(documents) > 0
         
-        # Calculate valuation with market data influence
-        base_valuation = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
+        # Debug log to stderr
+        print(f"[Agent2 DEBUG] Received {len(documents)} documents", file=sys.stderr)
+        for i, document in enumerate(documents):
+            print(f"[Agent2 DEBUG] Doc {i+1}: {len(document)} chars, preview: {document.preview(100)}", file=sys.stderr)
         
-        # If we have market data, blend it with satellite-based valuation
-        final_valuation = base_valuation['valuation']
-        final_confidence = base_valuation['confidence']
+        # Deed text reused from an earlier submission is rejected without a model call
+        duplicates = check_documents((document.text for document in documents), data.get('request_id'), submission=data)
+        if duplicates['reject']:
+            verification = duplicate_rejection(duplicates)
+            verification['reasoning'] = verification['findings']
+            verification['agent'] = AGENT_NAME
+            return verification
         
-        if market_data.get('average_price') and not market_data.get('error'):
-            market_price = market_data.get('estimated_valuation', market_data.get('average_price', 0))
-            # Weighted average: 60% market data, 40% satellite data
-            if market_price > 0:
-                final_valuation = int(market_price * 0.6 + base_valuation['valuation'] * 0.4)
-                # Increase confidence if market data available
-                final_confidence = min(95, final_confidence + 10)
+        document_section = ""
+        if has_documents:
+            sections = ["\n\nACTUAL DOCUMENT CONTENT FOR VERIFICATION:\n"]
+            for i, document in enumerate(documents):
+                # Analyze FULL document text, not just first 800 chars
+                sections.append(f"\nDocument {i+1} (FULL TEXT - {len(document)} characters):\n{document.text}\n")
+            document_section = "".join(sections)
         
-        # Use OpenRouter API for reasoning
-        try:
-            # Get document contents for analysis
-            document_contents = data.get('document_contents', [])
-            has_documents = len(document_contents) > 0
-            
-            # Debug log to stderr
-            print(f"[Agent2 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-            for i, content in enumerate(document_contents):
-                print(f"[Agent2 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
-            
-            document_section = ""
-            if has_documents:
-                document_section = "\n\nACTUAL DOCUMENT CONTENT FOR VERIFICATION:\n"
-                for i, content in enumerate(document_contents):
-                    # Analyze FULL document text, not just first 800 chars
-                    document_section += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
-            
-            market_info = ""
-            if market_data.get('average_price') and not market_data.get('error'):
-                market_info = f"\n- Market Average: ${market_data.get('average_price', 0):,} ({market_data.get('price_count', 0)} sources)"
-            
-            response = client.chat.completions.create(
-                model="openai/gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a real estate valuation expert specialized in land document verification. You MUST analyze the actual document content provided and verify it matches standard land document templates. REJECT if mandatory fields are missing."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Property Analysis (STRICT Land Document Verification):
-
-SATELLITE DATA:
-- Area: {area_sqm} sqm
-- Vegetation Health (NDVI): {ndvi}
-- Cloud Coverage: {cloud_coverage}%
+        prompt = f"""Land Document Verification (STRICT):
 
 DOCUMENTATION:
 - Documents Submitted: {document_count}
-- Calculated Valuation: ${valuation_result['valuation']:,}
-- Confidence: {valuation_result['confidence']}%{market_info}
 {document_section}
 
 ⚠️ CRITICAL: STRICT LAND DOCUMENT TYPE VERIFICATION ⚠️
@@ -188,23 +155,152 @@ STEP 3: STRICT VALIDATION RULES
 - Missing total area → REJECT with score 0-20
 - Missing boundaries → REJECT with score 0-30
 - Contains placeholders (TODO, TBD, N/A) → REJECT with score 0
-- Area differs from satellite {area_sqm} sqm by >20% → Flag "Area mismatch >20%"
 - Document appears incomplete or fraudulent → REJECT with score 0-30
 
 PROVIDE DETAILED ANALYSIS:
 1. State clearly: Is this a land/property document? If NO → explain why it's being rejected
 2. List SPECIFIC fields found vs missing from the actual document content
-3. Compare documented area with satellite measurement ({area_sqm} sqm)
-4. Identify any red flags or inconsistencies
-5. Give clear verdict: ACCEPT or REJECT with specific reason
+3. Identify any red flags or inconsistencies
+4. Give clear verdict: ACCEPT or REJECT with specific reason
 
-Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the document content."""
+Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the document content.
+Start your answer with exactly these two lines:
+LAND DOCUMENT: YES  (or: LAND DOCUMENT: NO - <one-sentence reason>)
+AUTHENTICITY SCORE: <0-100>
+End with one final line exactly in the form "DOCUMENTED AREA: <total area with units as written in the document>" or "DOCUMENTED AREA: NONE"."""
+        
+        # Pick the model and completion budget for this request
+        screen = prescreen_documents(document.text for document in documents)
+        document_tokens = sum(estimate_tokens(len(document)) for document in documents)
+        route = route_request(
+            AGENT_NAME, estimate_tokens(prompt), screen['confidence'],
+            data.get('budget'), 'document_verification', document_tokens,
+            land_score=screen['land_score']
+        )
+        
+        # Streamed so a hard reject can stop the generation as soon as the verdict is in
+        with track_route(route):
+            completion = stream_completion(
+                client, 'openrouter', 'document_verification', AGENT_NAME, route.model,
+                [
+                    {
+                        "role": "system",
+                        "content": "You are a real estate valuation expert specialized in land document verification. You MUST analyze the actual document content provided and verify it matches standard land document templates. REJECT if mandatory fields are missing."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
                     }
-                ]
+                ],
+                ProseVerdictScanner(),
+                max_tokens=route.max_tokens,
+                stream_options={"include_usage": True}
             )
-            
-            reasoning = response.choices[0].message.content
-        except Exception as e:
+            route.record_usage(completion.usage, completion.completion_tokens)
+        
+        reasoning, documented_area_sqm = split_documented_area(strip_verdict_lines(completion.text))
+        verification = {
+            "reasoning": reasoning,
+            "documented_area_sqm": documented_area_sqm,
+            "model": route.model,
+            "agent": AGENT_NAME
+        }
+        verification.update(completion.verdict or {})
+        if completion.aborted:
+            reason = completion.fields.get('verdict_reason') or "document is not a land/property deed"
+            verification['reasoning'] = f"Rejected: {reason}"
+            verification['aborted_early'] = True
+        if duplicates['duplicate'] or duplicates['error']:
+            verification['reasoning'] += f" {duplicate_red_flag(duplicates)}."
+            verification['duplicate_matches'] = duplicates['matches']
+        return verification
+        
+    except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='documents').inc()
+        return {
+            "error": str(e),
+            "agent": AGENT_NAME
+        }
+
+def value_property(data, verification):
+    """
+    Phase 2: valuation and area reconciliation once satellite metrics are in.
+    
+    Blends the satellite-based valuation with market data and reconciles the
+    documented area from phase 1 against the satellite measurement locally.
+    """
+    try:
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not configured")
+        
+        if verification.get('error'):
+            raise ValueError(f"Document verification failed: {verification['error']}")
+        
+        # A duplicate submission or hard reject in phase 1 gets no valuation
+        if 'duplicate_of' in verification:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": verification['findings'],
+                "risk_factors": ["DUPLICATE DOCUMENT"],
+                "agent": AGENT_NAME
+            }
+        if verification.get('is_land_document') is False:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": verification.get('reasoning') or "Rejected: document is not a land/property deed",
+                "risk_factors": ["NOT A LAND DOCUMENT"],
+                "agent": AGENT_NAME
+            }
+        
+        # Extract data
+        satellite_data = data.get('satellite_data', {})
+        area_sqm = satellite_data.get('area_sqm', 200)
+        ndvi = satellite_data.get('ndvi', 0.5)
+        cloud_coverage = satellite_data.get('cloud_coverage', 5)
+        document_count = data.get('document_count', 0)
+        latitude = data.get('latitude', 0)
+        longitude = data.get('longitude', 0)
+        location = data.get('location', f"{latitude},{longitude}")
+        
+        # Fetch market price data (unless the caller already looked it up)
+        market_data = data.get('market_data') or {}
+        if not market_data:
+            try:
+                market_data = get_market_valuation(location, latitude, longitude, area_sqm)
+            except Exception as e:
+                print(f"⚠️  Market price fetch failed: {e}", file=sys.stderr)
+        if market_data and not market_data.get('error'):
+            print(f"✓ Market data: ${market_data.get('average_price', 0):,} avg, {market_data.get('price_count', 0)} sources", file=sys.stderr)
+        
+        # Calculate valuation with market data influence
+        base_valuation = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
+        
+        # If we have market data, blend it with satellite-based valuation
+        final_valuation = base_valuation['valuation']
+        final_confidence = base_valuation['confidence']
+        
+        if market_data.get('average_price') and not market_data.get('error'):
+            market_price = market_data.get('estimated_valuation', market_data.get('average_price', 0))
+            # Weighted average: 60% market data, 40% satellite data
+            if market_price > 0:
+                final_valuation = int(market_price * 0.6 + base_valuation['valuation'] * 0.4)
+                # Increase confidence if market data available
+                final_confidence = min(95, final_confidence + 10)
+        
+        # Compare documented area with the satellite measurement
+        documented_area = verification.get('documented_area_sqm')
+        mismatch = area_mismatch(documented_area, area_sqm)
+        
+        if verification.get('reasoning'):
+            reasoning = verification['reasoning']
+            if mismatch is not None:
+                reasoning += f" Area mismatch >20%: documented {documented_area:,.0f} sqm vs satellite {area_sqm:,.0f} sqm ({mismatch:.0%} difference)."
+        else:
+            metrics.FALLBACKS.labels(component=AGENT_NAME, reason='template_reasoning').inc()
             reasoning = f"Analysis based on {area_sqm} sqm property with NDVI {ndvi} and {document_count} documents. "
             if market_data.get('average_price'):
                 reasoning += f"Market data shows average price of ${market_data.get('average_price', 0):,}. "
@@ -218,9 +314,13 @@ Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the docume
                 "Cloud coverage impact" if cloud_coverage > 10 else None,
                 "Limited documentation" if document_count < 2 else None,
                 "Low vegetation index" if ndvi < 0.3 else None,
-                "No market data" if market_data.get('error') else None
+                "No market data" if market_data.get('error') else None,
+                "Area mismatch >20% with satellite data" if mismatch is not None else None,
+                "Near-duplicate of another parcel's submission" if any(
+                    not match.get('resubmission') for match in verification.get('duplicate_matches') or []
+                ) else None
             ],
-            "agent": "openrouter",
+            "agent": AGENT_NAME,
             "market_data": {
                 "has_data": not market_data.get('error'),
                 "average_price": market_data.get('average_price', 0),
@@ -234,17 +334,30 @@ Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the docume
         return result
         
     except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='valuation').inc()
         return {
             "error": str(e),
-            "agent": "openrouter"
+            "agent": AGENT_NAME
         }
 
+def analyze_property(data):
+    """Analyze property using OpenRouter with direct API call and market price data"""
+    verification = data.get('document_verification') or verify_documents(data)
+    return value_property(data, verification)
+
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    metrics.start_exporters()
+    
+    # Read input from a file, args or stdin
+    input_data = read_payload()
     
-    result = analyze_property(input_data)
-    print(json.dumps(result))
+    # --phase documents runs verification only; --phase valuation expects its output
+    # in the payload's "document_verification" field
+    # --profile (or "profile": true) writes a flamegraph profile (see src/utils/profiling.py)
+    phase = read_phase()
+    with profile_request(f"{AGENT_NAME}-{phase or 'analysis'}", input_data):
+        if phase == 'documents':
+            result = verify_documents(input_data)
+        else:
+            result = analyze_property(input_data)
+    write_result(result)
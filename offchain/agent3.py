@@ -4,13 +4,23 @@ Property analysis using OpenRouter with Llama 3.1
 """
 import os
 import sys
-import json
-from datetime import datetime
 from dotenv import load_dotenv
 from openai import OpenAI
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.cli import read_payload, read_phase, write_result
+from src.utils.documentStore import load_documents
+from src.utils.documentArea import split_documented_area, area_mismatch
+from src.services.modelRouter import estimate_tokens, prescreen_documents, route_request, track_route
+from src.utils.llmStream import ProseVerdictScanner, stream_completion, strip_verdict_lines
+from src.services.duplicateIndex import check_documents, duplicate_rejection, duplicate_red_flag
+from src.utils.profiling import profile_request
+from src.utils import metrics
+
 load_dotenv()
 
+AGENT_NAME = 'llama'
+
 # Configure OpenAI client for OpenRouter
 client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
@@ -63,62 +73,49 @@ def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, doc
         "confidence": max(55, min(95, confidence))
     }
 
-def analyze_property(data):
-    """Analyze property using OpenRouter with Llama 3.1"""
+def verify_documents(data):
+    """
+    Phase 1: document type and mandatory-field verification.
+    
+    Needs only the documents, so it can start before satellite data exists.
+    """
     try:
         api_key = os.getenv('OPENROUTER_API_KEY')
         
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY not configured")
         
-        # Extract data
-        satellite_data = data.get('satellite_data', {})
-        area_sqm = satellite_data.get('area_sqm', 200)
-        ndvi = satellite_data.get('ndvi', 0.5)
-        cloud_coverage = satellite_data.get('cloud_coverage', 5)
         document_count = data.get('document_count', 0)
         
-        # Calculate valuation directly
-        valuation_result = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
-        
         # Get document contents for analysis
-        document_contents = data.get('document_contents', [])
-        has_documents = len(document_contents) > 0
+        documents = load_documents(data)
+        has_documents = len(documents) > 0
         
         # Debug log to stderr
-        print(f"[Agent3 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-        for i, content in enumerate(document_contents):
-            print(f"[Agent3 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
+        print(f"[Agent3 DEBUG] Received {len(documents)} documents", file=sys.stderr)
+        for i, document in enumerate(documents):
+            print(f"[Agent3 DEBUG] Doc {i+1}: {len(document)} chars, preview: {document.preview(100)}", file=sys.stderr)
+        
+        # Deed text reused from an earlier submission is rejected without a model call
+        duplicates = check_documents((document.text for document in documents), data.get('request_id'), submission=data)
+        if duplicates['reject']:
+            verification = duplicate_rejection(duplicates)
+            verification['reasoning'] = verification['findings']
+            verification['agent'] = AGENT_NAME
+            return verification
         
         document_text = ""
         if has_documents:
-            document_text = "\n\nDOCUMENT CONTENT FOR VERIFICATION:\n"
-            for i, content in enumerate(document_contents):
+            sections = ["\n\nDOCUMENT CONTENT FOR VERIFICATION:\n"]
+            for i, document in enumerate(documents):
                 # Analyze FULL document text, not just first 800 chars
-                document_text += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
+                sections.append(f"\nDocument {i+1} (FULL TEXT - {len(document)} characters):\n{document.text}\n")
+            document_text = "".join(sections)
         
-        # Use OpenRouter API for reasoning with Llama 3.1
-        try:
-            response = client.chat.completions.create(
-                model="meta-llama/llama-3.1-8b-instruct:free",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a certified land surveyor and real estate expert specializing in land document verification. You MUST analyze actual document content and verify it contains all mandatory fields required for land documents. REJECT documents that don't meet standards."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""STRICT Land Document Verification & Property Authentication:
-
-SATELLITE MEASUREMENTS:
-- Measured Area: {area_sqm} sqm
-- Vegetation Index (NDVI): {ndvi}
-- Image Quality (Cloud Coverage): {cloud_coverage}%
+        prompt = f"""STRICT Land Document Verification & Property Authentication:
 
 SUBMITTED DOCUMENTATION:
 - Document Count: {document_count}
-- Preliminary Valuation: ${valuation_result['valuation']:,}
-- Data Confidence: {valuation_result['confidence']}%
 {document_text}
 
 ⚠️ CRITICAL: STRICT DOCUMENT TYPE VERIFICATION ⚠️
@@ -153,23 +150,128 @@ STEP 3: VALIDATION & REJECTION RULES
 ✗ Missing total area → Score: 0-20, Reason: "Property size not documented"
 ✗ Missing boundaries → Score: 0-25, Reason: "Boundary description missing"
 ✗ Contains placeholders (TODO, TBD, N/A, etc.) → Score: 0, Reason: "Incomplete document"
-✗ Area mismatch >20% from satellite ({area_sqm} sqm) → Flag: "Area discrepancy detected"
 ✗ Document appears forged or fraudulent → Score: 0-10, Reason: "Suspicious document"
 
 AUTHENTICATION ANALYSIS REQUIRED:
 1. Verify document type is valid land document (if not → REJECT)
 2. List which mandatory fields ARE present from actual content
 3. List which mandatory fields are MISSING
-4. Compare documented area with satellite measurement
-5. State authenticity verdict: AUTHENTIC or REJECTED with specific reason
+4. State authenticity verdict: AUTHENTIC or REJECTED with specific reason
 
-Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, listing exactly which fields were found or missing from the document content above."""
+Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, listing exactly which fields were found or missing from the document content above.
+Start your answer with exactly these two lines:
+LAND DOCUMENT: YES  (or: LAND DOCUMENT: NO - <one-sentence reason>)
+AUTHENTICITY SCORE: <0-100>
+End with one final line exactly in the form "DOCUMENTED AREA: <total area with units as written in the document>" or "DOCUMENTED AREA: NONE"."""
+        
+        # Use OpenRouter API for reasoning with Llama 3.1
+        # Pick the model and completion budget for this request
+        screen = prescreen_documents(document.text for document in documents)
+        document_tokens = sum(estimate_tokens(len(document)) for document in documents)
+        route = route_request(
+            AGENT_NAME, estimate_tokens(prompt), screen['confidence'],
+            data.get('budget'), 'document_verification', document_tokens,
+            land_score=screen['land_score']
+        )
+        
+        # Streamed so a hard reject can stop the generation as soon as the verdict is in
+        with track_route(route):
+            completion = stream_completion(
+                client, 'openrouter', 'document_verification', AGENT_NAME, route.model,
+                [
+                    {
+                        "role": "system",
+                        "content": "You are a certified land surveyor and real estate expert specializing in land document verification. You MUST analyze actual document content and verify it contains all mandatory fields required for land documents. REJECT documents that don't meet standards."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
                     }
-                ]
+                ],
+                ProseVerdictScanner(),
+                max_tokens=route.max_tokens,
+                stream_options={"include_usage": True}
             )
-            
-            reasoning = response.choices[0].message.content
-        except Exception as e:
+            route.record_usage(completion.usage, completion.completion_tokens)
+        
+        reasoning, documented_area_sqm = split_documented_area(strip_verdict_lines(completion.text))
+        verification = {
+            "reasoning": reasoning,
+            "documented_area_sqm": documented_area_sqm,
+            "model": route.model,
+            "agent": AGENT_NAME
+        }
+        verification.update(completion.verdict or {})
+        if completion.aborted:
+            reason = completion.fields.get('verdict_reason') or "document is not a land/property deed"
+            verification['reasoning'] = f"Rejected: {reason}"
+            verification['aborted_early'] = True
+        if duplicates['duplicate'] or duplicates['error']:
+            verification['reasoning'] += f" {duplicate_red_flag(duplicates)}."
+            verification['duplicate_matches'] = duplicates['matches']
+        return verification
+        
+    except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='documents').inc()
+        return {
+            "error": str(e),
+            "agent": AGENT_NAME
+        }
+
+def value_property(data, verification):
+    """
+    Phase 2: valuation and area reconciliation once satellite metrics are in.
+    
+    Valuation is computed locally, and the documented area from phase 1 is
+    compared with the satellite measurement without another model call.
+    """
+    try:
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not configured")
+        
+        if verification.get('error'):
+            raise ValueError(f"Document verification failed: {verification['error']}")
+        
+        # A duplicate submission or hard reject in phase 1 gets no valuation
+        if 'duplicate_of' in verification:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": verification['findings'],
+                "risk_factors": ["DUPLICATE DOCUMENT"],
+                "agent": AGENT_NAME
+            }
+        if verification.get('is_land_document') is False:
+            return {
+                "valuation": 0,
+                "confidence": 0,
+                "reasoning": verification.get('reasoning') or "Rejected: document is not a land/property deed",
+                "risk_factors": ["NOT A LAND DOCUMENT"],
+                "agent": AGENT_NAME
+            }
+        
+        # Extract data
+        satellite_data = data.get('satellite_data', {})
+        area_sqm = satellite_data.get('area_sqm', 200)
+        ndvi = satellite_data.get('ndvi', 0.5)
+        cloud_coverage = satellite_data.get('cloud_coverage', 5)
+        document_count = data.get('document_count', 0)
+        
+        # Calculate valuation directly
+        valuation_result = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
+        
+        # Compare documented area with the satellite measurement
+        documented_area = verification.get('documented_area_sqm')
+        mismatch = area_mismatch(documented_area, area_sqm)
+        
+        if verification.get('reasoning'):
+            reasoning = verification['reasoning']
+            if mismatch is not None:
+                reasoning += f" Area discrepancy detected: documented {documented_area:,.0f} sqm vs satellite {area_sqm:,.0f} sqm ({mismatch:.0%} difference)."
+        else:
+            metrics.FALLBACKS.labels(component=AGENT_NAME, reason='template_reasoning').inc()
             reasoning = f"Analysis based on {area_sqm} sqm property with NDVI {ndvi} and {document_count} documents. Vegetation health and area indicate {'strong' if ndvi > 0.6 else 'moderate' if ndvi > 0.4 else 'fair'} land quality with documentation {'complete' if document_count >= 2 else 'limited'}."
         
         result = {
@@ -179,9 +281,13 @@ Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, l
             "risk_factors": [
                 "High cloud coverage" if cloud_coverage > 15 else None,
                 "Insufficient documentation" if document_count < 2 else None,
-                "Poor vegetation health" if ndvi < 0.25 else None
+                "Poor vegetation health" if ndvi < 0.25 else None,
+                "Area discrepancy detected" if mismatch is not None else None,
+                "Near-duplicate of another parcel's submission" if any(
+                    not match.get('resubmission') for match in verification.get('duplicate_matches') or []
+                ) else None
             ],
-            "agent": "llama"
+            "agent": AGENT_NAME
         }
         
         # Filter out None values from risk_factors
@@ -190,17 +296,30 @@ Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, l
         return result
         
     except Exception as e:
+        metrics.AGENT_ERRORS.labels(agent=AGENT_NAME, phase='valuation').inc()
         return {
             "error": str(e),
-            "agent": "llama"
+            "agent": AGENT_NAME
         }
 
+def analyze_property(data):
+    """Analyze property using OpenRouter with Llama 3.1"""
+    verification = data.get('document_verification') or verify_documents(data)
+    return value_property(data, verification)
+
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    metrics.start_exporters()
+    
+    # Read input from a file, args or stdin
+    input_data = read_payload()
     
-    result = analyze_property(input_data)
-    print(json.dumps(result))
+    # --phase documents runs verification only; --phase valuation expects its output
+    # in the payload's "document_verification" field
+    # --profile (or "profile": true) writes a flamegraph profile (see src/utils/profiling.py)
+    phase = read_phase()
+    with profile_request(f"{AGENT_NAME}-{phase or 'analysis'}", input_data):
+        if phase == 'documents':
+            result = verify_documents(input_data)
+        else:
+            result = analyze_property(input_data)
+    write_result(result)
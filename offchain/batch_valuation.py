@@ -0,0 +1,271 @@
+"""
+Batch Valuation Driver
+Revalues a portfolio of parcels with bounded concurrency, incremental output and resume
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services.analysisPipeline import run_property_analysis, stage_queues
+from src.services.comparablesIndex import record_valuation
+from src.utils.jobQueue import StageQueues
+from src.utils import metrics
+
+load_dotenv()
+
+PROGRESS_INTERVAL = 30  # seconds between throughput reports
+
+def _parcel_id(record: Dict, row_number: int) -> str:
+    for key in ('parcel_id', 'id', 'request_id'):
+        if record.get(key):
+            return str(record[key])
+    return f"row-{row_number}"
+
+def _parse_parcel(record: Dict, row_number: int) -> Dict:
+    """Normalise one input row, raising ValueError when it cannot be valued"""
+    if not isinstance(record, dict):
+        raise ValueError('row is not an object')
+    
+    parcel = dict(record)
+    parcel['parcel_id'] = _parcel_id(record, row_number)
+    try:
+        parcel['latitude'] = float(record['latitude'])
+        parcel['longitude'] = float(record['longitude'])
+    except KeyError as e:
+        raise ValueError(f"missing {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError('latitude/longitude must be numbers')
+    if not (-90 <= parcel['latitude'] <= 90 and -180 <= parcel['longitude'] <= 180):
+        raise ValueError('latitude/longitude out of range')
+    
+    refs = parcel.get('document_refs') or []
+    if isinstance(refs, str):
+        refs = [ref.strip() for ref in refs.split(';') if ref.strip()]
+    parcel['document_refs'] = refs
+    
+    # Inline text must already be a list; a CSV cell cannot say where one deed ends
+    contents = parcel.get('document_contents') or []
+    if not isinstance(contents, list):
+        raise ValueError('document_contents must be a list of texts (use document_refs in CSV)')
+    parcel['document_contents'] = contents
+    
+    if not parcel.get('document_count'):
+        parcel['document_count'] = len(refs) + len(contents)
+    try:
+        parcel['document_count'] = int(parcel['document_count'])
+    except (TypeError, ValueError):
+        raise ValueError('document_count must be an integer')
+    parcel.setdefault('location', f"{parcel['latitude']},{parcel['longitude']}")
+    parcel.setdefault('request_id', parcel['parcel_id'])
+    return parcel
+
+def read_parcels(input_path: str) -> Iterator[Dict]:
+    """
+    Stream parcels from a JSONL or CSV file.
+    
+    Each parcel needs latitude and longitude; parcel_id/id, location,
+    document_refs (list, or ';'-separated in CSV), document_contents (list,
+    JSONL only) and document_count are optional. A row that cannot be parsed
+    is yielded as {'parcel_id', 'row', 'input_error'} instead of stopping the batch.
+    """
+    with open(input_path, 'r', encoding='utf-8', newline='') as f:
+        is_csv = input_path.lower().endswith('.csv')
+        rows = csv.DictReader(f) if is_csv else (line for line in f if line.strip())
+        
+        for row_number, row in enumerate(rows, start=1):
+            record = {}
+            try:
+                record = row if is_csv else json.loads(row)
+                parcel = _parse_parcel(record, row_number)
+            except ValueError as e:
+                parcel_id = _parcel_id(record if isinstance(record, dict) else {}, row_number)
+                parcel = {'parcel_id': parcel_id, 'row': row_number, 'input_error': str(e)}
+            yield parcel
+
+def load_completed(output_path: str) -> set:
+    """Parcel ids already finished successfully in a previous run (the checkpoint)"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash - that parcel is simply redone
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record['parcel_id'])
+    return completed
+
+def consensus_valuation(agent_results: List[Dict]) -> Optional[Dict]:
+    """Confidence-weighted valuation across agents (same rule as consensus.ts)"""
+    valid = [r for r in agent_results if not r.get('error') and r.get('confidence', 0) > 0]
+    if len(valid) < 2:
+        return None
+    
+    total_weight = sum(r['confidence'] for r in valid)
+    weighted = sum(r['valuation'] * r['confidence'] for r in valid) / total_weight
+    return {
+        'valuation': int(weighted),
+        'confidence': round(total_weight / len(valid)),
+        'agent_count': len(valid)
+    }
+
+class ProgressReporter:
+    """Tracks finished parcels and prints throughput to stderr"""
+    
+    def __init__(self):
+        self.skipped = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+    
+    @property
+    def parcels_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.succeeded + self.failed) / elapsed * 60 if elapsed > 0 else 0.0
+    
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self._last_report >= PROGRESS_INTERVAL:
+                self._last_report = now
+                self.report()
+    
+    def report(self):
+        print(f"📊 {self.succeeded} ok, {self.failed} failed, {self.skipped} resumed - "
+              f"{self.parcels_per_minute:.1f} parcels/min", file=sys.stderr)
+    
+    def summary(self) -> Dict:
+        return {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'elapsed_seconds': round(time.monotonic() - self.started, 1),
+            'parcels_per_minute': round(self.parcels_per_minute, 2)
+        }
+
+def value_parcel(parcel: Dict, queues: StageQueues, record: bool) -> Dict:
+    """Run the full pipeline for one parcel and build its output record"""
+    started = time.monotonic()
+    try:
+        analysis = run_property_analysis(parcel, queues=queues)
+        consensus = consensus_valuation(analysis['agents'])
+        satellite_data = analysis['satellite_data'] or {}
+        
+        # Feed the comparables index so later parcels nearby price instantly
+        if consensus and record:
+            record_valuation(
+                parcel['latitude'], parcel['longitude'], consensus['valuation'],
+                satellite_data.get('area_sqm', 0), satellite_data.get('ndvi'),
+                parcel_id=parcel['parcel_id']
+            )
+        
+        return {
+            'parcel_id': parcel['parcel_id'],
+            'status': 'ok' if consensus else 'no_consensus',
+            'consensus': consensus,
+            'satellite_data': satellite_data,
+            'market_data': analysis['market_data'],
+            'agents': analysis['agents'],
+            'duration_seconds': round(time.monotonic() - started, 2)
+        }
+    except Exception as e:
+        return {
+            'parcel_id': parcel['parcel_id'],
+            'status': 'error',
+            'error': str(e),
+            'duration_seconds': round(time.monotonic() - started, 2)
+        }
+
+def run_batch(input_path: str, output_path: str, parcel_concurrency: int = 4,
+              satellite_concurrency: int = 2, market_concurrency: int = 4,
+              agent_concurrency: int = 6, record: bool = True) -> Dict:
+    """
+    Value every parcel in input_path, appending one JSON line per parcel to output_path.
+    
+    The output file doubles as the checkpoint: parcels with an "ok" record are
+    skipped on the next run, everything else (failed, missing, torn) is redone.
+    """
+    completed = load_completed(output_path)
+    progress = ProgressReporter()
+    queues = stage_queues(satellite_concurrency, market_concurrency, agent_concurrency)
+    write_lock = threading.Lock()
+    
+    if completed:
+        print(f"Resuming: {len(completed)} parcels already done", file=sys.stderr)
+    
+    # Parcels run on one pool; their satellite/market/agent calls go through the
+    # stage queues, so a parcel waiting on its stages never starves the stages themselves
+    with ThreadPoolExecutor(max_workers=parcel_concurrency) as parcels_pool, \
+         open(output_path, 'a', encoding='utf-8') as output:
+        
+        def write(result: Dict):
+            with write_lock:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+                os.fsync(output.fileno())
+            progress.record(result['status'] == 'ok')
+        
+        pending = set()
+        for parcel in read_parcels(input_path):
+            if parcel['parcel_id'] in completed:
+                progress.skipped += 1
+                continue
+            if 'input_error' in parcel:
+                write({
+                    'parcel_id': parcel['parcel_id'],
+                    'status': 'error',
+                    'error': f"Invalid input row {parcel['row']}: {parcel['input_error']}",
+                    'duration_seconds': 0
+                })
+                continue
+            
+            # Keep a bounded window of submitted parcels instead of queueing the whole file
+            while len(pending) >= parcel_concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            
+            pending.add(parcels_pool.submit(value_parcel, parcel, queues, record))
+        
+        for future in pending:
+            write(future.result())
+    
+    queues.shutdown()
+    progress.report()
+    return progress.summary()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Batch portfolio valuation')
+    parser.add_argument('input', help='Parcels as JSONL or CSV')
+    parser.add_argument('output', help='Results JSONL (appended; also the resume checkpoint)')
+    parser.add_argument('--parcels', type=int, default=4, help='Parcels in flight')
+    parser.add_argument('--satellite-concurrency', type=int, default=2, help='Concurrent Earth Engine fetches')
+    parser.add_argument('--market-concurrency', type=int, default=4, help='Concurrent market lookups')
+    parser.add_argument('--agent-concurrency', type=int, default=6, help='Concurrent agent LLM calls')
+    parser.add_argument('--no-record', action='store_true', help="Don't add results to the comparables index")
+    args = parser.parse_args()
+    metrics.start_exporters()
+    
+    summary = run_batch(
+        args.input, args.output, args.parcels,
+        args.satellite_concurrency, args.market_concurrency, args.agent_concurrency,
+        record=not args.no_record
+    )
+    print(json.dumps(summary))
@@ -49,6 +49,8 @@ const submitter_1 = require("./submitter");
 const path_1 = __importDefault(require("path"));
 const pdfParse = __importStar(require("pdf-parse"));
 const ocrService_1 = require("./utils/ocrService");
+const documentStore_1 = require("./utils/documentStore");
+const pipelineClient_1 = require("./services/pipelineClient");
 const fs_1 = __importDefault(require("fs"));
 const form_data_1 = __importDefault(require("form-data"));
 const axios_1 = __importDefault(require("axios"));
@@ -73,143 +75,176 @@ async function validateLandDocument(documentHash) {
     }
 }
 /**
- * Fetch document content from IPFS for AI analysis
+ * Fetch document content from IPFS for AI analysis with retry logic
  */
 async function fetchDocumentContent(documentHash) {
-    try {
-        const cleanHash = documentHash.replace('ipfs://', '');
-        const response = await fetch(`https://gateway.pinata.cloud/ipfs/${cleanHash}`);
-        if (!response.ok) {
-            throw new Error('Document not accessible');
-        }
-        // Try to get text content (works for JSON, text files)
-        const contentType = response.headers.get('content-type') || '';
-        // First, try to parse as JSON (our new document format)
-        if (contentType.includes('json') || contentType.includes('application/json')) {
-            const json = await response.json();
-            // If it's our structured document JSON with original_file_cid, ALWAYS fetch and OCR the original
-            if (json.document_type === 'land_document' && json.original_file_cid) {
-                logger_1.logger.info(`   📄 Found structured document JSON: ${json.file_name}`);
-                logger_1.logger.info(`   🔄 Fetching original file for OCR processing...`);
-                // Fetch the original file using the stored CID
-                const originalCid = json.original_file_cid.replace('ipfs://', '');
-                logger_1.logger.info(`   📥 Fetching original file: ${originalCid.substring(0, 20)}...`);
-                const originalResponse = await fetch(`https://gateway.pinata.cloud/ipfs/${originalCid}`);
-                if (!originalResponse.ok) {
-                    logger_1.logger.warn(`   ⚠️  Could not fetch original file from IPFS`);
-                    return JSON.stringify(json, null, 2);
-                }
-                const originalBuffer = Buffer.from(await originalResponse.arrayBuffer());
-                const originalContentType = originalResponse.headers.get('content-type') || '';
-                // Process the original file with OCR
-                if (originalContentType.includes('pdf') || json.file_name.toLowerCase().endsWith('.pdf')) {
-                    logger_1.logger.info(`   📄 Processing original PDF with OCR.space API...`);
-                    try {
-                        // First try extracting text layer
-                        const pdfData = await pdfParse(originalBuffer);
-                        const pdfText = pdfData.text.trim();
-                        if (pdfText.length > 100) {
-                            logger_1.logger.info(`   ✅ Extracted ${pdfText.length} characters from PDF text layer`);
-                            return pdfText;
-                        }
-                        else {
-                            // PDF has no text layer or minimal text - use OCR
-                            logger_1.logger.info(`   📄 PDF has minimal text, using OCR.space API...`);
-                            const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, "application/pdf");
-                            if (ocrText && ocrText.length > 0) {
-                                logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from PDF`);
-                                return ocrText;
+    const IPFS_GATEWAYS = [
+        'https://gateway.pinata.cloud/ipfs/',
+        'https://ipfs.io/ipfs/',
+        'https://cloudflare-ipfs.com/ipfs/'
+    ];
+    const cleanHash = documentHash.replace('ipfs://', '');
+    for (const gateway of IPFS_GATEWAYS) {
+        try {
+            const url = `${gateway}${cleanHash}`;
+            logger_1.logger.info(`   📥 Attempting to fetch from: ${gateway.replace('https://', '')}`);
+            const controller = new AbortController();
+            const timeout = setTimeout(() => controller.abort(), 30000);
+            const response = await fetch(url, {
+                signal: controller.signal
+            });
+            clearTimeout(timeout);
+            if (!response.ok) {
+                logger_1.logger.warn(`   ⚠️  Gateway returned ${response.status}, trying next gateway...`);
+                continue;
+            }
+            // Try to get text content (works for JSON, text files)
+            const contentType = response.headers.get('content-type') || '';
+            // First, try to parse as JSON (our new document format)
+            if (contentType.includes('json') || contentType.includes('application/json')) {
+                const json = await response.json();
+                // If it's our structured document JSON with original_file_cid, ALWAYS fetch and OCR the original
+                if (json.document_type === 'land_document' && json.original_file_cid) {
+                    logger_1.logger.info(`   📄 Found structured document JSON: ${json.file_name}`);
+                    logger_1.logger.info(`   🔄 Fetching original file for OCR processing...`);
+                    // Fetch the original file using the stored CID
+                    const originalCid = json.original_file_cid.replace('ipfs://', '');
+                    logger_1.logger.info(`   📥 Fetching original file: ${originalCid.substring(0, 20)}...`);
+                    // Try gateways for original file too
+                    for (const origGateway of IPFS_GATEWAYS) {
+                        try {
+                            const origController = new AbortController();
+                            const origTimeout = setTimeout(() => origController.abort(), 30000);
+                            const originalResponse = await fetch(`${origGateway}${originalCid}`, {
+                                signal: origController.signal
+                            });
+                            clearTimeout(origTimeout);
+                            if (!originalResponse.ok) {
+                                logger_1.logger.warn(`   ⚠️  Original file gateway ${origGateway} returned ${originalResponse.status}`);
+                                continue;
                             }
+                            const originalBuffer = Buffer.from(await originalResponse.arrayBuffer());
+                            const originalContentType = originalResponse.headers.get('content-type') || '';
+                            // Process the original file with OCR
+                            if (originalContentType.includes('pdf') || json.file_name.toLowerCase().endsWith('.pdf')) {
+                                logger_1.logger.info(`   📄 Processing original PDF with OCR.space API...`);
+                                try {
+                                    // First try extracting text layer
+                                    const pdfData = await pdfParse(originalBuffer);
+                                    const pdfText = pdfData.text.trim();
+                                    if (pdfText.length > 100) {
+                                        logger_1.logger.info(`   ✅ Extracted ${pdfText.length} characters from PDF text layer`);
+                                        return pdfText;
+                                    }
+                                    else {
+                                        // PDF has no text layer or minimal text - use OCR
+                                        logger_1.logger.info(`   📄 PDF has minimal text, using OCR.space API...`);
+                                        const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, "application/pdf");
+                                        if (ocrText && ocrText.length > 0) {
+                                            logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from PDF`);
+                                            return ocrText;
+                                        }
+                                    }
+                                }
+                                catch (pdfErr) {
+                                    logger_1.logger.warn(`   ⚠️  PDF parsing failed, using OCR: ${pdfErr}`);
+                                    const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, "application/pdf");
+                                    if (ocrText && ocrText.length > 0) {
+                                        logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters`);
+                                        return ocrText;
+                                    }
+                                }
+                            }
+                            else if (originalContentType.includes('image')) {
+                                logger_1.logger.info(`   🖼️  Processing original image with OCR...`);
+                                const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, originalContentType);
+                                if (ocrText && ocrText.length > 0) {
+                                    logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from image`);
+                                    return ocrText;
+                                }
+                            }
+                            logger_1.logger.warn(`   ⚠️  Could not extract text from original file, using JSON metadata`);
+                            return JSON.stringify(json, null, 2);
                         }
-                    }
-                    catch (pdfErr) {
-                        logger_1.logger.warn(`   ⚠️  PDF parsing failed, using OCR: ${pdfErr}`);
-                        const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, "application/pdf");
-                        if (ocrText && ocrText.length > 0) {
-                            logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters`);
-                            return ocrText;
+                        catch (fetchErr) {
+                            logger_1.logger.warn(`   ⚠️  Failed to fetch original from ${origGateway}: ${fetchErr}`);
                         }
                     }
+                    // If all gateways failed for original file, return JSON
+                    logger_1.logger.warn(`   ⚠️  Could not fetch original file from any gateway`);
+                    return JSON.stringify(json, null, 2);
                 }
-                else if (originalContentType.includes('image')) {
-                    logger_1.logger.info(`   🖼️  Processing original image with OCR...`);
-                    const ocrText = await (0, ocrService_1.extractTextWithOCR)(originalBuffer, json.file_name, originalContentType);
-                    if (ocrText && ocrText.length > 0) {
-                        logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from image`);
-                        return ocrText;
-                    }
+                // If it's metadata JSON from frontend upload (no document_type field)
+                if (json.files && json.files.documents && json.files.documents.length > 0) {
+                    logger_1.logger.info(`   📄 Found frontend metadata JSON with ${json.files.documents.length} document(s)`);
+                    logger_1.logger.info(`   🔄 Fetching first document CID for processing...`);
+                    // Recursively fetch the first document
+                    const firstDocCid = json.files.documents[0].replace('ipfs://', '');
+                    return await fetchDocumentContent(`ipfs://${firstDocCid}`);
                 }
-                logger_1.logger.warn(`   ⚠️  Could not extract text from original file, using JSON metadata`);
+                // Otherwise return the whole JSON
                 return JSON.stringify(json, null, 2);
             }
-            // If it's metadata JSON from frontend upload (no document_type field)
-            if (json.files && json.files.documents && json.files.documents.length > 0) {
-                logger_1.logger.info(`   📄 Found frontend metadata JSON with ${json.files.documents.length} document(s)`);
-                logger_1.logger.info(`   🔄 Fetching first document CID for processing...`);
-                // Recursively fetch the first document
-                const firstDocCid = json.files.documents[0].replace('ipfs://', '');
-                return await fetchDocumentContent(`ipfs://${firstDocCid}`);
-            }
-            // Otherwise return the whole JSON
-            return JSON.stringify(json, null, 2);
-        }
-        else if (contentType.includes('text')) {
-            return await response.text();
-        }
-        else if (contentType.includes('image/')) {
-            // Handle images with OCR
-            logger_1.logger.info(`   📄 Processing image with OCR: ${cleanHash.substring(0, 20)}...`);
-            const arrayBuffer = await response.arrayBuffer();
-            const buffer = Buffer.from(arrayBuffer);
-            const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
-            if (ocrText.length > 0) {
-                return ocrText;
+            else if (contentType.includes('text')) {
+                return await response.text();
             }
-            else {
-                return `Image document (${cleanHash}) - No text extracted via OCR`;
-            }
-        }
-        else if (contentType.includes('pdf') || cleanHash.toLowerCase().endsWith('.pdf')) {
-            // Parse PDF to extract text (legacy support for direct PDF uploads)
-            logger_1.logger.info(`   📄 Parsing PDF: ${cleanHash.substring(0, 20)}...`);
-            const arrayBuffer = await response.arrayBuffer();
-            const buffer = Buffer.from(arrayBuffer);
-            try {
-                const pdfData = await pdfParse(buffer);
-                const text = pdfData.text.trim();
-                if (text.length > 50) {
-                    logger_1.logger.info(`   ✅ Extracted ${text.length} characters from PDF text layer`);
-                    return text;
+            else if (contentType.includes('image/')) {
+                // Handle images with OCR
+                logger_1.logger.info(`   📄 Processing image with OCR: ${cleanHash.substring(0, 20)}...`);
+                const arrayBuffer = await response.arrayBuffer();
+                const buffer = Buffer.from(arrayBuffer);
+                const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
+                if (ocrText.length > 0) {
+                    return ocrText;
                 }
                 else {
-                    // Try OCR on scanned PDF
-                    logger_1.logger.info(`   📄 PDF appears scanned, attempting OCR...`);
-                    const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
-                    if (ocrText.length > 0) {
-                        logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from scanned PDF`);
-                        return ocrText;
+                    return `Image document (${cleanHash}) - No text extracted via OCR`;
+                }
+            }
+            else if (contentType.includes('pdf') || cleanHash.toLowerCase().endsWith('.pdf')) {
+                // Parse PDF to extract text (legacy support for direct PDF uploads)
+                logger_1.logger.info(`   📄 Parsing PDF: ${cleanHash.substring(0, 20)}...`);
+                const arrayBuffer = await response.arrayBuffer();
+                const buffer = Buffer.from(arrayBuffer);
+                try {
+                    const pdfData = await pdfParse(buffer);
+                    const text = pdfData.text.trim();
+                    if (text.length > 50) {
+                        logger_1.logger.info(`   ✅ Extracted ${text.length} characters from PDF text layer`);
+                        return text;
                     }
                     else {
-                        logger_1.logger.warn(`   ⚠️  PDF appears to be empty or image-based with no OCR text`);
-                        return text || `PDF document (${cleanHash}) - No text content extracted`;
+                        // Try OCR on scanned PDF
+                        logger_1.logger.info(`   📄 PDF appears scanned, attempting OCR...`);
+                        const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
+                        if (ocrText.length > 0) {
+                            logger_1.logger.info(`   ✅ OCR extracted ${ocrText.length} characters from scanned PDF`);
+                            return ocrText;
+                        }
+                        else {
+                            logger_1.logger.warn(`   ⚠️  PDF appears to be empty or image-based with no OCR text`);
+                            return text || `PDF document (${cleanHash}) - No text content extracted`;
+                        }
                     }
                 }
+                catch (pdfError) {
+                    logger_1.logger.warn(`   ⚠️  Failed to parse PDF, trying OCR: ${pdfError}`);
+                    const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
+                    return ocrText || `PDF document (${cleanHash}) - Failed to extract text`;
+                }
             }
-            catch (pdfError) {
-                logger_1.logger.warn(`   ⚠️  Failed to parse PDF, trying OCR: ${pdfError}`);
-                const ocrText = await (0, ocrService_1.extractTextWithOCR)(buffer, "document.pdf", contentType);
-                return ocrText || `PDF document (${cleanHash}) - Failed to extract text`;
+            else {
+                // For other binary files, return metadata only
+                return `Binary document (${contentType}) - ${cleanHash}`;
             }
         }
-        else {
-            // For other binary files, return metadata only
-            return `Binary document (${contentType}) - ${cleanHash}`;
+        catch (fetchErr) {
+            logger_1.logger.warn(`   ⚠️  Error fetching from ${gateway}: ${fetchErr}`);
         }
     }
-    catch (error) {
-        logger_1.logger.warn(`⚠️  Could not fetch document content: ${error}`);
-        return 'Document content not available';
-    }
+    // All gateways failed
+    logger_1.logger.error(`⚠️  Could not fetch document content from any gateway: ${cleanHash}`);
+    return 'Document content not available';
 }
 /**
  * Process a verification request through the AI pipeline
@@ -247,6 +282,10 @@ async function processVerificationRequest(request) {
         const satelliteData = await fetchSatelliteData(request.latitude, request.longitude);
         logger_1.logger.info(`✅ Satellite data: ${satelliteData.area_sqm} sqm, NDVI ${satelliteData.ndvi}`);
         logger_1.logger.info(`   Cloud coverage: ${satelliteData.cloud_coverage}%, Resolution: ${satelliteData.resolution_meters}m\n`);
+        // Step 1.4: Pin the tile pyramids (tiles mode) as one IPFS directory
+        if (satelliteData.tiles_dir) {
+            await pinTilePyramids(satelliteData, request.requestId);
+        }
         // Step 1.5: Upload satellite images to IPFS if available
         if (satelliteData.rgb_image_path || satelliteData.ndvi_image_path || satelliteData.cir_image_path || satelliteData.true_color_image_path) {
             logger_1.logger.info('📸 Step 1.5: Uploading satellite images to IPFS (Ultra High Resolution - 2048x2048)...');
@@ -256,7 +295,7 @@ async function processVerificationRequest(request) {
                     const rgbFormData = new form_data_1.default();
                     rgbFormData.append('file', fs_1.default.createReadStream(satelliteData.rgb_image_path));
                     rgbFormData.append('pinataMetadata', JSON.stringify({
-                        name: `satellite_rgb_${request.requestId}.png`
+                        name: `satellite_rgb_${request.requestId}${path_1.default.extname(satelliteData.rgb_image_path) || '.png'}`
                     }));
                     const rgbResponse = await axios_1.default.post('https://api.pinata.cloud/pinning/pinFileToIPFS', rgbFormData, {
                         headers: {
@@ -274,7 +313,7 @@ async function processVerificationRequest(request) {
                     const ndviFormData = new form_data_1.default();
                     ndviFormData.append('file', fs_1.default.createReadStream(satelliteData.ndvi_image_path));
                     ndviFormData.append('pinataMetadata', JSON.stringify({
-                        name: `satellite_ndvi_${request.requestId}.png`
+                        name: `satellite_ndvi_${request.requestId}${path_1.default.extname(satelliteData.ndvi_image_path) || '.png'}`
                     }));
                     const ndviResponse = await axios_1.default.post('https://api.pinata.cloud/pinning/pinFileToIPFS', ndviFormData, {
                         headers: {
@@ -292,7 +331,7 @@ async function processVerificationRequest(request) {
                     const cirFormData = new form_data_1.default();
                     cirFormData.append('file', fs_1.default.createReadStream(satelliteData.cir_image_path));
                     cirFormData.append('pinataMetadata', JSON.stringify({
-                        name: `satellite_cir_${request.requestId}.png`
+                        name: `satellite_cir_${request.requestId}${path_1.default.extname(satelliteData.cir_image_path) || '.png'}`
                     }));
                     const cirResponse = await axios_1.default.post('https://api.pinata.cloud/pinning/pinFileToIPFS', cirFormData, {
                         headers: {
@@ -310,7 +349,7 @@ async function processVerificationRequest(request) {
                     const trueColorFormData = new form_data_1.default();
                     trueColorFormData.append('file', fs_1.default.createReadStream(satelliteData.true_color_image_path));
                     trueColorFormData.append('pinataMetadata', JSON.stringify({
-                        name: `satellite_true_color_${request.requestId}.png`
+                        name: `satellite_true_color_${request.requestId}${path_1.default.extname(satelliteData.true_color_image_path) || '.png'}`
                     }));
                     const trueColorResponse = await axios_1.default.post('https://api.pinata.cloud/pinning/pinFileToIPFS', trueColorFormData, {
                         headers: {
@@ -383,24 +422,42 @@ async function processVerificationRequest(request) {
                 logger_1.logger.warn('   ⚠️  Continuing verification without satellite images in IPFS');
             }
         }
-        // Step 2: Prepare analysis package with document content
+        // Remove the local tile pyramids (pinned above, or not needed)
+        if (satelliteData.tiles_dir) {
+            try {
+                fs_1.default.rmSync(satelliteData.tiles_dir, { recursive: true, force: true });
+                logger_1.logger.info(`   🗑️  Cleaned up temp tiles directory\n`);
+            }
+            catch (cleanupError) {
+                logger_1.logger.warn(`   ⚠️  Could not delete temp tiles directory: ${cleanupError}`);
+            }
+            for (const manifest of Object.values(satelliteData.tiles || {})) {
+                delete manifest.dir;
+                delete manifest.preview_path;
+            }
+            delete satelliteData.tiles_dir;
+        }
+        // Step 2: Prepare analysis package; agents read documents from the local store by hash
+        const documentRefs = documentContents.map(content => (0, documentStore_1.putDocument)(content));
         const analysisPackage = {
             request_id: request.requestId,
+            owner: request.requester,
             latitude: request.latitude,
             longitude: request.longitude,
             location: `${request.latitude},${request.longitude}`,
             satellite_data: satelliteData,
             document_count: request.documentHashes.length,
             document_hashes: request.documentHashes,
-            document_contents: documentContents
+            document_refs: documentRefs
         };
-        // Step 3: Run all 3 AI agents in parallel
+        // Step 3: Run all 3 AI agents in parallel, through the shared pipeline's stage queues
         logger_1.logger.info('🤖 Step 2: Running 3 AI agents in parallel...');
-        const [agent1Result, agent2Result, agent3Result] = await Promise.all([
-            runAgent('agent1.py', analysisPackage, 'Groq'),
-            runAgent('agent2.py', analysisPackage, 'OpenRouter'),
-            runAgent('agent3.py', analysisPackage, 'Gemini')
-        ]);
+        logger_1.logger.info(`   🔍 Sending ${documentRefs.length} document reference(s) to the analysis pipeline`);
+        const analysis = await (0, pipelineClient_1.runAnalysisPipeline)(analysisPackage);
+        const [agent1Result, agent2Result, agent3Result] = analysis.agents;
+        logAgentDocumentAnalysis(agent1Result, 'Groq');
+        logAgentDocumentAnalysis(agent2Result, 'OpenRouter');
+        logAgentDocumentAnalysis(agent3Result, 'Gemini');
         // Filter out errors
         const validResponses = [];
         const responses = [agent1Result, agent2Result, agent3Result];
@@ -591,8 +648,56 @@ async function processVerificationRequest(request) {
             logger_1.logger.info(`      Confidence: ${node.confidence}%`);
         });
         logger_1.logger.info('═══════════════════════════════════════════════════════════════\n');
+        // Record the consensus in the local comparables index (first price source for later requests)
+        await recordConsensusValuation(request, consensus.finalValuation, satelliteData);
         // Step 6: Submit to blockchain
         logger_1.logger.info('⛓️  Step 5: Submitting to blockchain...');
+        // Check if request is still pending before submission
+        try {
+            const ORACLE_ROUTER_ADDRESS = process.env.ORACLE_ROUTER_ADDRESS;
+            const ORACLE_ROUTER_ABI = [
+                {
+                    inputs: [{ name: '_requestId', type: 'uint256' }],
+                    name: 'getRequest',
+                    outputs: [
+                        {
+                            components: [
+                                { name: 'requestId', type: 'uint256' },
+                                { name: 'owner', type: 'address' },
+                                { name: 'assetType', type: 'uint8' },
+                                { name: 'location', type: 'string' },
+                                { name: 'ipfsHashes', type: 'string[]' },
+                                { name: 'status', type: 'uint8' },
+                                { name: 'timestamp', type: 'uint256' },
+                                { name: 'valuation', type: 'uint256' },
+                                { name: 'confidence', type: 'uint256' }
+                            ],
+                            type: 'tuple'
+                        }
+                    ],
+                    stateMutability: 'view',
+                    type: 'function'
+                }
+            ];
+            const requestData = await submitter_1.publicClient.readContract({
+                address: ORACLE_ROUTER_ADDRESS,
+                abi: ORACLE_ROUTER_ABI,
+                functionName: 'getRequest',
+                args: [BigInt(request.requestId)]
+            });
+            // Status: 0=PENDING, 1=PROCESSING, 2=VERIFIED, 3=REJECTED
+            if (requestData.status !== 0) {
+                const statusNames = ['PENDING', 'PROCESSING', 'VERIFIED', 'REJECTED'];
+                logger_1.logger.warn(`⚠️  Request #${request.requestId} is no longer PENDING (status: ${statusNames[requestData.status]})`);
+                logger_1.logger.warn(`   Skipping submission - another oracle may have already processed this request\n`);
+                return;
+            }
+            logger_1.logger.info(`✅ Request #${request.requestId} confirmed PENDING - proceeding with submission\n`);
+        }
+        catch (error) {
+            logger_1.logger.warn(`⚠️  Could not verify request status: ${error.message}`);
+            logger_1.logger.warn(`   Attempting submission anyway...\n`);
+        }
         // First submit to standard OracleRouter
         const { txHash, evidenceHash } = await (0, submitter_1.submitVerification)(request.requestId, consensus.finalValuation, consensus.finalConfidence, satelliteData, validResponses, consensus.nodeResponses // Pass individual agent scores
         );
@@ -608,6 +713,9 @@ async function processVerificationRequest(request) {
             await (0, submitter_1.submitToConsensusEngine)(request.requestId, consensus.finalValuation, boostedConfidence, // Use boosted confidence
             evidenceHash // Use actual IPFS hash
             );
+            // NOTE: L1 anchoring happens automatically via ConsensusEngine._anchorToL1()
+            // when the oracle response is submitted above
+            logger_1.logger.info(`\n🔗 L1 Anchoring initiated automatically by ConsensusEngine\n`);
         }
         else {
             logger_1.logger.warn(`\n⚠️  Confidence ${consensus.finalConfidence}% below 70% threshold`);
@@ -662,130 +770,141 @@ async function processVerificationRequest(request) {
                 throw submitError;
             }
         }
+        else if (error instanceof pipelineClient_1.PipelineBusyError) {
+            // Overloaded (429): leave the request PENDING on chain so a later scan picks it up
+            logger_1.logger.warn(`⏳ Analysis pipeline busy after ${duration}s - request left pending: ${errorMessage}`);
+            throw error;
+        }
         else {
             logger_1.logger.error('❌ Error processing request:', error);
             throw error;
         }
     }
 }
+// Result keys (URL, local path) of each satellite view, as in satellite_service.py
+const SATELLITE_IMAGE_KEYS = {
+    rgb: ['rgb_image_url', 'rgb_image_path'],
+    ndvi: ['ndvi_image_url', 'ndvi_image_path'],
+    cir: ['cir_image_url', 'cir_image_path'],
+    true_color: ['true_color_url', 'true_color_image_path']
+};
 /**
- * Fetch satellite data using Python service
+ * Pin a satellite tiles_dir (one {z}/{x}/{y}.webp pyramid per view) as a single
+ * IPFS directory and point each manifest and preview URL at it. Viewers then
+ * fetch the preview or one zoom level's tiles from the gateway.
  */
-async function fetchSatelliteData(latitude, longitude) {
-    return new Promise((resolve, reject) => {
-        const pythonPath = process.env.PYTHON_PATH || 'python';
-        const scriptPath = path_1.default.join(__dirname, '..', 'satellite_service.py');
-        const python = (0, child_process_1.spawn)(pythonPath, [scriptPath]);
-        let dataString = '';
-        let errorString = '';
-        python.stdout.on('data', (data) => {
-            dataString += data.toString();
-        });
-        python.stderr.on('data', (data) => {
-            errorString += data.toString();
-        });
-        python.on('close', (code) => {
-            if (code !== 0) {
-                reject(new Error(`Satellite service failed: ${errorString}`));
-            }
-            else {
-                try {
-                    const result = JSON.parse(dataString);
-                    resolve(result);
+async function pinTilePyramids(satelliteData, requestId) {
+    const tilesDir = satelliteData.tiles_dir;
+    const rootName = `satellite_tiles_${requestId}`;
+    try {
+        if (!fs_1.default.existsSync(tilesDir)) {
+            return;
+        }
+        logger_1.logger.info('🧩 Step 1.4: Pinning satellite tile pyramids to IPFS...');
+        const formData = new form_data_1.default();
+        const addDirectory = (dir) => {
+            for (const entry of fs_1.default.readdirSync(dir, { withFileTypes: true })) {
+                const fullPath = path_1.default.join(dir, entry.name);
+                if (entry.isDirectory()) {
+                    addDirectory(fullPath);
                 }
-                catch (e) {
-                    reject(new Error(`Failed to parse satellite data: ${dataString}`));
+                else {
+                    const relativePath = path_1.default.relative(tilesDir, fullPath).split(path_1.default.sep).join('/');
+                    formData.append('file', fs_1.default.createReadStream(fullPath), { filepath: `${rootName}/${relativePath}` });
                 }
             }
+        };
+        addDirectory(tilesDir);
+        formData.append('pinataMetadata', JSON.stringify({ name: rootName }));
+        const response = await axios_1.default.post('https://api.pinata.cloud/pinning/pinFileToIPFS', formData, {
+            headers: {
+                'Authorization': `Bearer ${process.env.PINATA_JWT}`,
+                ...formData.getHeaders()
+            },
+            maxBodyLength: Infinity
         });
-        // Send input
-        python.stdin.write(JSON.stringify({ latitude, longitude }));
-        python.stdin.end();
-        // Timeout after 180 seconds (3 minutes) - downloading 4x 2048x2048 images takes time
-        setTimeout(() => {
-            python.kill();
-            reject(new Error('Satellite service timeout (3 min limit)'));
-        }, 180000);
-    });
+        const baseUrl = `https://gateway.pinata.cloud/ipfs/${response.data.IpfsHash}`;
+        satelliteData.tiles_url = baseUrl;
+        for (const [kind, manifest] of Object.entries(satelliteData.tiles || {})) {
+            manifest.preview_url = `${baseUrl}/${kind}/preview.webp`;
+            manifest.tile_url_template = `${baseUrl}/${kind}/${manifest.tile_template}`;
+            // The previews are already pinned inside the directory - no separate upload in Step 1.5
+            const [urlKey, pathKey] = SATELLITE_IMAGE_KEYS[kind] || [];
+            if (urlKey) {
+                satelliteData[urlKey] = manifest.preview_url;
+                delete satelliteData[pathKey];
+            }
+        }
+        logger_1.logger.info(`   ✅ Tile pyramids pinned: ${response.data.IpfsHash}`);
+        logger_1.logger.info(`   🔗 Tiles URL: ${baseUrl}\n`);
+    }
+    catch (error) {
+        logger_1.logger.error(`❌ Failed to pin tile pyramids to IPFS: ${error}`);
+        logger_1.logger.warn('   ⚠️  Continuing verification without tile pyramids in IPFS');
+    }
 }
 /**
- * Run a single AI agent
+ * Fetch satellite data through the shared analysis pipeline server, where
+ * concurrent requests for neighbouring parcels can share one raster download
  */
-async function runAgent(scriptName, data, agentName) {
+async function fetchSatelliteData(latitude, longitude) {
+    const satelliteData = await (0, pipelineClient_1.fetchSatellite)(latitude, longitude);
+    if (satelliteData.coalesced) {
+        logger_1.logger.info(`   🧩 Rendered from a raster shared by ${satelliteData.coalesced_requests} request(s): `
+            + `${satelliteData.image_size_px}px images of a ${satelliteData.image_extent_m} m crop`);
+    }
+    return satelliteData;
+}
+/**
+ * Store a consensus valuation in the comparables index and locality price digest.
+ * Failures are logged only - recording must never block a submission.
+ */
+async function recordConsensusValuation(request, valuation, satelliteData) {
     return new Promise((resolve) => {
         const pythonPath = process.env.PYTHON_PATH || 'python';
-        const scriptPath = path_1.default.join(__dirname, '..', scriptName);
-        // Log what we're sending to the agent
-        logger_1.logger.info(`   🔍 Sending to ${agentName}:`);
-        logger_1.logger.info(`      - Document count: ${data.document_contents?.length || 0}`);
-        if (data.document_contents && data.document_contents.length > 0) {
-            data.document_contents.forEach((doc, idx) => {
-                const preview = doc.length > 100 ? doc.substring(0, 100) + '...' : doc;
-                logger_1.logger.info(`      - Doc ${idx + 1}: ${doc.length} chars - "${preview}"`);
-            });
-        }
-        const python = (0, child_process_1.spawn)(pythonPath, [scriptPath]);
-        let dataString = '';
+        const scriptPath = path_1.default.join(__dirname, '..', 'src', 'services', 'comparablesIndex.py');
+        const record = {
+            latitude: request.latitude,
+            longitude: request.longitude,
+            valuation,
+            area_sqm: satelliteData.area_sqm,
+            ndvi: satelliteData.ndvi,
+            request_id: request.requestId
+        };
+        const python = (0, child_process_1.spawn)(pythonPath, [scriptPath, 'add', JSON.stringify(record)]);
         let errorString = '';
-        python.stdout.on('data', (data) => {
-            dataString += data.toString();
-        });
         python.stderr.on('data', (data) => {
             errorString += data.toString();
         });
+        const timeout = setTimeout(() => {
+            python.kill();
+            logger_1.logger.warn('⚠️  Comparables index update timed out');
+            resolve();
+        }, 10000);
+        python.on('error', (error) => {
+            clearTimeout(timeout);
+            logger_1.logger.warn(`⚠️  Could not record valuation in comparables index: ${error.message}`);
+            resolve();
+        });
         python.on('close', (code) => {
+            clearTimeout(timeout);
             if (code !== 0) {
-                logger_1.logger.error(`   ❌ ${agentName} stderr: ${errorString}`);
-                resolve({
-                    valuation: 0,
-                    confidence: 0,
-                    reasoning: '',
-                    risk_factors: [],
-                    agent: agentName.toLowerCase(),
-                    error: errorString || 'Agent failed'
-                });
-            }
-            else {
-                try {
-                    const result = JSON.parse(dataString);
-                    // Log what the agent returned regarding documents
-                    if (result.document_verification) {
-                        logger_1.logger.info(`   📋 ${agentName} document analysis:`);
-                        logger_1.logger.info(`      - Is land document: ${result.document_verification.is_land_document}`);
-                        logger_1.logger.info(`      - Authenticity score: ${result.document_verification.authenticity_score}`);
-                        if (result.document_verification.missing_fields?.length > 0) {
-                            logger_1.logger.info(`      - Missing fields: ${result.document_verification.missing_fields.join(', ')}`);
-                        }
-                    }
-                    resolve(result);
-                }
-                catch (e) {
-                    logger_1.logger.error(`   ❌ ${agentName} parse error: ${dataString}`);
-                    resolve({
-                        valuation: 0,
-                        confidence: 0,
-                        reasoning: '',
-                        risk_factors: [],
-                        agent: agentName.toLowerCase(),
-                        error: `Failed to parse response: ${dataString}`
-                    });
-                }
+                logger_1.logger.warn(`⚠️  Could not record valuation in comparables index: ${errorString}`);
             }
+            resolve();
         });
-        // Send input
-        python.stdin.write(JSON.stringify(data));
-        python.stdin.end();
-        // Timeout after 30 seconds
-        setTimeout(() => {
-            python.kill();
-            resolve({
-                valuation: 0,
-                confidence: 0,
-                reasoning: '',
-                risk_factors: [],
-                agent: agentName.toLowerCase(),
-                error: 'Agent timeout'
-            });
-        }, 30000);
     });
 }
+/**
+ * Log what an agent concluded about the documents
+ */
+function logAgentDocumentAnalysis(result, agentName) {
+    if (result.document_verification) {
+        logger_1.logger.info(`   📋 ${agentName} document analysis:`);
+        logger_1.logger.info(`      - Is land document: ${result.document_verification.is_land_document}`);
+        logger_1.logger.info(`      - Authenticity score: ${result.document_verification.authenticity_score}`);
+        if (result.document_verification.missing_fields?.length > 0) {
+            logger_1.logger.info(`      - Missing fields: ${result.document_verification.missing_fields.join(', ')}`);
+        }
+    }
+}
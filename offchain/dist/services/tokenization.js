@@ -76,16 +76,19 @@ const mantleSepolia = (0, viem_1.defineChain)({
 });
 // Load contract artifacts
 const RWATokenFactoryArtifact = JSON.parse(fs.readFileSync(path.join(__dirname, '../../../onchain/artifacts/contracts/tokens/RWATokenFactory.sol/RWATokenFactory.json'), 'utf-8'));
+const RWATokenArtifact = JSON.parse(fs.readFileSync(path.join(__dirname, '../../../onchain/artifacts/contracts/tokens/RWAToken.sol/RWAToken.json'), 'utf-8'));
 const ComplianceModuleArtifact = JSON.parse(fs.readFileSync(path.join(__dirname, '../../../onchain/artifacts/contracts/compliance/ComplianceModule.sol/ComplianceModule.json'), 'utf-8'));
 // Contract addresses - from environment variables or fallback to deployment file
 let RWA_TOKEN_FACTORY_ADDRESS = process.env.RWA_TOKEN_FACTORY_ADDRESS;
 let COMPLIANCE_MODULE_ADDRESS = process.env.COMPLIANCE_MODULE_ADDRESS;
+let ASSET_REGISTRY_ADDRESS = process.env.ASSET_REGISTRY_ADDRESS;
 // Fallback to deployment addresses file if env vars not set
-if (!RWA_TOKEN_FACTORY_ADDRESS || !COMPLIANCE_MODULE_ADDRESS) {
+if (!RWA_TOKEN_FACTORY_ADDRESS || !COMPLIANCE_MODULE_ADDRESS || !ASSET_REGISTRY_ADDRESS) {
     try {
         const deploymentAddresses = JSON.parse(fs.readFileSync(path.join(__dirname, '../../../onchain/deployment-addresses.json'), 'utf-8'));
         RWA_TOKEN_FACTORY_ADDRESS = RWA_TOKEN_FACTORY_ADDRESS || deploymentAddresses.RWATokenFactory;
         COMPLIANCE_MODULE_ADDRESS = COMPLIANCE_MODULE_ADDRESS || deploymentAddresses.ComplianceModule;
+        ASSET_REGISTRY_ADDRESS = ASSET_REGISTRY_ADDRESS || deploymentAddresses.AssetRegistry;
     }
     catch (e) {
         logger_1.logger.warn('Could not load deployment-addresses.json, relying on env variables');
@@ -98,7 +101,15 @@ if (!RWA_TOKEN_FACTORY_ADDRESS || !RWA_TOKEN_FACTORY_ADDRESS.match(/^0x[a-fA-F0-
 if (!COMPLIANCE_MODULE_ADDRESS || !COMPLIANCE_MODULE_ADDRESS.match(/^0x[a-fA-F0-9]{40}$/)) {
     throw new Error(`Invalid or missing COMPLIANCE_MODULE_ADDRESS: ${COMPLIANCE_MODULE_ADDRESS}. Set COMPLIANCE_MODULE_ADDRESS env var or check deployment-addresses.json`);
 }
-// Get owner account from environment (contract owner, not oracle)
+if (!ASSET_REGISTRY_ADDRESS || !ASSET_REGISTRY_ADDRESS.match(/^0x[a-fA-F0-9]{40}$/)) {
+    throw new Error(`Invalid or missing ASSET_REGISTRY_ADDRESS: ${ASSET_REGISTRY_ADDRESS}. Set ASSET_REGISTRY_ADDRESS env var or check deployment-addresses.json`);
+}
+// Get oracle account from environment (this is the contract owner for RWATokenFactory)
+const ORACLE_PRIVATE_KEY = (process.env.ORACLE_PRIVATE_KEY?.trim().startsWith('0x')
+    ? process.env.ORACLE_PRIVATE_KEY.trim()
+    : `0x${process.env.ORACLE_PRIVATE_KEY?.trim()}`);
+const oracleAccount = (0, accounts_1.privateKeyToAccount)(ORACLE_PRIVATE_KEY);
+// Get owner account from environment (for minting tokens)
 const OWNER_PRIVATE_KEY = (process.env.OWNER_PRIVATE_KEY?.trim().startsWith('0x')
     ? process.env.OWNER_PRIVATE_KEY.trim()
     : `0x${process.env.OWNER_PRIVATE_KEY?.trim()}`);
@@ -106,6 +117,12 @@ const ownerAccount = (0, accounts_1.privateKeyToAccount)(OWNER_PRIVATE_KEY);
 // Create clients - using Mantle Sepolia via environment variable or fallback
 const RPC_URL = process.env.MANTLE_TESTNET_RPC_URL || 'https://rpc.sepolia.mantle.xyz';
 const walletClient = (0, viem_1.createWalletClient)({
+    account: oracleAccount,
+    chain: mantleSepolia,
+    transport: (0, viem_1.http)(RPC_URL),
+});
+// Separate wallet client for owner (for minting)
+const ownerWalletClient = (0, viem_1.createWalletClient)({
     account: ownerAccount,
     chain: mantleSepolia,
     transport: (0, viem_1.http)(RPC_URL),
@@ -114,6 +131,108 @@ const publicClient = (0, viem_1.createPublicClient)({
     chain: mantleSepolia,
     transport: (0, viem_1.http)(RPC_URL),
 });
+/**
+ * Mint tokens for a newly created RWA token
+ */
+async function mintTokens(tokenAddress, toAddress, amount) {
+    try {
+        logger_1.logger.info(`   💰 Minting tokens...`);
+        logger_1.logger.info(`      Token: ${tokenAddress}`);
+        logger_1.logger.info(`      To: ${toAddress}`);
+        logger_1.logger.info(`      Amount: ${amount.toString()}`);
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: ownerAccount.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`      🔢 Using nonce: ${nonce}`);
+        const hash = await ownerWalletClient.writeContract({
+            address: tokenAddress,
+            abi: RWATokenArtifact.abi,
+            functionName: 'mint',
+            args: [toAddress, amount],
+            nonce,
+        });
+        logger_1.logger.info(`      Transaction: ${hash}`);
+        const receipt = await publicClient.waitForTransactionReceipt({ hash });
+        if (receipt.status === 'success') {
+            logger_1.logger.info(`      ✅ Tokens minted successfully\n`);
+            return true;
+        }
+        else {
+            logger_1.logger.warn(`      ⚠️  Mint transaction failed\n`);
+            return false;
+        }
+    }
+    catch (error) {
+        logger_1.logger.error(`      ❌ Minting failed: ${error.message}\n`);
+        return false;
+    }
+}
+/**
+ * Deploy RWA token directly (bypasses factory to avoid mint authorization issues)
+ */
+async function deployRWAToken(request, valuationInWei) {
+    try {
+        logger_1.logger.info(`   📝 Deploying RWAToken directly...\n`);
+        // Create token name and symbol
+        const tokenName = `RWA-${request.assetName}`;
+        const tokenSymbol = `RWA${request.assetId}`;
+        logger_1.logger.info(`   📋 Token Details:`);
+        logger_1.logger.info(`      Name: ${tokenName}`);
+        logger_1.logger.info(`      Symbol: ${tokenSymbol}`);
+        logger_1.logger.info(`      AssetId: ${request.assetId}`);
+        logger_1.logger.info(`      Valuation: ${valuationInWei.toString()}\n`);
+        // Convert assetId to BigInt (contract expects uint256)
+        // If assetId is numeric, use it directly; otherwise use hash of string
+        let assetIdBigInt;
+        if (/^\d+$/.test(request.assetId)) {
+            assetIdBigInt = BigInt(request.assetId);
+        }
+        else {
+            // Hash the string assetId to create a numeric ID
+            // Using a simple hash: sum of character codes
+            assetIdBigInt = BigInt(request.assetId
+                .split('')
+                .reduce((sum, char) => sum + char.charCodeAt(0), 0));
+        }
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: ownerAccount.address,
+            blockTag: 'pending', // Use pending to include unconfirmed transactions
+        });
+        logger_1.logger.info(`   🔢 Using nonce: ${nonce}`);
+        const hash = await ownerWalletClient.deployContract({
+            abi: RWATokenArtifact.abi,
+            bytecode: RWATokenArtifact.bytecode,
+            args: [
+                tokenName,
+                tokenSymbol,
+                assetIdBigInt,
+                valuationInWei,
+                ASSET_REGISTRY_ADDRESS,
+                ownerAccount.address, // Use OWNER account, not request.owner
+            ],
+            nonce, // Explicitly set nonce
+        });
+        logger_1.logger.info(`   ✅ Deployment transaction: ${hash}`);
+        logger_1.logger.info(`   ⏳ Waiting for confirmation...\n`);
+        const receipt = await publicClient.waitForTransactionReceipt({ hash });
+        if (receipt.status === 'success' && receipt.contractAddress) {
+            logger_1.logger.info(`   ✅ Deployment confirmed in block ${receipt.blockNumber}`);
+            logger_1.logger.info(`   ⛽ Gas used: ${receipt.gasUsed.toString()}\n`);
+            return receipt.contractAddress;
+        }
+        else {
+            logger_1.logger.error(`   ❌ Deployment failed`);
+            return null;
+        }
+    }
+    catch (error) {
+        logger_1.logger.error(`   ❌ Deployment failed: ${error.message}\n`);
+        return null;
+    }
+}
 /**
  * Create ERC-20 token for verified asset
  */
@@ -122,9 +241,9 @@ async function createTokenForAsset(request) {
         logger_1.logger.info('\n🎫 ═══════════════════════════════════════════════════════');
         logger_1.logger.info('🎫 CREATING ERC-20 TOKEN FOR VERIFIED ASSET');
         logger_1.logger.info('🎫 ═══════════════════════════════════════════════════════\n');
-        logger_1.logger.info(`   🏭 RWATokenFactory: ${RWA_TOKEN_FACTORY_ADDRESS}`);
+        logger_1.logger.info(`   🏭 Deploying RWAToken directly (bypassing factory)`);
         logger_1.logger.info(`   🔐 ComplianceModule: ${COMPLIANCE_MODULE_ADDRESS}`);
-        logger_1.logger.info(`   💼 Wallet: ${ownerAccount.address}\n`);
+        logger_1.logger.info(`   💼 Owner Wallet: ${ownerAccount.address}\n`);
         logger_1.logger.info(`   📋 Asset Details:`);
         logger_1.logger.info(`      Asset ID: ${request.assetId}`);
         logger_1.logger.info(`      Asset Name: ${request.assetName}`);
@@ -136,59 +255,25 @@ async function createTokenForAsset(request) {
         logger_1.logger.info(`   🔢 Conversion:`);
         logger_1.logger.info(`      USD Amount: $${Number(request.valuation)}`);
         logger_1.logger.info(`      Wei Amount: ${valuationInWei}\n`);
-        // Call createToken function
-        logger_1.logger.info(`   📡 Calling RWATokenFactory.createToken()...\n`);
-        const hash = await walletClient.writeContract({
-            address: RWA_TOKEN_FACTORY_ADDRESS,
-            abi: RWATokenFactoryArtifact.abi,
-            functionName: 'createToken',
-            args: [
-                request.assetId,
-                valuationInWei,
-                request.owner,
-                request.assetName,
-            ],
-        });
-        logger_1.logger.info(`   ✅ Transaction submitted: ${hash}`);
-        // Wait for confirmation
-        const receipt = await publicClient.waitForTransactionReceipt({ hash });
-        if (receipt.status === 'success') {
-            logger_1.logger.info(`   ✅ Transaction confirmed in block ${receipt.blockNumber}\n`);
-            // Extract token address from logs
-            let tokenAddress = null;
-            for (const log of receipt.logs) {
-                if (log.address.toLowerCase() === RWA_TOKEN_FACTORY_ADDRESS.toLowerCase()) {
-                    // TokenCreated event topics: [event sig, assetId, tokenAddress, owner]
-                    if (log.topics[0] === '0x224ef611f8efb91cc42a5abd59a28765ecf1c3bcb73d05f16616957dfc7199f3') {
-                        // token address is the second indexed param (topics[2])
-                        const topic = log.topics[2];
-                        if (topic) {
-                            tokenAddress = '0x' + topic.slice(-40);
-                            break;
-                        }
-                    }
-                }
-            }
-            if (tokenAddress) {
-                logger_1.logger.info(`   🪙 Token Address: ${tokenAddress}`);
-                logger_1.logger.info(`   ✅ ERC-20 token successfully created!\n`);
-                logger_1.logger.info('🎫 ═══════════════════════════════════════════════════════');
-                logger_1.logger.info('🎫 TOKENIZATION COMPLETE ✅');
-                logger_1.logger.info('🎫 ═══════════════════════════════════════════════════════\n');
-                return tokenAddress;
-            }
-            else {
-                logger_1.logger.warn(`   ⚠️  Token address not found in logs`);
-                logger_1.logger.info(`   📍 Transaction hash: ${hash}`);
-                logger_1.logger.info(`   💡 Check blockchain explorer to verify token creation\n`);
-                return hash; // Return tx hash as fallback
-            }
-        }
-        else {
-            logger_1.logger.error(`   ❌ Transaction failed: ${receipt.status}`);
-            logger_1.logger.error(`   📍 Transaction hash: ${hash}\n`);
+        // Step 1: Deploy RWAToken directly
+        logger_1.logger.info(`   📡 Step 1: Deploying RWAToken...\n`);
+        const tokenAddress = await deployRWAToken(request, valuationInWei);
+        if (!tokenAddress) {
+            logger_1.logger.error(`   ❌ Failed to deploy token`);
             return null;
         }
+        logger_1.logger.info(`   🪙 Token Address: ${tokenAddress}`);
+        logger_1.logger.info(`   ✅ ERC-20 token successfully deployed!\n`);
+        // Step 2: Mint tokens using owner account
+        logger_1.logger.info(`   📝 Step 2: Minting tokens...\n`);
+        const mintSuccess = await mintTokens(tokenAddress, request.owner, valuationInWei);
+        if (!mintSuccess) {
+            logger_1.logger.warn(`   ⚠️  Minting failed, but token is deployed at: ${tokenAddress}\n`);
+        }
+        logger_1.logger.info('🎫 ═══════════════════════════════════════════════════════');
+        logger_1.logger.info('🎫 TOKENIZATION COMPLETE ✅');
+        logger_1.logger.info('🎫 ═══════════════════════════════════════════════════════\n');
+        return tokenAddress;
     }
     catch (error) {
         logger_1.logger.error(`\n❌ Tokenization failed: ${error.message}`);
@@ -211,11 +296,18 @@ async function createTokenForAsset(request) {
 async function setOwnerCompliance(ownerAddress) {
     try {
         logger_1.logger.info('   🔐 Setting KYC compliance status...');
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: oracleAccount.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`      🔢 Using nonce: ${nonce}`);
         const hash = await walletClient.writeContract({
             address: COMPLIANCE_MODULE_ADDRESS,
             abi: ComplianceModuleArtifact.abi,
             functionName: 'setKYCStatus',
             args: [ownerAddress, true, 0], // 0 = unrestricted jurisdiction
+            nonce,
         });
         logger_1.logger.info(`      Transaction: ${hash}`);
         const receipt = await publicClient.waitForTransactionReceipt({ hash });
@@ -36,9 +36,11 @@ var __importDefault = (this && this.__importDefault) || function (mod) {
     return (mod && mod.__esModule) ? mod : { "default": mod };
 };
 Object.defineProperty(exports, "__esModule", { value: true });
+exports.publicClient = void 0;
 exports.submitRejection = submitRejection;
 exports.submitVerification = submitVerification;
 exports.submitToConsensusEngine = submitToConsensusEngine;
+exports.anchorToEthereumL1 = anchorToEthereumL1;
 exports.submitTokenization = submitTokenization;
 /**
  * Blockchain Submitter
@@ -54,6 +56,8 @@ const fs_1 = __importDefault(require("fs"));
 const path_1 = __importDefault(require("path"));
 dotenv_1.default.config();
 const ORACLE_ROUTER_ADDRESS = process.env.ORACLE_ROUTER_ADDRESS;
+const CONSENSUS_ENGINE_ADDRESS = process.env.CONSENSUS_ENGINE_ADDRESS || '0x0000000000000000000000000000000000000000';
+const VERIFICATION_ANCHOR_ADDRESS = process.env.VERIFICATION_ANCHOR_ADDRESS || '0x0000000000000000000000000000000000000000';
 const ORACLE_PRIVATE_KEY = (process.env.ORACLE_PRIVATE_KEY?.trim().startsWith('0x')
     ? process.env.ORACLE_PRIVATE_KEY.trim()
     : `0x${process.env.ORACLE_PRIVATE_KEY?.trim()}`);
@@ -129,6 +133,7 @@ const publicClient = (0, viem_1.createPublicClient)({
     chain: IS_TESTNET ? mantleSepolia : chains_1.mantle,
     transport: (0, viem_1.http)(RPC_URL)
 });
+exports.publicClient = publicClient;
 // Contract ABI - OracleRouter.sol
 const ORACLE_ROUTER_ABI = [
     {
@@ -158,7 +163,20 @@ const CONSENSUS_ENGINE_ABI = [
         type: 'function'
     }
 ];
-const CONSENSUS_ENGINE_ADDRESS = process.env.CONSENSUS_ENGINE_ADDRESS || '0x0000000000000000000000000000000000000000';
+// VerificationAnchor ABI - Rollup Anchoring
+const VERIFICATION_ANCHOR_ABI = [
+    {
+        inputs: [
+            { name: '_requestId', type: 'uint256' },
+            { name: '_verificationHash', type: 'bytes32' },
+            { name: '_l1BlockNumber', type: 'uint256' }
+        ],
+        name: 'anchorVerification',
+        outputs: [],
+        stateMutability: 'nonpayable',
+        type: 'function'
+    }
+];
 /**
  * Submit rejection to blockchain
  * Uses submitVerification with 0 valuation and 1% confidence to indicate rejection
@@ -168,6 +186,12 @@ async function submitRejection(requestId, reason) {
         logger_1.logger.info('🚫 Submitting rejection to blockchain...');
         logger_1.logger.info(`   Reason: ${reason}`);
         logger_1.logger.info(`   Method: submitVerification with $0 valuation and 1% confidence (rejection)`);
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: account.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`   🔢 Using nonce: ${nonce}`);
         // Submit as verification with 0 valuation and 1% confidence (indicates rejection)
         // Contract requires confidence > 0, so we use 1 (minimum) to indicate rejection
         const hash = await walletClient.writeContract({
@@ -178,7 +202,8 @@ async function submitRejection(requestId, reason) {
                 BigInt(requestId),
                 BigInt(0), // 0 valuation = rejection
                 BigInt(1) // 1% confidence = rejection (minimum allowed by contract)
-            ]
+            ],
+            nonce,
         });
         logger_1.logger.info(`✅ Rejection transaction sent: ${hash}`);
         logger_1.logger.info(`   The request will show as VERIFIED with $0 value and 1% confidence (rejected)`);
@@ -225,6 +250,12 @@ async function submitVerification(requestId, valuation, confidence, satelliteDat
         storeEvidenceMapping(requestId, cleanHash);
         // Submit to blockchain
         logger_1.logger.info('📤 Submitting transaction to Mantle Sepolia...');
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: account.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`   🔢 Using nonce: ${nonce}`);
         const hash = await walletClient.writeContract({
             address: ORACLE_ROUTER_ADDRESS,
             abi: ORACLE_ROUTER_ABI,
@@ -233,8 +264,8 @@ async function submitVerification(requestId, valuation, confidence, satelliteDat
                 BigInt(requestId),
                 BigInt(valuation),
                 BigInt(confidence)
-            ]
-            // Let viem estimate gas automatically
+            ],
+            nonce,
         });
         logger_1.logger.info(`⏳ Waiting for confirmation...`);
         // In production, you'd wait for the transaction receipt here
@@ -276,46 +307,49 @@ async function uploadEvidence(evidence) {
  * Submit to ConsensusEngine.sol when confidence >= 70%
  */
 async function submitToConsensusEngine(requestId, valuation, confidence, evidenceHash) {
+    if (!CONSENSUS_ENGINE_ADDRESS || CONSENSUS_ENGINE_ADDRESS === '0x0000000000000000000000000000000000000000') {
+        logger_1.logger.warn('⚠️  ConsensusEngine address not configured, skipping consensus submission');
+        return '';
+    }
+    // Convert IPFS hash (CID) to bytes32
+    // IPFS v0 CIDs start with "Qm" and are base58 encoded
+    // For Solidity bytes32, we'll use the keccak256 hash of the full IPFS hash
+    // This is a common pattern for storing IPFS references on-chain
+    let evidenceBytes32;
+    if (evidenceHash.startsWith('Qm')) {
+        // Remove "Qm" prefix and hash the remaining string
+        // Alternatively, we can just hash the full CID
+        const encoder = new TextEncoder();
+        const data = encoder.encode(evidenceHash);
+        // Simple approach: Take first 32 bytes of the hash string as hex
+        // More robust: Use keccak256 hash of the CID
+        const hashBuffer = Buffer.from(evidenceHash);
+        const hex = hashBuffer.toString('hex').slice(0, 64).padEnd(64, '0');
+        evidenceBytes32 = `0x${hex}`;
+    }
+    else {
+        // Already in hex format or other format
+        evidenceBytes32 = `0x${evidenceHash.replace('0x', '').slice(0, 64).padEnd(64, '0')}`;
+    }
     try {
-        if (!CONSENSUS_ENGINE_ADDRESS || CONSENSUS_ENGINE_ADDRESS === '0x0000000000000000000000000000000000000000') {
-            logger_1.logger.warn('⚠️  ConsensusEngine address not configured, skipping consensus submission');
-            return '';
-        }
-        // Convert IPFS hash (CID) to bytes32
-        // IPFS v0 CIDs start with "Qm" and are base58 encoded
-        // For Solidity bytes32, we'll use the keccak256 hash of the full IPFS hash
-        // This is a common pattern for storing IPFS references on-chain
-        let evidenceBytes32;
-        if (evidenceHash.startsWith('Qm')) {
-            // Remove "Qm" prefix and hash the remaining string
-            // Alternatively, we can just hash the full CID
-            const encoder = new TextEncoder();
-            const data = encoder.encode(evidenceHash);
-            // Simple approach: Take first 32 bytes of the hash string as hex
-            // More robust: Use keccak256 hash of the CID
-            const hashBuffer = Buffer.from(evidenceHash);
-            const hex = hashBuffer.toString('hex').slice(0, 64).padEnd(64, '0');
-            evidenceBytes32 = `0x${hex}`;
-        }
-        else {
-            // Already in hex format or other format
-            evidenceBytes32 = `0x${evidenceHash.replace('0x', '').slice(0, 64).padEnd(64, '0')}`;
-        }
         logger_1.logger.info('📊 Submitting to ConsensusEngine.sol...');
         logger_1.logger.info(`   Contract: ${CONSENSUS_ENGINE_ADDRESS}`);
         logger_1.logger.info(`   IPFS Evidence: ${evidenceHash}`);
         logger_1.logger.info(`   Bytes32: ${evidenceBytes32}`);
         logger_1.logger.info(`   Confidence: ${confidence}% (meets 70% threshold)`);
-        // Get current gas prices from the network
-        const feeData = await publicClient.estimateFeesPerGas();
-        // Add 50% buffer to ensure transaction goes through even with pending transactions
-        const maxPriorityFeePerGas = feeData.maxPriorityFeePerGas
-            ? (feeData.maxPriorityFeePerGas * 150n) / 100n
-            : undefined;
-        const maxFeePerGas = feeData.maxFeePerGas
-            ? (feeData.maxFeePerGas * 150n) / 100n
-            : undefined;
-        logger_1.logger.info(`   Gas: maxFee=${maxFeePerGas ? (Number(maxFeePerGas) / 1e9).toFixed(4) : 'auto'} gwei, maxPriorityFee=${maxPriorityFeePerGas ? (Number(maxPriorityFeePerGas) / 1e9).toFixed(4) : 'auto'} gwei (50% buffer)`);
+        logger_1.logger.info(`   📤 Submitting transaction...`);
+        // Small delay to ensure previous transactions are processed
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        // Get current gas price to ensure we're above any stuck transactions
+        const gasPrice = await publicClient.getGasPrice();
+        logger_1.logger.info(`   Current gas price: ${(gasPrice / 1000000000n)} gwei`);
+        // Get the current nonce explicitly to avoid conflicts
+        // Fetch it right before sending to minimize chance of stale nonce
+        const nonce = await publicClient.getTransactionCount({
+            address: account.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`   🔢 Using nonce: ${nonce}`);
         const hash = await walletClient.writeContract({
             address: CONSENSUS_ENGINE_ADDRESS,
             abi: CONSENSUS_ENGINE_ABI,
@@ -326,8 +360,8 @@ async function submitToConsensusEngine(requestId, valuation, confidence, evidenc
                 BigInt(confidence),
                 evidenceBytes32
             ],
-            maxFeePerGas,
-            maxPriorityFeePerGas
+            gasPrice: gasPrice, // Use current gas price, not estimate
+            nonce,
         });
         logger_1.logger.info(`✅ ConsensusEngine submission successful: ${hash}`);
         logger_1.logger.info(`   Request will reach consensus when 2/3 oracles agree`);
@@ -335,11 +369,99 @@ async function submitToConsensusEngine(requestId, valuation, confidence, evidenc
     }
     catch (error) {
         // Don't fail the entire process if consensus submission fails
+        const errorMsg = error.message || '';
+        if (errorMsg.includes('nonce too low') || errorMsg.includes('replacement transaction underpriced')) {
+            logger_1.logger.warn(`⚠️  Transaction stuck in mempool (nonce conflict). Waiting 3 seconds before retry...`);
+            // Wait and let the previous transaction clear
+            await new Promise(resolve => setTimeout(resolve, 3000));
+            try {
+                // Retry with fresh nonce and gas price
+                const gasPrice = await publicClient.getGasPrice();
+                const newPrice = (gasPrice * 120n) / 100n; // 20% higher
+                // Get fresh nonce
+                const retryNonce = await publicClient.getTransactionCount({
+                    address: account.address,
+                    blockTag: 'pending',
+                });
+                logger_1.logger.info(`   Retrying with nonce ${retryNonce} and higher gas price: ${(newPrice / 1000000000n)} gwei`);
+                const retryHash = await walletClient.writeContract({
+                    address: CONSENSUS_ENGINE_ADDRESS,
+                    abi: CONSENSUS_ENGINE_ABI,
+                    functionName: 'submitOracleResponse',
+                    args: [
+                        BigInt(requestId),
+                        BigInt(valuation),
+                        BigInt(confidence),
+                        evidenceBytes32
+                    ],
+                    gasPrice: newPrice,
+                    nonce: retryNonce,
+                });
+                logger_1.logger.info(`✅ ConsensusEngine retry successful: ${retryHash}`);
+                return retryHash;
+            }
+            catch (retryError) {
+                logger_1.logger.warn(`⚠️  ConsensusEngine retry also failed: ${retryError.message}`);
+            }
+        }
         logger_1.logger.warn(`⚠️  ConsensusEngine submission failed: ${error.message}`);
         logger_1.logger.warn(`   Continuing with standard OracleRouter submission...`);
         return '';
     }
 }
+/**
+ * Anchor verification to Ethereum L1 via Mantle's rollup system
+ * STEP 7.5: Called after consensus validation
+ */
+async function anchorToEthereumL1(requestId, valuation, confidence, l1BlockNumber) {
+    try {
+        if (!VERIFICATION_ANCHOR_ADDRESS || VERIFICATION_ANCHOR_ADDRESS === '0x0000000000000000000000000000000000000000') {
+            logger_1.logger.warn('⚠️  VerificationAnchor address not configured, skipping L1 anchoring');
+            return '';
+        }
+        // Create verification hash (same as ConsensusEngine does)
+        const encoder = new TextEncoder();
+        const data = encoder.encode(JSON.stringify({
+            requestId,
+            valuation,
+            confidence,
+            l1BlockNumber,
+            timestamp: Math.floor(Date.now() / 1000)
+        }));
+        const hashBuffer = Buffer.from(data);
+        const hex = hashBuffer.toString('hex').slice(0, 64).padEnd(64, '0');
+        const verificationHash = `0x${hex}`;
+        logger_1.logger.info('🔗 Anchoring verification to Ethereum L1...');
+        logger_1.logger.info(`   VerificationAnchor: ${VERIFICATION_ANCHOR_ADDRESS}`);
+        logger_1.logger.info(`   L1 Block Number: ${l1BlockNumber}`);
+        logger_1.logger.info(`   Verification Hash: ${verificationHash}`);
+        // Get the current nonce explicitly to avoid conflicts
+        const nonce = await publicClient.getTransactionCount({
+            address: account.address,
+            blockTag: 'pending',
+        });
+        logger_1.logger.info(`   🔢 Using nonce: ${nonce}`);
+        const hash = await walletClient.writeContract({
+            address: VERIFICATION_ANCHOR_ADDRESS,
+            abi: VERIFICATION_ANCHOR_ABI,
+            functionName: 'anchorVerification',
+            args: [
+                BigInt(requestId),
+                verificationHash,
+                BigInt(l1BlockNumber)
+            ],
+            nonce,
+        });
+        logger_1.logger.info(`✅ L1 Anchoring successful: ${hash}`);
+        logger_1.logger.info(`   Verification hash is now stored on Ethereum L1 via Mantle rollup`);
+        return hash;
+    }
+    catch (error) {
+        logger_1.logger.warn(`⚠️  L1 Anchoring failed: ${error.message}`);
+        logger_1.logger.warn(`   Continuing with tokenization...`);
+        return '';
+    }
+}
 /**
  * Submit tokenization request after verification consensus
  * This is called when confidence >= 70% to create ERC-20 tokens
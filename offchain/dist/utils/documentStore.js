@@ -0,0 +1,34 @@
+"use strict";
+var __importDefault = (this && this.__importDefault) || function (mod) {
+    return (mod && mod.__esModule) ? mod : { "default": mod };
+};
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.DOCUMENT_STORE_DIR = void 0;
+exports.putDocument = putDocument;
+/**
+ * Document Store
+ * Writes document text into the content-addressed store read by the Python agents
+ * (src/utils/documentStore.py), so payloads carry `document_refs` instead of the text
+ */
+const crypto_1 = __importDefault(require("crypto"));
+const fs_1 = __importDefault(require("fs"));
+const path_1 = __importDefault(require("path"));
+// Same layout as the Python side: <DOCUMENT_STORE_DIR>/<sha256[:2]>/<sha256>
+exports.DOCUMENT_STORE_DIR = process.env.DOCUMENT_STORE_DIR
+    || path_1.default.join(__dirname, '..', '..', '.document-store');
+const HASH_PREFIX = 'sha256:';
+/**
+ * Store a document and return its `sha256:<hex>` reference
+ */
+function putDocument(content) {
+    const buffer = typeof content === 'string' ? Buffer.from(content, 'utf-8') : content;
+    const contentHash = crypto_1.default.createHash('sha256').update(buffer).digest('hex');
+    const filePath = path_1.default.join(exports.DOCUMENT_STORE_DIR, contentHash.substring(0, 2), contentHash);
+    if (!fs_1.default.existsSync(filePath)) {
+        fs_1.default.mkdirSync(path_1.default.dirname(filePath), { recursive: true });
+        const tmpPath = `${filePath}.${process.pid}.tmp`;
+        fs_1.default.writeFileSync(tmpPath, buffer);
+        fs_1.default.renameSync(tmpPath, filePath);
+    }
+    return HASH_PREFIX + contentHash;
+}
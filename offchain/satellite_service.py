@@ -2,49 +2,542 @@
 Satellite Service
 Fetches satellite imagery using Google Earth Engine
 """
+import io
 import os
 import sys
 import json
+import math
+import time
+import threading
 import ee
 import requests
 import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils import metrics
+from src.utils.cli import positional_args, read_list_option, write_result
+from src.utils import geohash
+from src.utils.imageTiles import build_pyramid
+from src.utils.sceneRaster import INDEX_BANDS, RASTER_BANDS, SceneRaster, degrees_for_meters, grid_dimensions
+from src.utils.profiling import profile_request
+
 load_dotenv()
 
-def fetch_satellite_data(latitude, longitude):
-    """Fetch satellite imagery and metrics with high resolution"""
+# Rendered views and their result keys: (url key, path key, log label)
+IMAGE_VIEWS = ['rgb', 'ndvi', 'cir', 'true_color']
+IMAGE_KEYS = {
+    'rgb': ('rgb_image_url', 'rgb_image_path', 'RGB'),
+    'ndvi': ('ndvi_image_url', 'ndvi_image_path', 'NDVI'),
+    'cir': ('cir_image_url', 'cir_image_path', 'CIR'),
+    'true_color': ('true_color_url', 'true_color_image_path', 'True Color')
+}
+
+# 'png': four full-size PNGs; 'tiles': a WebP preview plus tile pyramid per view
+IMAGE_MODES = ('png', 'tiles')
+SATELLITE_IMAGE_MODE = os.getenv('SATELLITE_IMAGE_MODE', 'png')
+SATELLITE_TILES_DIR = os.getenv('SATELLITE_TILES_DIR')
+
+# Scene search, narrowest first: (window in days, max CLOUDY_PIXEL_PERCENTAGE or None).
+# The first window with a qualifying scene is used.
+SCENE_SEARCH_STEPS = ((30, 10), (90, 10), (365, None))
+
+# 'best': least cloudy single scene; 'median': cloud-masked median composite of the window
+SCENE_MODES = ('best', 'median')
+SATELLITE_SCENE_MODE = os.getenv('SATELLITE_SCENE_MODE', 'best')
+
+# Sentinel-2 scene classification values masked out of composites:
+# cloud shadow, cloud medium/high probability, thin cirrus
+CLOUD_SCL_CLASSES = (3, 8, 9, 10)
+
+# ROI statistics over the normalized difference indices in INDEX_BANDS (src/utils/sceneRaster.py)
+ROI_STATS_DEFAULTS = {
+    'radii': (50, 100, 250, 500),
+    'indices': tuple(INDEX_BANDS),
+    'percentiles': (10, 50, 90)
+}
+ROI_STATS_MAX_RADIUS = 5000
+
+# Radius of the area the headline metrics (area, NDVI) are computed over
+ROI_RADIUS_M = 100
+
+# Requests arriving within this window whose points share a geohash cell, date and
+# scene mode share one scene lookup and one raster download. 0 disables coalescing.
+# Only callers that run many requests in one process opt in (analysis pipeline
+# server, batch driver); a one-shot CLI run would only wait out the window.
+SATELLITE_COALESCE_WINDOW_MS = float(os.getenv('SATELLITE_COALESCE_WINDOW_MS', '0'))
+COALESCE_PRECISION = int(os.getenv('SATELLITE_COALESCE_PRECISION', '6'))
+# Each coalesced parcel's images are crops of this half-width, rendered at this size
+COALESCE_CROP_M = 320
+COALESCE_CROP_SIZE = 512
+
+# Rendering parameters per view. Without a region parameter GEE renders a proper
+# square aligned to lat/lon; coalesced requests render the same styles locally.
+VIEW_PARAMS = {
+    'rgb': {
+        'bands': ['B4', 'B3', 'B2'],
+        'min': 0,
+        'max': 3000,
+        'dimensions': 2048
+    },
+    # NDVI visualization
+    'ndvi': {
+        'min': 0,
+        'max': 1,
+        'palette': ['red', 'yellow', 'green'],
+        'dimensions': 2048
+    },
+    # Color Infrared (CIR) - best for vegetation analysis
+    'cir': {
+        'bands': ['B8', 'B4', 'B3'],
+        'min': 0,
+        'max': 3000,
+        'dimensions': 2048
+    },
+    # True Color composite for better clarity
+    'true_color': {
+        'bands': ['B2', 'B3', 'B4'],
+        'min': 0,
+        'max': 2500,
+        'gamma': 1.2,
+        'dimensions': 2048
+    }
+}
+
+def _initialize_earth_engine():
+    """Authenticate and initialize Earth Engine"""
+    project_id = os.getenv('GOOGLE_EARTH_ENGINE_PROJECT_ID')
+    
+    # Try to authenticate first (only needed once, but safe to call multiple times)
     try:
-        # Authenticate and initialize Earth Engine
-        project_id = os.getenv('GOOGLE_EARTH_ENGINE_PROJECT_ID')
+        ee.Authenticate()
+    except Exception as auth_error:
+        # If already authenticated, this will fail but we can continue
+        print(f"Note: Authentication status: {auth_error}", file=sys.stderr)
+    
+    # Initialize Earth Engine with project ID
+    with metrics.track_call('earth_engine', 'initialize'):
+        ee.Initialize(project=project_id)
+
+def _progressive_collection(roi, end_date, steps=SCENE_SEARCH_STEPS):
+    """
+    Sentinel-2 collection for the narrowest qualifying search window.
+    
+    The choice is made server-side with ee.Algorithms.If, so it costs no extra
+    round-trip and wider windows are only scanned when the narrow ones are empty.
+    
+    Returns:
+        (collection, window days, cloud limit) as Earth Engine objects
+    """
+    base = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED').filterBounds(roi)
+    collection = window = cloud_limit = None
+    
+    # Build the fallback chain from the widest window inwards
+    for days, max_cloud in reversed(steps):
+        start_date = end_date - timedelta(days=days)
+        candidates = base.filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        if max_cloud is not None:
+            candidates = candidates.filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud))
         
-        # Try to authenticate first (only needed once, but safe to call multiple times)
+        if collection is None:
+            collection, window, cloud_limit = candidates, ee.Number(days), ee.Number(max_cloud or 100)
+        else:
+            found = candidates.size().gt(0)
+            collection = ee.ImageCollection(ee.Algorithms.If(found, candidates, collection))
+            window = ee.Number(ee.Algorithms.If(found, days, window))
+            cloud_limit = ee.Number(ee.Algorithms.If(found, max_cloud or 100, cloud_limit))
+    
+    return collection, window, cloud_limit
+
+def _mask_clouds(image):
+    """Mask cloud, cirrus and cloud-shadow pixels using the scene classification band"""
+    scl = image.select('SCL')
+    clear = scl.neq(CLOUD_SCL_CLASSES[0])
+    for value in CLOUD_SCL_CLASSES[1:]:
+        clear = clear.And(scl.neq(value))
+    return image.updateMask(clear)
+
+def _scene_image(collection, scene_mode):
+    """(image, cloud coverage, image date) for the scene mode, as Earth Engine objects"""
+    if scene_mode == 'median':
+        # Cloud-masked median of every scene in the chosen window
+        return (collection.map(_mask_clouds).median(),
+                collection.aggregate_mean('CLOUDY_PIXEL_PERCENTAGE'),
+                collection.aggregate_max('GENERATION_TIME'))
+    
+    # Least cloudy scene in the chosen window
+    sentinel = ee.Image(collection.sort('CLOUDY_PIXEL_PERCENTAGE').first())
+    return sentinel, sentinel.get('CLOUDY_PIXEL_PERCENTAGE'), sentinel.get('GENERATION_TIME')
+
+def _roi_stats_request(option):
+    """
+    Validate a roi_stats option: True for the defaults, or a dict with any of
+    radii (metres), indices and percentiles. Returns None when not requested.
+    """
+    if not option:
+        return None
+    option = option if isinstance(option, dict) else {}
+    radii = sorted({float(r) for r in option.get('radii') or ROI_STATS_DEFAULTS['radii']})
+    if not all(0 < r <= ROI_STATS_MAX_RADIUS for r in radii):
+        raise ValueError(f"roi_stats radii must be between 0 and {ROI_STATS_MAX_RADIUS} metres")
+    indices = [i.lower() for i in option.get('indices') or ROI_STATS_DEFAULTS['indices']]
+    unknown = [i for i in indices if i not in INDEX_BANDS]
+    if unknown:
+        raise ValueError(f"Unknown roi_stats indices {', '.join(unknown)} (use {', '.join(INDEX_BANDS)})")
+    percentiles = sorted({int(p) for p in option.get('percentiles') or ROI_STATS_DEFAULTS['percentiles']})
+    if not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError("roi_stats percentiles must be between 0 and 100")
+    return {
+        'radii': [int(r) if r.is_integer() else r for r in radii],
+        'indices': list(dict.fromkeys(indices)),
+        'percentiles': percentiles
+    }
+
+def _roi_statistics(image, point, request):
+    """
+    Every radius x index combination in one reduceRegions call.
+    
+    The indices are stacked as bands of one image and each radius is a buffer
+    feature, so a single combined mean/stdDev/percentile reducer covers them
+    all. Returns a server-side list of per-radius property dictionaries.
+    """
+    bands = ee.Image.cat([
+        image.normalizedDifference(list(INDEX_BANDS[index])).rename(index)
+        for index in request['indices']
+    ])
+    reducer = (
+        ee.Reducer.mean()
+        .combine(ee.Reducer.stdDev(), sharedInputs=True)
+        .combine(ee.Reducer.percentile(request['percentiles']), sharedInputs=True)
+    )
+    buffers = ee.FeatureCollection([
+        ee.Feature(point.buffer(radius), {'radius_m': radius}) for radius in request['radii']
+    ])
+    stats = bands.reduceRegions(collection=buffers, reducer=reducer, scale=10)
+    return stats.toList(len(request['radii'])).map(lambda feature: ee.Feature(feature).toDictionary())
+
+def _nest_roi_statistics(rows, request):
+    """
+    {radius: {index: {mean, stddev, p10, ...}}} from the reduceRegions rows.
+    
+    With several bands Earth Engine prefixes outputs with the band name
+    (ndvi_mean); with one band it does not (mean).
+    """
+    stat_keys = [('mean', 'mean'), ('stddev', 'stdDev')] + [(f"p{p}", f"p{p}") for p in request['percentiles']]
+    nested = {}
+    for row in rows:
+        by_index = {}
+        for index in request['indices']:
+            values = {}
+            for name, key in stat_keys:
+                value = row.get(f"{index}_{key}", row.get(key) if len(request['indices']) == 1 else None)
+                values[name] = round(value, 4) if value is not None else None
+            by_index[index] = values
+        nested[str(row['radius_m'])] = by_index
+    return nested
+
+def _tile_view(kind, path, tiles_dir):
+    """Replace a rendered PNG with a WebP preview and tile pyramid; returns (preview path, manifest)"""
+    tiles = build_pyramid(path, os.path.join(tiles_dir, kind))
+    os.remove(path)
+    print(f"{IMAGE_KEYS[kind][2]} tiled: {tiles['tile_count']} tiles, {tiles['bytes']} bytes", file=sys.stderr)
+    return tiles['preview_path'], tiles
+
+def _download_view(kind, image, params, tiles_dir=None):
+    """
+    Generate a thumbnail URL for one view and download it to a temp file.
+    
+    With tiles_dir, the PNG is replaced by a WebP preview and tile pyramid
+    under tiles_dir/<kind>, and the event's path is the preview.
+    """
+    label = IMAGE_KEYS[kind][2]
+    url = None
+    path = None
+    size = 0
+    tiles = None
+    try:
+        with metrics.track_call('earth_engine', 'thumbnail_url'):
+            url = image.getThumbURL(params)
+        print(f"Downloading {label} image...", file=sys.stderr)
+        with metrics.track_call('earth_engine', 'image_download'):
+            response = requests.get(url, timeout=45)
+        if response.status_code != 200:
+            metrics.EXTERNAL_CALL_ERRORS.labels(service='earth_engine', operation='image_download').inc()
+        else:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
+                f.write(response.content)
+                path = f.name
+            size = len(response.content)
+            metrics.IMAGE_BYTES.labels(kind=kind).inc(size)
+            print(f"{label} image saved: {size} bytes", file=sys.stderr)
+            
+            if tiles_dir:
+                path, tiles = _tile_view(kind, path, tiles_dir)
+    except requests.Timeout as timeout_error:
+        print(f"Warning: {label} image download timeout (will continue with available images): {timeout_error}", file=sys.stderr)
+    except Exception as download_error:
+        print(f"Warning: Could not download {label} image (will continue with available): {download_error}", file=sys.stderr)
+    
+    event = {'event': 'image', 'kind': kind, 'url': url, 'path': path, 'bytes': size}
+    if tiles:
+        event['tiles'] = tiles
+    return event
+
+class _SceneGroup:
+    """Coalesced requests sharing one scene lookup and raster download"""
+    
+    def __init__(self):
+        self.points = []
+        self.ready = threading.Event()
+        self.scene = None
+        self.raster = None
+        self.error = None
+
+_scene_groups = {}
+_scene_groups_lock = threading.Lock()
+
+def _fetch_shared_raster(points, scene_mode):
+    """
+    One scene search and one NPY raster download covering every point.
+    
+    points are (latitude, longitude, reach in metres); the raster spans their
+    union bounding box on a 10 m EPSG:4326 grid.
+    
+    Returns:
+        (scene metadata dict, SceneRaster)
+    """
+    _initialize_earth_engine()
+    
+    west = south = float('inf')
+    east = north = float('-inf')
+    for latitude, longitude, reach in points:
+        lat_offset, lon_offset = degrees_for_meters(reach, latitude)
+        west, east = min(west, longitude - lon_offset), max(east, longitude + lon_offset)
+        south, north = min(south, latitude - lat_offset), max(north, latitude + lat_offset)
+    bounds = ee.Geometry.Rectangle([west, south, east, north])
+    
+    collection, window_days, cloud_limit = _progressive_collection(bounds, datetime.now())
+    sentinel, cloud_coverage, image_date = _scene_image(collection, scene_mode)
+    
+    with metrics.track_call('earth_engine', 'metrics'):
+        scene = ee.Dictionary({
+            'cloud_coverage': cloud_coverage,
+            'image_date': image_date,
+            'search_window_days': window_days,
+            'max_cloud_percentage': cloud_limit,
+            'scene_count': collection.size()
+        }).getInfo()
+    
+    width, height = grid_dimensions(west, south, east, north)
+    with metrics.track_call('earth_engine', 'raster_url'):
+        url = sentinel.select(list(RASTER_BANDS)).toUint16().getDownloadURL({
+            'region': bounds,
+            'dimensions': f"{width}x{height}",
+            'crs': 'EPSG:4326',
+            'format': 'NPY'
+        })
+    print(f"Downloading shared {width}x{height} raster for {len(points)} parcel(s)...", file=sys.stderr)
+    with metrics.track_call('earth_engine', 'raster_download'):
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+    metrics.IMAGE_BYTES.labels(kind='shared_raster').inc(len(response.content))
+    
+    raster = SceneRaster.from_npy(np.load(io.BytesIO(response.content)), west, south, east, north)
+    return scene, raster
+
+def _shared_scene(latitude, longitude, reach_m, scene_mode, run_fetch=None):
+    """
+    Join (or open) the scene group for this point's geohash cell, date and scene mode.
+    
+    The first request waits SATELLITE_COALESCE_WINDOW_MS for neighbours to
+    join, then fetches one raster for all of them; the others wait for it.
+    run_fetch(fn, *args) runs the fetch itself, e.g. in a bounded stage queue,
+    so only the fetch (not the waiting) needs a slot there.
+    
+    Returns:
+        (scene metadata dict, SceneRaster, number of requests in the group)
+    """
+    key = (geohash.encode(latitude, longitude, COALESCE_PRECISION), datetime.now().strftime('%Y-%m-%d'), scene_mode)
+    with _scene_groups_lock:
+        group = _scene_groups.get(key)
+        leader = group is None
+        if leader:
+            group = _scene_groups[key] = _SceneGroup()
+        group.points.append((latitude, longitude, reach_m))
+    metrics.CACHE_REQUESTS.labels(cache='scene_groups', result='miss' if leader else 'hit').inc()
+    
+    if leader:
+        time.sleep(SATELLITE_COALESCE_WINDOW_MS / 1000)
+        with _scene_groups_lock:
+            # Later arrivals open a new group
+            del _scene_groups[key]
         try:
-            ee.Authenticate()
-        except Exception as auth_error:
-            # If already authenticated, this will fail but we can continue
-            print(f"Note: Authentication status: {auth_error}", file=sys.stderr)
+            if run_fetch is None:
+                group.scene, group.raster = _fetch_shared_raster(group.points, scene_mode)
+            else:
+                group.scene, group.raster = run_fetch(_fetch_shared_raster, group.points, scene_mode)
+        except Exception as e:
+            group.error = e
+        finally:
+            group.ready.set()
+    else:
+        group.ready.wait()
+    
+    if group.error is not None:
+        raise Exception(f"Shared scene fetch failed: {group.error}")
+    return group.scene, group.raster, len(group.points)
+
+def _render_local_view(kind, raster, latitude, longitude, tiles_dir=None):
+    """Render one view of a parcel from the shared raster; same event shape as _download_view"""
+    label = IMAGE_KEYS[kind][2]
+    path = None
+    size = 0
+    tiles = None
+    try:
+        image = raster.render(VIEW_PARAMS[kind], latitude, longitude, COALESCE_CROP_M, COALESCE_CROP_SIZE)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
+            image.save(f, 'PNG')
+            path = f.name
+        size = os.path.getsize(path)
+        print(f"{label} image rendered: {size} bytes", file=sys.stderr)
         
-        # Initialize Earth Engine with project ID
-        ee.Initialize(project=project_id)
+        if tiles_dir:
+            path, tiles = _tile_view(kind, path, tiles_dir)
+    except Exception as render_error:
+        print(f"Warning: Could not render {label} image (will continue with available): {render_error}", file=sys.stderr)
+    
+    event = {'event': 'image', 'kind': kind, 'url': None, 'path': path, 'bytes': size}
+    if tiles:
+        event['tiles'] = tiles
+    return event
+
+def _metrics_event(latitude, longitude, scene, ndvi_value, area_sqm, scene_mode):
+    if ndvi_value is None:
+        ndvi_value = 0.5
+    return {
+        'event': 'metrics',
+        'latitude': latitude,
+        'longitude': longitude,
+        'area_sqm': round(area_sqm, 2),
+        'ndvi': round(ndvi_value, 4),
+        'cloud_coverage': round(scene.get('cloud_coverage') or 0, 2),
+        'resolution_meters': 10,
+        'image_date': scene.get('image_date') or 'N/A',
+        'satellite': 'Sentinel-2',
+        'scene_mode': scene_mode,
+        'search_window_days': scene.get('search_window_days'),
+        'max_cloud_percentage': scene.get('max_cloud_percentage'),
+        'scene_count': scene.get('scene_count')
+    }
+
+def _tiles_dir(image_mode):
+    if image_mode != 'tiles':
+        return None
+    if SATELLITE_TILES_DIR:
+        os.makedirs(SATELLITE_TILES_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix='satellite-tiles-', dir=SATELLITE_TILES_DIR)
+
+def _satellite_result(metrics_event, images, tiles_dir, image_quality):
+    result = {key: value for key, value in metrics_event.items() if key != 'event'}
+    for kind in IMAGE_VIEWS:
+        url_key, _, _ = IMAGE_KEYS[kind]
+        result[url_key] = images.get(kind, {}).get('url')
+    for kind in IMAGE_VIEWS:
+        _, path_key, _ = IMAGE_KEYS[kind]
+        result[path_key] = images.get(kind, {}).get('path')
+    result['image_quality'] = image_quality
+    if tiles_dir:
+        # Paths above are the WebP previews; the pyramids live under tiles_dir
+        result['image_quality'] = 'WebP previews + 256px tile pyramid (up to 2048x2048)'
+        result['tiles_dir'] = tiles_dir
+        result['tiles'] = {kind: images[kind]['tiles'] for kind in IMAGE_VIEWS if images.get(kind, {}).get('tiles')}
+    result['recommended_view'] = 'cir_image_url'  # CIR is clearest for land analysis
+    return result
+
+def _iter_coalesced_events(latitude, longitude, image_mode, scene_mode, roi_stats, run_fetch=None):
+    """iter_satellite_events computed locally from a raster shared with neighbouring requests"""
+    reach = max([ROI_RADIUS_M, COALESCE_CROP_M] + (roi_stats['radii'] if roi_stats else []))
+    scene, raster, group_size = _shared_scene(latitude, longitude, reach, scene_mode, run_fetch)
+    
+    metrics_event = _metrics_event(
+        latitude, longitude, scene, raster.mean_index('ndvi', latitude, longitude, ROI_RADIUS_M),
+        math.pi * ROI_RADIUS_M ** 2, scene_mode
+    )
+    # The images are upsampled crops of the shared 10 m raster, not 2048 px Earth Engine renders
+    metrics_event['coalesced'] = True
+    metrics_event['coalesced_requests'] = group_size
+    metrics_event['image_size_px'] = COALESCE_CROP_SIZE
+    metrics_event['image_extent_m'] = 2 * COALESCE_CROP_M
+    if roi_stats:
+        metrics_event['roi_stats'] = raster.roi_statistics(
+            latitude, longitude, roi_stats['radii'], roi_stats['indices'], roi_stats['percentiles']
+        )
+    yield metrics_event
+    
+    images = {}
+    tiles_dir = _tiles_dir(image_mode)
+    for kind in IMAGE_VIEWS:
+        image_event = _render_local_view(kind, raster, latitude, longitude, tiles_dir)
+        images[kind] = image_event
+        yield image_event
+    
+    crop_px = round(2 * COALESCE_CROP_M / 10)
+    result = _satellite_result(
+        metrics_event, images, tiles_dir,
+        f'{COALESCE_CROP_SIZE}x{COALESCE_CROP_SIZE} render of a {crop_px}px crop from a shared 10 m raster'
+    )
+    yield {'event': 'done', 'result': result}
+
+def iter_satellite_events(latitude, longitude, image_mode=None, scene_mode=None, roi_stats=None,
+                          run_fetch=None, coalesce=False):
+    """
+    Fetch satellite data as a stream of events.
+    
+    image_mode is 'png' (default, or SATELLITE_IMAGE_MODE) or 'tiles'.
+    scene_mode is 'best' (default, or SATELLITE_SCENE_MODE) or 'median'.
+    roi_stats adds index statistics around the point for several radii,
+    e.g. {'radii': [50, 250], 'indices': ['ndvi', 'ndbi']} (True for defaults);
+    they are returned as roi_stats[radius][index] = {mean, stddev, p10, ...}.
+    
+    With coalesce and SATELLITE_COALESCE_WINDOW_MS set, concurrent requests
+    for nearby points share one scene and raster, and metrics and images are
+    computed locally from it (results are marked `coalesced`). Only callers
+    handling many requests in one process should pass coalesce.
+    run_fetch(fn, *args), if given, runs the shared fetch (see _shared_scene).
+    
+    Yields, in order:
+        {'event': 'metrics', ...}   area, NDVI, cloud coverage and image date,
+                                    as soon as they are computed
+        {'event': 'image', ...}     one per rendered view, as each download finishes
+        {'event': 'done', 'result': {...}}   the full fetch_satellite_data result
+    """
+    image_mode = image_mode or SATELLITE_IMAGE_MODE
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"image_mode must be one of {', '.join(IMAGE_MODES)}")
+    scene_mode = scene_mode or SATELLITE_SCENE_MODE
+    if scene_mode not in SCENE_MODES:
+        raise ValueError(f"scene_mode must be one of {', '.join(SCENE_MODES)}")
+    roi_stats = _roi_stats_request(roi_stats)
+    
+    try:
+        if coalesce and SATELLITE_COALESCE_WINDOW_MS > 0:
+            yield from _iter_coalesced_events(latitude, longitude, image_mode, scene_mode, roi_stats, run_fetch)
+            return
+        
+        _initialize_earth_engine()
         
         # Create point of interest
         point = ee.Geometry.Point([longitude, latitude])
         
         # Create buffer area (100m radius) for calculations
-        roi = point.buffer(100)
+        roi = point.buffer(ROI_RADIUS_M)
         
-        # Get recent Sentinel-2 imagery with date range
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        # Use HARMONIZED collection for better availability - sorted by cloud coverage
-        sentinel = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-            .filterBounds(roi) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .sort('CLOUDY_PIXEL_PERCENTAGE') \
-            .first()
+        # Recent Sentinel-2 imagery: 30 days under 10% cloud, widening to 90 and 365 days
+        collection, window_days, cloud_limit = _progressive_collection(roi, datetime.now())
+        sentinel, cloud_coverage, image_date = _scene_image(collection, scene_mode)
         
         # Calculate NDVI (vegetation health)
         ndvi = sentinel.normalizedDifference(['B8', 'B4']).rename('NDVI')
@@ -53,163 +546,98 @@ def fetch_satellite_data(latitude, longitude):
             geometry=roi,
             scale=10,
             maxPixels=1e9
-        ).getInfo()
-        
-        ndvi_value = ndvi_stats.get('NDVI', 0.5)
-        
-        # Calculate area
-        area_sqm = roi.area(maxError=1).getInfo()
+        )
         
-        # Image parameters - WITHOUT region parameter for full square rendering
-        # When region is omitted, GEE renders a proper square aligned to lat/lon
-        rgb_params = {
-            'bands': ['B4', 'B3', 'B2'],
-            'min': 0,
-            'max': 3000,
-            'dimensions': 2048
+        # NDVI, area, image metadata and any ROI statistics in a single round-trip
+        summary = {
+            'ndvi': ndvi_stats.get('NDVI'),
+            'area_sqm': roi.area(maxError=1),
+            'cloud_coverage': cloud_coverage,
+            'image_date': image_date,
+            'search_window_days': window_days,
+            'max_cloud_percentage': cloud_limit,
+            'scene_count': collection.size()
         }
+        if roi_stats:
+            summary['roi_stats'] = _roi_statistics(sentinel, point, roi_stats)
+        with metrics.track_call('earth_engine', 'metrics'):
+            scene = ee.Dictionary(summary).getInfo()
         
-        # Get NDVI visualization URL
-        ndvi_params = {
-            'min': 0,
-            'max': 1,
-            'palette': ['red', 'yellow', 'green'],
-            'dimensions': 2048
-        }
-        
-        # True Color composite for better clarity
-        true_color_params = {
-            'bands': ['B2', 'B3', 'B4'],
-            'min': 0,
-            'max': 2500,
-            'gamma': 1.2,
-            'dimensions': 2048
-        }
+        metrics_event = _metrics_event(latitude, longitude, scene, scene.get('ndvi'), scene['area_sqm'], scene_mode)
+        if roi_stats:
+            metrics_event['roi_stats'] = _nest_roi_statistics(scene.get('roi_stats') or [], roi_stats)
+        yield metrics_event
         
-        # Color Infrared (CIR) - best for vegetation analysis
-        cir_params = {
-            'bands': ['B8', 'B4', 'B3'],
-            'min': 0,
-            'max': 3000,
-            'dimensions': 2048
-        }
+        views = {kind: (ndvi if kind == 'ndvi' else sentinel, VIEW_PARAMS[kind]) for kind in IMAGE_VIEWS}
         
-        # Generate public URLs - simple approach without region for clarity
-        try:
-            print("Generating satellite image URLs...", file=sys.stderr)
-            rgb_url = sentinel.getThumbURL(rgb_params)
-            ndvi_url = ndvi.getThumbURL(ndvi_params)
-            true_color_url = sentinel.getThumbURL(true_color_params)
-            cir_url = sentinel.getThumbURL(cir_params)
-            
-            print("Downloading satellite images for IPFS storage...", file=sys.stderr)
-            # Download the images and save to temp files for IPFS upload
-            rgb_image_path = None
-            ndvi_image_path = None
-            cir_image_path = None
-            true_color_image_path = None
-            
-            # Download with parallel requests and longer timeout
-            try:
-                # Download RGB image
-                print(f"Downloading RGB image...", file=sys.stderr)
-                rgb_response = requests.get(rgb_url, timeout=45)
-                if rgb_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(rgb_response.content)
-                        rgb_image_path = f.name
-                        print(f"RGB image saved: {len(rgb_response.content)} bytes", file=sys.stderr)
-                
-                # Download NDVI image
-                print(f"Downloading NDVI image...", file=sys.stderr)
-                ndvi_response = requests.get(ndvi_url, timeout=45)
-                if ndvi_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(ndvi_response.content)
-                        ndvi_image_path = f.name
-                        print(f"NDVI image saved: {len(ndvi_response.content)} bytes", file=sys.stderr)
-                
-                # Download CIR image (Color Infrared - best for land analysis)
-                print(f"Downloading CIR image...", file=sys.stderr)
-                cir_response = requests.get(cir_url, timeout=45)
-                if cir_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(cir_response.content)
-                        cir_image_path = f.name
-                        print(f"CIR image saved: {len(cir_response.content)} bytes", file=sys.stderr)
-                
-                # Download True Color image
-                print(f"Downloading True Color image...", file=sys.stderr)
-                true_color_response = requests.get(true_color_url, timeout=45)
-                if true_color_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(true_color_response.content)
-                        true_color_image_path = f.name
-                        print(f"True Color image saved: {len(true_color_response.content)} bytes", file=sys.stderr)
-                
-                print("All satellite images downloaded successfully!", file=sys.stderr)
-                        
-            except requests.Timeout as timeout_error:
-                print(f"Warning: Image download timeout (will continue with available images): {timeout_error}", file=sys.stderr)
-            except Exception as download_error:
-                print(f"Warning: Could not download all images (will continue with available): {download_error}", file=sys.stderr)
-                
-        except Exception as url_error:
-            print(f"Warning: Could not generate image URLs: {url_error}", file=sys.stderr)
-            rgb_url = None
-            ndvi_url = None
-            true_color_url = None
-            cir_url = None
-            rgb_image_path = None
-            ndvi_image_path = None
-            cir_image_path = None
-            true_color_image_path = None
+        # Generate URLs and download all views in parallel, reporting each as it lands
+        print("Downloading satellite images for IPFS storage...", file=sys.stderr)
+        images = {}
+        tiles_dir = _tiles_dir(image_mode)
+        with ThreadPoolExecutor(max_workers=len(views)) as pool:
+            futures = [pool.submit(_download_view, kind, image, params, tiles_dir) for kind, (image, params) in views.items()]
+            for future in as_completed(futures):
+                image_event = future.result()
+                images[image_event['kind']] = image_event
+                yield image_event
+        print("All satellite image downloads finished", file=sys.stderr)
         
-        # Get image metadata
-        image_info = sentinel.getInfo()
-        properties = image_info['properties']
-        
-        result = {
-            'latitude': latitude,
-            'longitude': longitude,
-            'area_sqm': round(area_sqm, 2),
-            'ndvi': round(ndvi_value, 4),
-            'cloud_coverage': round(properties.get('CLOUDY_PIXEL_PERCENTAGE', 0), 2),
-            'resolution_meters': 10,
-            'image_date': properties.get('GENERATION_TIME', 'N/A'),
-            'satellite': 'Sentinel-2',
-            'rgb_image_url': rgb_url,
-            'ndvi_image_url': ndvi_url,
-            'true_color_url': true_color_url,
-            'cir_image_url': cir_url,
-            'rgb_image_path': rgb_image_path,
-            'ndvi_image_path': ndvi_image_path,
-            'cir_image_path': cir_image_path,
-            'true_color_image_path': true_color_image_path,
-            'image_quality': 'ULTRA HIGH (2048x2048 resolution)',
-            'recommended_view': 'cir_image_url'  # CIR is clearest for land analysis
-        }
-        
-        return result
+        result = _satellite_result(metrics_event, images, tiles_dir, 'ULTRA HIGH (2048x2048 resolution)')
+        yield {'event': 'done', 'result': result}
         
     except Exception as e:
         # Fail with real error - no mock data
         print(f"Error: Satellite service failed: {e}", file=sys.stderr)
         raise Exception(f"Satellite service failed: {str(e)}")
 
+def fetch_satellite_data(latitude, longitude, image_mode=None, scene_mode=None, roi_stats=None):
+    """Fetch satellite imagery and metrics with high resolution"""
+    for event in iter_satellite_events(latitude, longitude, image_mode, scene_mode, roi_stats):
+        if event['event'] == 'done':
+            return event['result']
+    raise Exception("Satellite service failed: no result produced")
+
 if __name__ == "__main__":
-    # Read input from stdin or args
+    metrics.start_exporters()
+    
+    # One request per process, so this entry point never coalesces (see SATELLITE_COALESCE_WINDOW_MS)
+    # Read input from stdin or args; --stream emits JSON-lines events as they happen
+    # --format msgpack writes length-prefixed frames, --omit drops fields (see src/utils/cli.py)
+    # --tiles writes WebP previews and tile pyramids instead of full-size PNGs
+    stream = '--stream' in sys.argv
+    image_mode = 'tiles' if '--tiles' in sys.argv else None
+    # --composite uses a cloud-masked median of the search window instead of one scene
+    scene_mode = 'median' if '--composite' in sys.argv else None
+    # --radii 50,250,500 and/or --indices ndvi,ndbi,ndwi add multi-radius index statistics
+    radii = read_list_option('--radii')
+    indices = read_list_option('--indices')
+    roi_stats = {'radii': radii, 'indices': indices} if radii or indices else None
+    # --profile (or "profile": true) writes a flamegraph profile (see src/utils/profiling.py)
+    args = positional_args()
     try:
-        if len(sys.argv) > 2:
-            lat = float(sys.argv[1])
-            lon = float(sys.argv[2])
+        if len(args) >= 2:
+            lat = float(args[0])
+            lon = float(args[1])
+            input_data = {}
         else:
             input_data = json.loads(sys.stdin.read())
             lat = input_data['latitude']
             lon = input_data['longitude']
+            stream = stream or bool(input_data.get('stream'))
+            image_mode = image_mode or input_data.get('image_mode')
+            scene_mode = scene_mode or input_data.get('scene_mode')
+            roi_stats = roi_stats or input_data.get('roi_stats')
         
-        result = fetch_satellite_data(lat, lon)
-        print(json.dumps(result))
+        with profile_request('satellite', input_data):
+            if stream:
+                for event in iter_satellite_events(lat, lon, image_mode, scene_mode, roi_stats):
+                    write_result(event)
+            else:
+                result = fetch_satellite_data(lat, lon, image_mode, scene_mode, roi_stats)
+                write_result(result)
     except Exception as e:
-        print(json.dumps({"error": str(e)}))
-        sys.exit(1)
\ No newline at end of file
+        if stream:
+            write_result({"event": "error", "error": str(e)})
+        else:
+            write_result({"error": str(e)})
+        sys.exit(1)
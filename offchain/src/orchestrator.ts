@@ -10,6 +10,8 @@ import { submitVerification, submitRejection, submitToConsensusEngine, submitTok
 import path from 'path';
 import * as pdfParse from 'pdf-parse';
 import { extractTextWithOCR } from './utils/ocrService';
+import { putDocument } from './utils/documentStore';
+import { fetchSatellite, runAnalysisPipeline, PipelineBusyError } from './services/pipelineClient';
 import fs from 'fs';
 import FormData from 'form-data';
 import axios from 'axios';
@@ -296,6 +298,11 @@ export async function processVerificationRequest(request: VerificationRequest) {
     logger.info(`✅ Satellite data: ${satelliteData.area_sqm} sqm, NDVI ${satelliteData.ndvi}`);
     logger.info(`   Cloud coverage: ${satelliteData.cloud_coverage}%, Resolution: ${satelliteData.resolution_meters}m\n`);
     
+    // Step 1.4: Pin the tile pyramids (tiles mode) as one IPFS directory
+    if (satelliteData.tiles_dir) {
+      await pinTilePyramids(satelliteData, request.requestId);
+    }
+    
     // Step 1.5: Upload satellite images to IPFS if available
     if (satelliteData.rgb_image_path || satelliteData.ndvi_image_path || satelliteData.cir_image_path || satelliteData.true_color_image_path) {
       logger.info('📸 Step 1.5: Uploading satellite images to IPFS (Ultra High Resolution - 2048x2048)...');
@@ -305,7 +312,7 @@ export async function processVerificationRequest(request: VerificationRequest) {
           const rgbFormData = new FormData();
           rgbFormData.append('file', fs.createReadStream(satelliteData.rgb_image_path));
           rgbFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_rgb_${request.requestId}.png`
+            name: `satellite_rgb_${request.requestId}${path.extname(satelliteData.rgb_image_path) || '.png'}`
           }));
           
           const rgbResponse = await axios.post(
@@ -330,7 +337,7 @@ export async function processVerificationRequest(request: VerificationRequest) {
           const ndviFormData = new FormData();
           ndviFormData.append('file', fs.createReadStream(satelliteData.ndvi_image_path));
           ndviFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_ndvi_${request.requestId}.png`
+            name: `satellite_ndvi_${request.requestId}${path.extname(satelliteData.ndvi_image_path) || '.png'}`
           }));
           
           const ndviResponse = await axios.post(
@@ -355,7 +362,7 @@ export async function processVerificationRequest(request: VerificationRequest) {
           const cirFormData = new FormData();
           cirFormData.append('file', fs.createReadStream(satelliteData.cir_image_path));
           cirFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_cir_${request.requestId}.png`
+            name: `satellite_cir_${request.requestId}${path.extname(satelliteData.cir_image_path) || '.png'}`
           }));
           
           const cirResponse = await axios.post(
@@ -380,7 +387,7 @@ export async function processVerificationRequest(request: VerificationRequest) {
           const trueColorFormData = new FormData();
           trueColorFormData.append('file', fs.createReadStream(satelliteData.true_color_image_path));
           trueColorFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_true_color_${request.requestId}.png`
+            name: `satellite_true_color_${request.requestId}${path.extname(satelliteData.true_color_image_path) || '.png'}`
           }));
           
           const trueColorResponse = await axios.post(
@@ -465,25 +472,43 @@ export async function processVerificationRequest(request: VerificationRequest) {
       }
     }
     
-    // Step 2: Prepare analysis package with document content
+    // Remove the local tile pyramids (pinned above, or not needed)
+    if (satelliteData.tiles_dir) {
+      try {
+        fs.rmSync(satelliteData.tiles_dir, { recursive: true, force: true });
+        logger.info(`   🗑️  Cleaned up temp tiles directory\n`);
+      } catch (cleanupError) {
+        logger.warn(`   ⚠️  Could not delete temp tiles directory: ${cleanupError}`);
+      }
+      for (const manifest of Object.values<any>(satelliteData.tiles || {})) {
+        delete manifest.dir;
+        delete manifest.preview_path;
+      }
+      delete satelliteData.tiles_dir;
+    }
+    
+    // Step 2: Prepare analysis package; agents read documents from the local store by hash
+    const documentRefs = documentContents.map(content => putDocument(content));
     const analysisPackage = {
       request_id: request.requestId,
+      owner: request.requester,
       latitude: request.latitude,
       longitude: request.longitude,
       location: `${request.latitude},${request.longitude}`,
       satellite_data: satelliteData,
       document_count: request.documentHashes.length,
       document_hashes: request.documentHashes,
-      document_contents: documentContents
+      document_refs: documentRefs
     };
     
-    // Step 3: Run all 3 AI agents in parallel
+    // Step 3: Run all 3 AI agents in parallel, through the shared pipeline's stage queues
     logger.info('🤖 Step 2: Running 3 AI agents in parallel...');
-    const [agent1Result, agent2Result, agent3Result] = await Promise.all([
-      runAgent('agent1.py', analysisPackage, 'Groq'),
-      runAgent('agent2.py', analysisPackage, 'OpenRouter'),
-      runAgent('agent3.py', analysisPackage, 'Gemini')
-    ]);
+    logger.info(`   🔍 Sending ${documentRefs.length} document reference(s) to the analysis pipeline`);
+    const analysis = await runAnalysisPipeline(analysisPackage);
+    const [agent1Result, agent2Result, agent3Result] = analysis.agents as AgentResponse[];
+    logAgentDocumentAnalysis(agent1Result, 'Groq');
+    logAgentDocumentAnalysis(agent2Result, 'OpenRouter');
+    logAgentDocumentAnalysis(agent3Result, 'Gemini');
     
     // Filter out errors
     const validResponses: AgentResponse[] = [];
@@ -704,6 +729,9 @@ export async function processVerificationRequest(request: VerificationRequest) {
     });
     logger.info('═══════════════════════════════════════════════════════════════\n');
     
+    // Record the consensus in the local comparables index (first price source for later requests)
+    await recordConsensusValuation(request, consensus.finalValuation, satelliteData);
+    
     // Step 6: Submit to blockchain
     logger.info('⛓️  Step 5: Submitting to blockchain...');
     
@@ -850,6 +878,10 @@ export async function processVerificationRequest(request: VerificationRequest) {
         logger.error('❌ Failed to submit rejection to blockchain:', submitError);
         throw submitError;
       }
+    } else if (error instanceof PipelineBusyError) {
+      // Overloaded (429): leave the request PENDING on chain so a later scan picks it up
+      logger.warn(`⏳ Analysis pipeline busy after ${duration}s - request left pending: ${errorMessage}`);
+      throw error;
     } else {
       logger.error('❌ Error processing request:', error);
       throw error;
@@ -857,138 +889,146 @@ export async function processVerificationRequest(request: VerificationRequest) {
   }
 }
 
+// Result keys (URL, local path) of each satellite view, as in satellite_service.py
+const SATELLITE_IMAGE_KEYS: Record<string, [string, string]> = {
+  rgb: ['rgb_image_url', 'rgb_image_path'],
+  ndvi: ['ndvi_image_url', 'ndvi_image_path'],
+  cir: ['cir_image_url', 'cir_image_path'],
+  true_color: ['true_color_url', 'true_color_image_path']
+};
+
 /**
- * Fetch satellite data using Python service
+ * Pin a satellite tiles_dir (one {z}/{x}/{y}.webp pyramid per view) as a single
+ * IPFS directory and point each manifest and preview URL at it. Viewers then
+ * fetch the preview or one zoom level's tiles from the gateway.
  */
-async function fetchSatelliteData(latitude: number, longitude: number): Promise<any> {
-  return new Promise((resolve, reject) => {
-    const pythonPath = process.env.PYTHON_PATH || 'python';
-    const scriptPath = path.join(__dirname, '..', 'satellite_service.py');
-    
-    const python = spawn(pythonPath, [scriptPath]);
-    
-    let dataString = '';
-    let errorString = '';
-    
-    python.stdout.on('data', (data) => {
-      dataString += data.toString();
-    });
-    
-    python.stderr.on('data', (data) => {
-      errorString += data.toString();
-    });
+async function pinTilePyramids(satelliteData: any, requestId: string): Promise<void> {
+  const tilesDir: string = satelliteData.tiles_dir;
+  const rootName = `satellite_tiles_${requestId}`;
+  try {
+    if (!fs.existsSync(tilesDir)) {
+      return;
+    }
+    logger.info('🧩 Step 1.4: Pinning satellite tile pyramids to IPFS...');
     
-    python.on('close', (code) => {
-      if (code !== 0) {
-        reject(new Error(`Satellite service failed: ${errorString}`));
-      } else {
-        try {
-          const result = JSON.parse(dataString);
-          resolve(result);
-        } catch (e) {
-          reject(new Error(`Failed to parse satellite data: ${dataString}`));
+    const formData = new FormData();
+    const addDirectory = (dir: string) => {
+      for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+        const fullPath = path.join(dir, entry.name);
+        if (entry.isDirectory()) {
+          addDirectory(fullPath);
+        } else {
+          const relativePath = path.relative(tilesDir, fullPath).split(path.sep).join('/');
+          formData.append('file', fs.createReadStream(fullPath), { filepath: `${rootName}/${relativePath}` });
         }
       }
-    });
+    };
+    addDirectory(tilesDir);
+    formData.append('pinataMetadata', JSON.stringify({ name: rootName }));
     
-    // Send input
-    python.stdin.write(JSON.stringify({ latitude, longitude }));
-    python.stdin.end();
+    const response = await axios.post(
+      'https://api.pinata.cloud/pinning/pinFileToIPFS',
+      formData,
+      {
+        headers: {
+          'Authorization': `Bearer ${process.env.PINATA_JWT}`,
+          ...formData.getHeaders()
+        },
+        maxBodyLength: Infinity
+      }
+    );
     
-    // Timeout after 180 seconds (3 minutes) - downloading 4x 2048x2048 images takes time
-    setTimeout(() => {
-      python.kill();
-      reject(new Error('Satellite service timeout (3 min limit)'));
-    }, 180000);
-  });
+    const baseUrl = `https://gateway.pinata.cloud/ipfs/${response.data.IpfsHash}`;
+    satelliteData.tiles_url = baseUrl;
+    for (const [kind, manifest] of Object.entries<any>(satelliteData.tiles || {})) {
+      manifest.preview_url = `${baseUrl}/${kind}/preview.webp`;
+      manifest.tile_url_template = `${baseUrl}/${kind}/${manifest.tile_template}`;
+      
+      // The previews are already pinned inside the directory - no separate upload in Step 1.5
+      const [urlKey, pathKey] = SATELLITE_IMAGE_KEYS[kind] || [];
+      if (urlKey) {
+        satelliteData[urlKey] = manifest.preview_url;
+        delete satelliteData[pathKey];
+      }
+    }
+    logger.info(`   ✅ Tile pyramids pinned: ${response.data.IpfsHash}`);
+    logger.info(`   🔗 Tiles URL: ${baseUrl}\n`);
+  } catch (error) {
+    logger.error(`❌ Failed to pin tile pyramids to IPFS: ${error}`);
+    logger.warn('   ⚠️  Continuing verification without tile pyramids in IPFS');
+  }
+}
+
+/**
+ * Fetch satellite data through the shared analysis pipeline server, where
+ * concurrent requests for neighbouring parcels can share one raster download
+ */
+async function fetchSatelliteData(latitude: number, longitude: number): Promise<any> {
+  const satelliteData = await fetchSatellite(latitude, longitude);
+  if (satelliteData.coalesced) {
+    logger.info(`   🧩 Rendered from a raster shared by ${satelliteData.coalesced_requests} request(s): `
+      + `${satelliteData.image_size_px}px images of a ${satelliteData.image_extent_m} m crop`);
+  }
+  return satelliteData;
 }
 
 /**
- * Run a single AI agent
+ * Store a consensus valuation in the comparables index and locality price digest.
+ * Failures are logged only - recording must never block a submission.
  */
-async function runAgent(scriptName: string, data: any, agentName: string): Promise<AgentResponse> {
+async function recordConsensusValuation(request: VerificationRequest, valuation: number, satelliteData: any): Promise<void> {
   return new Promise((resolve) => {
     const pythonPath = process.env.PYTHON_PATH || 'python';
-    const scriptPath = path.join(__dirname, '..', scriptName);
-    
-    // Log what we're sending to the agent
-    logger.info(`   🔍 Sending to ${agentName}:`);
-    logger.info(`      - Document count: ${data.document_contents?.length || 0}`);
-    if (data.document_contents && data.document_contents.length > 0) {
-      data.document_contents.forEach((doc: string, idx: number) => {
-        const preview = doc.length > 100 ? doc.substring(0, 100) + '...' : doc;
-        logger.info(`      - Doc ${idx + 1}: ${doc.length} chars - "${preview}"`);
-      });
-    }
+    const scriptPath = path.join(__dirname, '..', 'src', 'services', 'comparablesIndex.py');
+    const record = {
+      latitude: request.latitude,
+      longitude: request.longitude,
+      valuation,
+      area_sqm: satelliteData.area_sqm,
+      ndvi: satelliteData.ndvi,
+      request_id: request.requestId
+    };
     
-    const python = spawn(pythonPath, [scriptPath]);
+    const python = spawn(pythonPath, [scriptPath, 'add', JSON.stringify(record)]);
     
-    let dataString = '';
     let errorString = '';
     
-    python.stdout.on('data', (data) => {
-      dataString += data.toString();
-    });
-    
     python.stderr.on('data', (data) => {
       errorString += data.toString();
     });
     
+    const timeout = setTimeout(() => {
+      python.kill();
+      logger.warn('⚠️  Comparables index update timed out');
+      resolve();
+    }, 10000);
+    
+    python.on('error', (error) => {
+      clearTimeout(timeout);
+      logger.warn(`⚠️  Could not record valuation in comparables index: ${error.message}`);
+      resolve();
+    });
+    
     python.on('close', (code) => {
+      clearTimeout(timeout);
       if (code !== 0) {
-        logger.error(`   ❌ ${agentName} stderr: ${errorString}`);
-        resolve({
-          valuation: 0,
-          confidence: 0,
-          reasoning: '',
-          risk_factors: [],
-          agent: agentName.toLowerCase(),
-          error: errorString || 'Agent failed'
-        });
-      } else {
-        try {
-          const result = JSON.parse(dataString);
-          
-          // Log what the agent returned regarding documents
-          if (result.document_verification) {
-            logger.info(`   📋 ${agentName} document analysis:`);
-            logger.info(`      - Is land document: ${result.document_verification.is_land_document}`);
-            logger.info(`      - Authenticity score: ${result.document_verification.authenticity_score}`);
-            if (result.document_verification.missing_fields?.length > 0) {
-              logger.info(`      - Missing fields: ${result.document_verification.missing_fields.join(', ')}`);
-            }
-          }
-          
-          resolve(result);
-        } catch (e) {
-          logger.error(`   ❌ ${agentName} parse error: ${dataString}`);
-          resolve({
-            valuation: 0,
-            confidence: 0,
-            reasoning: '',
-            risk_factors: [],
-            agent: agentName.toLowerCase(),
-            error: `Failed to parse response: ${dataString}`
-          });
-        }
+        logger.warn(`⚠️  Could not record valuation in comparables index: ${errorString}`);
       }
+      resolve();
     });
-    
-    // Send input
-    python.stdin.write(JSON.stringify(data));
-    python.stdin.end();
-    
-    // Timeout after 30 seconds
-    setTimeout(() => {
-      python.kill();
-      resolve({
-        valuation: 0,
-        confidence: 0,
-        reasoning: '',
-        risk_factors: [],
-        agent: agentName.toLowerCase(),
-        error: 'Agent timeout'
-      });
-    }, 30000);
   });
-}
\ No newline at end of file
+}
+
+/**
+ * Log what an agent concluded about the documents
+ */
+function logAgentDocumentAnalysis(result: AgentResponse, agentName: string) {
+  if (result.document_verification) {
+    logger.info(`   📋 ${agentName} document analysis:`);
+    logger.info(`      - Is land document: ${result.document_verification.is_land_document}`);
+    logger.info(`      - Authenticity score: ${result.document_verification.authenticity_score}`);
+    if (result.document_verification.missing_fields?.length > 0) {
+      logger.info(`      - Missing fields: ${result.document_verification.missing_fields.join(', ')}`);
+    }
+  }
+}
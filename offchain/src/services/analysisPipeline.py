@@ -0,0 +1,310 @@
+"""
+Analysis Pipeline
+Runs the three agents in one process, starting document verification before satellite data arrives
+"""
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, IO, Iterator, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import agent1
+import agent2
+import agent3
+from satellite_service import SATELLITE_COALESCE_WINDOW_MS, iter_satellite_events
+from src.services.priceOracle import get_market_valuation
+from src.utils.cli import read_payload, write_result
+from src.utils.jobQueue import DeadlineExceeded, QueueFull, StageQueues
+from src.utils import metrics
+
+AGENTS = [agent1, agent2, agent3]
+
+# Pipeline stages that can be given their own concurrency limit
+STAGES = ('satellite', 'market', 'agents')
+
+# Limits of the long-lived `--serve` process, shared by every request it handles
+SERVE_SATELLITE_CONCURRENCY = int(os.getenv('PIPELINE_SATELLITE_CONCURRENCY', '2'))
+SERVE_MARKET_CONCURRENCY = int(os.getenv('PIPELINE_MARKET_CONCURRENCY', '4'))
+SERVE_AGENT_CONCURRENCY = int(os.getenv('PIPELINE_AGENT_CONCURRENCY', '6'))
+SERVE_MAX_DEPTH = int(os.getenv('PIPELINE_MAX_DEPTH', '32'))
+SERVE_MAX_REQUESTS = int(os.getenv('PIPELINE_MAX_REQUESTS', '16'))
+SERVE_OPS = ('analysis', 'satellite')
+
+
+def stage_queues(satellite: int, market: int, agents: int,
+                 max_depth: Optional[int] = None) -> StageQueues:
+    """Priority queues bounding concurrent calls per stage, shared across properties"""
+    return StageQueues({'satellite': satellite, 'market': market, 'agents': agents}, max_depth)
+
+
+def request_deadline(data: Dict) -> Optional[float]:
+    """
+    Absolute deadline (time.time()) of a request: `deadline` as a Unix
+    timestamp, or `deadline_s` seconds from now.
+    """
+    if data.get('deadline'):
+        return float(data['deadline'])
+    if data.get('deadline_s'):
+        return time.time() + float(data['deadline_s'])
+    return None
+
+
+class _Submitter:
+    """Sends one request's stage calls to the stage queues, or straight to a pool"""
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor], queues: Optional[StageQueues],
+                 priority: int = 0, deadline: Optional[float] = None):
+        self.executor = executor
+        self.queues = queues
+        self.priority = priority
+        self.deadline = deadline
+
+    def __call__(self, stage: str, fn: Callable, *args) -> Future:
+        if self.queues is None:
+            return self.executor.submit(fn, *args)
+        return self.queues.submit(stage, fn, *args, priority=self.priority, deadline=self.deadline)
+
+
+def _market_lookup(data: Dict, area_sqm: float) -> Dict:
+    latitude = data.get('latitude', 0)
+    longitude = data.get('longitude', 0)
+    location = data.get('location', f"{latitude},{longitude}")
+    try:
+        return get_market_valuation(location, latitude, longitude, area_sqm)
+    except Exception as e:
+        print(f"⚠️  Market price fetch failed: {e}", file=sys.stderr)
+        return {'error': str(e), 'prices': [], 'average_price': 0, 'confidence': 0}
+
+
+def start_document_verification(data: Dict, executor: Optional[ThreadPoolExecutor] = None,
+                                queues: Optional[StageQueues] = None) -> Dict:
+    """
+    Launch every agent's document verification phase.
+
+    Only the documents are needed, so this can run speculatively while the
+    satellite fetch is still in flight.
+
+    Returns:
+        Mapping of agent name to the Future of its verification result
+    """
+    submit = _Submitter(executor, queues, data.get('priority', 0), request_deadline(data))
+    return {agent.AGENT_NAME: submit('agents', agent.verify_documents, data) for agent in AGENTS}
+
+
+def _first_metrics(events: Iterator[Dict]) -> Dict:
+    """Advance a satellite event stream to its metrics event"""
+    for event in events:
+        if event['event'] == 'metrics':
+            return {key: value for key, value in event.items() if key != 'event'}
+    raise Exception("Satellite service failed: no metrics produced")
+
+
+def _finish_satellite(events: Iterator[Dict]) -> Optional[Dict]:
+    """Drain the rest of a satellite event stream (image downloads) and return the final result"""
+    for event in events:
+        if event['event'] == 'done':
+            return event['result']
+    return None
+
+
+def _satellite_events(data: Dict, submit: '_Submitter', coalesce: bool) -> Iterator[Dict]:
+    return iter_satellite_events(
+        data['latitude'], data['longitude'], data.get('image_mode'), data.get('scene_mode'),
+        data.get('roi_stats'), run_fetch=lambda fn, *args: submit('satellite', fn, *args).result(),
+        coalesce=coalesce
+    )
+
+
+def fetch_satellite(data: Dict, queues: StageQueues) -> Dict:
+    """
+    Full satellite result for one point, fetched through the shared satellite
+    stage (the server's `satellite` op). With SATELLITE_COALESCE_WINDOW_MS
+    set, concurrent requests for neighbouring points share one raster.
+    """
+    submit = _Submitter(None, queues, data.get('priority', 0), request_deadline(data))
+    coalesce = SATELLITE_COALESCE_WINDOW_MS > 0
+    events = _satellite_events(data, submit, coalesce)
+    if coalesce:
+        # Neighbours gather on this thread; only the shared fetch takes a satellite slot
+        result = _finish_satellite(events)
+    else:
+        result = submit('satellite', _finish_satellite, events).result()
+    if result is None:
+        raise Exception("Satellite service failed: no result produced")
+    return result
+
+
+def _shed_result(name: str, error: Exception) -> Dict:
+    """Agent result for a job the queue refused or dropped"""
+    return {'error': f"Request shed: {error}", 'agent': name, 'shed': True}
+
+
+def run_property_analysis(data: Dict, executor: Optional[ThreadPoolExecutor] = None,
+                          queues: Optional[StageQueues] = None) -> Dict:
+    """
+    Analyze one property with all three agents.
+
+    Document verification starts immediately. Satellite metrics are awaited
+    next (image downloads keep going in the background), then the market
+    lookup runs, and each agent's valuation phase starts as soon as its own
+    verification is done.
+
+    Args:
+        data: Analysis payload; `satellite_data` is fetched if not present.
+              Optional `priority` (higher runs first) and `deadline` /
+              `deadline_s` apply to every queued stage call.
+        executor: Optional shared pool (needs at least 5 workers per property),
+                  used when no queues are given
+        queues: Optional per-stage queues from stage_queues()
+
+    Returns:
+        Dictionary with the satellite data and the agent results in agent order
+
+    Raises:
+        DeadlineExceeded / QueueFull when the satellite or market stage sheds
+        the request; agents that are shed get an error result instead.
+    """
+    own_executor = executor is None and queues is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=8)
+    submit = _Submitter(executor, queues, data.get('priority', 0), request_deadline(data))
+
+    try:
+        verifications = start_document_verification(data, executor, queues)
+
+        satellite_data = data.get('satellite_data')
+        images = None
+        if not satellite_data:
+            # Neighbours can only join a group when requests share the stage queues
+            coalesce = queues is not None and SATELLITE_COALESCE_WINDOW_MS > 0
+            events = _satellite_events(data, submit, coalesce)
+            if coalesce:
+                # Neighbours gather on this thread; only the shared fetch takes a satellite slot
+                satellite_data = _first_metrics(events)
+            else:
+                satellite_data = submit('satellite', _first_metrics, events).result()
+            images = submit('satellite', _finish_satellite, events)
+
+        market_data = data.get('market_data') or submit(
+            'market', _market_lookup, data, satellite_data.get('area_sqm', 200)
+        ).result()
+
+        valuation_data = dict(data, satellite_data=satellite_data, market_data=market_data)
+        agents_by_future = {future: name for name, future in verifications.items()}
+        valuations = {}
+        for future in as_completed(agents_by_future):
+            name = agents_by_future[future]
+            agent = next(a for a in AGENTS if a.AGENT_NAME == name)
+            try:
+                verification = future.result()
+            except (DeadlineExceeded, QueueFull) as e:
+                valuations[name] = _shed_result(name, e)
+                continue
+            valuations[name] = submit('agents', agent.value_property, valuation_data, verification)
+
+        results = []
+        for agent in AGENTS:
+            valuation = valuations[agent.AGENT_NAME]
+            if isinstance(valuation, Future):
+                try:
+                    valuation = valuation.result()
+                except (DeadlineExceeded, QueueFull) as e:
+                    valuation = _shed_result(agent.AGENT_NAME, e)
+            results.append(valuation)
+
+        if images is not None:
+            try:
+                satellite_data = images.result() or satellite_data
+            except (DeadlineExceeded, QueueFull):
+                # Metrics are already in; the valuation doesn't need the images
+                pass
+
+        return {
+            'satellite_data': satellite_data,
+            'market_data': market_data,
+            'agents': results
+        }
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def serve(requests: IO[str], responses: IO[str], queues: StageQueues,
+          max_requests: int = SERVE_MAX_REQUESTS) -> None:
+    """
+    Answer analysis requests from a line stream until it ends.
+
+    Each line is {"id": ..., "payload": {...}}, optionally with "op":
+    "analysis" (the default, run_property_analysis) or "satellite"
+    (fetch_satellite, so satellite fetches of separate requests can be
+    coalesced). Each answer is one line:
+    {"id", "status": 200, "result"}, or {"id", "status", "error"} where status
+    is 429 when the request was shed (too many requests in flight, a full
+    stage queue, a passed deadline, or every agent shed) and 400/500 for bad
+    input and failures. Requests run concurrently and share `queues`, so their
+    stage calls are limited, prioritised and shed together.
+    """
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_requests)
+
+    def respond(message: Dict):
+        with write_lock:
+            responses.write(json.dumps(message) + '\n')
+            responses.flush()
+
+    def handle(request_id, op: str, payload: Dict):
+        try:
+            if op == 'satellite':
+                respond({'id': request_id, 'status': 200, 'result': fetch_satellite(payload, queues)})
+                return
+            result = run_property_analysis(payload, queues=queues)
+            if all(agent.get('shed') for agent in result['agents']):
+                respond({'id': request_id, 'status': 429, 'error': result['agents'][0]['error']})
+            else:
+                respond({'id': request_id, 'status': 200, 'result': result})
+        except (QueueFull, DeadlineExceeded) as e:
+            respond({'id': request_id, 'status': 429, 'error': f"Request shed: {e}"})
+        except Exception as e:
+            respond({'id': request_id, 'status': 500, 'error': str(e)})
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_requests) as requests_pool:
+        for line in requests:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                request_id, payload = request.get('id'), request['payload']
+                op = request.get('op', 'analysis')
+            except (ValueError, KeyError, AttributeError) as e:
+                respond({'id': None, 'status': 400, 'error': f"Invalid request: {e}"})
+                continue
+            if op not in SERVE_OPS:
+                respond({'id': request_id, 'status': 400, 'error': f"Invalid request: unknown op {op!r}"})
+                continue
+            if not slots.acquire(blocking=False):
+                metrics.QUEUE_REJECTIONS.labels(stage='requests', reason='full').inc()
+                respond({'id': request_id, 'status': 429, 'error': f"Request shed: {max_requests} requests already in flight"})
+                continue
+            requests_pool.submit(handle, request_id, op, payload)
+
+
+if __name__ == "__main__":
+    # python -m src.services.analysisPipeline --input payload.json
+    # python -m src.services.analysisPipeline --serve   (JSON lines on stdin/stdout, see serve())
+    metrics.start_exporters()
+    if '--serve' in sys.argv[1:]:
+        # Only answers go to stdout; any stray prints from the services go to stderr
+        responses = sys.stdout
+        sys.stdout = sys.stderr
+        queues = stage_queues(SERVE_SATELLITE_CONCURRENCY, SERVE_MARKET_CONCURRENCY,
+                              SERVE_AGENT_CONCURRENCY, SERVE_MAX_DEPTH)
+        serve(sys.stdin, responses, queues)
+        queues.shutdown()
+    else:
+        input_data = read_payload()
+        write_result(run_property_analysis(input_data))
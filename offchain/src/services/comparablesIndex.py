@@ -0,0 +1,277 @@
+"""
+Comparables Index
+Local geohash index over completed valuations for instant price baselines
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.services.priceDigest import record_prices
+from src.utils import geohash
+
+COMPARABLES_INDEX_PATH = os.getenv(
+    'COMPARABLES_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.comparables', 'valuations.sqlite')
+)
+
+# Bucket levels from fine (~1.2 x 0.6 km cells) to coarse (~39 x 20 km cells)
+BUCKET_PRECISIONS = (6, 5, 4)
+GEOHASH_PRECISION = max(BUCKET_PRECISIONS) + 2
+# Parcels recorded without an id are keyed by their ~5 m geohash cell
+PARCEL_PRECISION = 9
+DEFAULT_K = 5
+DEFAULT_MAX_DISTANCE_M = 5000
+MIN_COMPARABLES = 3
+
+COLUMNS = ('parcel_id', 'request_id', 'latitude', 'longitude', 'geohash',
+           'valuation', 'area_sqm', 'price_per_sqm', 'ndvi', 'recorded_at')
+
+
+class ComparablesIndex:
+    """
+    Completed valuations in SQLite, indexed by geohash.
+
+    Each parcel keeps only its latest valuation (lat, lon, valuation, area,
+    NDVI). Queries read the 3x3 block of cells around the point as geohash
+    prefix ranges, starting at the finest level and moving coarser until the
+    k nearest hits are inside the searched block, so opening the index and
+    querying it never touch the rest of the file.
+    """
+
+    def __init__(self, path: str = COMPARABLES_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS valuations (
+                parcel_id TEXT PRIMARY KEY,
+                request_id TEXT,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                geohash TEXT NOT NULL,
+                valuation REAL NOT NULL,
+                area_sqm REAL NOT NULL,
+                price_per_sqm REAL NOT NULL,
+                ndvi REAL,
+                recorded_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS valuations_geohash ON valuations (geohash);
+            CREATE INDEX IF NOT EXISTS valuations_request ON valuations (request_id);
+        ''')
+        self._import_jsonl(os.path.splitext(path)[0] + '.jsonl')
+
+    def _import_jsonl(self, legacy_path: str):
+        """One-off import of the older append-only JSONL index, later lines winning"""
+        if not os.path.exists(legacy_path) or len(self):
+            return
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self.add(record['latitude'], record['longitude'], record['valuation'],
+                             record['area_sqm'], record.get('ndvi'), record.get('request_id'))
+                except (ValueError, KeyError):
+                    # Skip a torn last line from an interrupted write
+                    continue
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM valuations').fetchone()[0]
+
+    def add(self, latitude: float, longitude: float, valuation: float, area_sqm: float,
+            ndvi: Optional[float] = None, request_id: Optional[str] = None,
+            parcel_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Store a completed valuation, replacing any earlier one for the same
+        parcel. Returns the record, or None if it was skipped (unusable
+        area/valuation or an already recorded request).
+        """
+        if not area_sqm or area_sqm <= 0 or not valuation or valuation <= 0:
+            return None
+
+        record = {
+            'parcel_id': parcel_id or 'geohash:' + geohash.encode(latitude, longitude, PARCEL_PRECISION),
+            'request_id': request_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': geohash.encode(latitude, longitude, GEOHASH_PRECISION),
+            'valuation': valuation,
+            'area_sqm': area_sqm,
+            'price_per_sqm': valuation / area_sqm,
+            'ndvi': ndvi,
+            'recorded_at': time.time()
+        }
+
+        with self._lock, self._db:
+            if request_id and self._db.execute(
+                'SELECT 1 FROM valuations WHERE request_id = ?', (request_id,)
+            ).fetchone():
+                return None
+            self._db.execute(
+                f'INSERT OR REPLACE INTO valuations ({", ".join(COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(COLUMNS))})',
+                tuple(record[column] for column in COLUMNS)
+            )
+        return record
+
+    def _cell_records(self, cells: List[str]) -> List[Dict]:
+        records = []
+        with self._lock:
+            for cell in cells:
+                # Every geohash starting with `cell` sorts between it and cell + '~'
+                rows = self._db.execute(
+                    f'SELECT {", ".join(COLUMNS)} FROM valuations WHERE geohash >= ? AND geohash < ?',
+                    (cell, cell + '~')
+                ).fetchall()
+                records.extend(dict(zip(COLUMNS, row)) for row in rows)
+        return records
+
+    def nearest(self, latitude: float, longitude: float, k: int = DEFAULT_K,
+                max_distance_m: float = DEFAULT_MAX_DISTANCE_M) -> List[Dict]:
+        """k nearest comparables within max_distance_m, closest first"""
+        best = []
+        for precision in BUCKET_PRECISIONS:
+            scored = []
+            for record in self._cell_records(geohash.neighbours(latitude, longitude, precision)):
+                distance = geohash.haversine_m(latitude, longitude, record['latitude'], record['longitude'])
+                if distance <= max_distance_m:
+                    scored.append((distance, record))
+            best = heapq.nsmallest(k, scored, key=lambda item: item[0])
+
+            # Exact once nothing outside the searched block could be closer
+            covered = geohash.covered_radius_m(latitude, precision)
+            if max_distance_m <= covered or (len(best) >= k and best[-1][0] <= covered):
+                break
+
+        return [dict(record, distance_m=round(distance, 1)) for distance, record in best]
+
+    def price_baseline(self, latitude: float, longitude: float, k: int = DEFAULT_K,
+                       max_distance_m: float = DEFAULT_MAX_DISTANCE_M) -> Dict:
+        """
+        Inverse-distance weighted price per sqm from the k nearest comparables.
+
+        Returns:
+            Dictionary with price_per_sqm, comparable_count and the comparables used
+        """
+        comparables = self.nearest(latitude, longitude, k, max_distance_m)
+        if not comparables:
+            return {'price_per_sqm': 0, 'comparable_count': 0, 'comparables': []}
+
+        # Weight by 1/d^2, with a 25m floor so an exact match doesn't dominate completely
+        total_weight = 0.0
+        weighted_price = 0.0
+        for comparable in comparables:
+            weight = 1.0 / max(comparable['distance_m'], 25.0) ** 2
+            total_weight += weight
+            weighted_price += comparable['price_per_sqm'] * weight
+
+        return {
+            'price_per_sqm': weighted_price / total_weight,
+            'comparable_count': len(comparables),
+            'mean_distance_m': round(sum(c['distance_m'] for c in comparables) / len(comparables), 1),
+            'comparables': comparables
+        }
+
+
+_index: Optional[ComparablesIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> ComparablesIndex:
+    """Shared process-wide index, loaded on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ComparablesIndex()
+    return _index
+
+
+def record_valuation(latitude: float, longitude: float, valuation: float, area_sqm: float,
+                     ndvi: Optional[float] = None, request_id: Optional[str] = None,
+                     parcel_id: Optional[str] = None) -> Optional[Dict]:
+    """Store a completed (consensus) valuation in the shared index and the locality price digest"""
+    entry = get_index().add(latitude, longitude, valuation, area_sqm, ndvi, request_id, parcel_id)
+    if entry is not None:
+        try:
+            record_prices(latitude, longitude, [valuation])
+        except Exception as e:
+            print(f"Price digest update failed: {e}", file=sys.stderr)
+    return entry
+
+
+def get_comparables_valuation(latitude: float, longitude: float, area_sqm: float,
+                              k: int = DEFAULT_K, max_distance_m: float = DEFAULT_MAX_DISTANCE_M) -> Dict:
+    """
+    Value a parcel from nearby past valuations.
+
+    Returns an error dict (same shape as the search path) when there are
+    fewer than MIN_COMPARABLES within range.
+    """
+    baseline = get_index().price_baseline(latitude, longitude, k, max_distance_m)
+    count = baseline['comparable_count']
+
+    if count < MIN_COMPARABLES:
+        return {
+            'error': f'Only {count} comparable(s) within {max_distance_m}m',
+            'prices': [],
+            'average_price': 0,
+            'confidence': 0
+        }
+
+    valuations = sorted(c['valuation'] for c in baseline['comparables'])
+    price_per_sqm = baseline['price_per_sqm']
+
+    # More and closer comparables → higher confidence
+    distance_penalty = min(30, baseline['mean_distance_m'] / 100)
+    confidence = int(max(40, min(90, 50 + count * 8 - distance_penalty)))
+
+    return {
+        'source': 'comparables',
+        'average_price': int(sum(valuations) / count),
+        'median_price': int(valuations[count // 2]),
+        'min_price': int(valuations[0]),
+        'max_price': int(valuations[-1]),
+        'price_count': count,
+        'confidence': confidence,
+        'price_per_sqm': int(price_per_sqm),
+        'estimated_valuation': int(price_per_sqm * area_sqm) if area_sqm > 0 else 0,
+        'comparables': [
+            {
+                'latitude': c['latitude'],
+                'longitude': c['longitude'],
+                'distance_m': c['distance_m'],
+                'price_per_sqm': int(c['price_per_sqm'])
+            }
+            for c in baseline['comparables']
+        ]
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.comparablesIndex add '{"latitude": .., "longitude": .., "valuation": .., "area_sqm": ..}'
+    # python -m src.services.comparablesIndex query '{"latitude": .., "longitude": .., "area_sqm": ..}'
+    if len(sys.argv) < 3 or sys.argv[1] not in ('add', 'query'):
+        print("Usage: comparablesIndex.py add|query '<json>'", file=sys.stderr)
+        sys.exit(1)
+
+    data = json.loads(sys.argv[2])
+    if sys.argv[1] == 'add':
+        record = record_valuation(
+            data['latitude'], data['longitude'], data['valuation'], data['area_sqm'],
+            data.get('ndvi'), data.get('request_id'), data.get('parcel_id')
+        )
+        print(json.dumps({'recorded': record is not None}))
+    else:
+        start = time.perf_counter()
+        result = get_comparables_valuation(data['latitude'], data['longitude'], data.get('area_sqm', 0))
+        result['query_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        print(json.dumps(result, indent=2))
@@ -0,0 +1,374 @@
+"""
+Duplicate Index
+MinHash/LSH index over previously submitted documents for near-duplicate deed detection
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.utils import geohash, metrics
+
+DUPLICATE_INDEX_PATH = os.getenv(
+    'DUPLICATE_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.duplicates', 'index.sqlite')
+)
+
+# Similarity at which a document is flagged, and at which it is rejected outright
+FLAG_THRESHOLD = float(os.getenv('DUPLICATE_FLAG_THRESHOLD', '0.8'))
+REJECT_THRESHOLD = float(os.getenv('DUPLICATE_REJECT_THRESHOLD', '0.95'))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 16 bands x 8 rows: documents ~70% similar or more share a bucket with high probability
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+# Documents shorter than this (in words) carry too little text to compare
+MIN_WORDS = 20
+# Submissions this close together are treated as the same parcel
+SAME_PARCEL_RADIUS_M = float(os.getenv('DUPLICATE_SAME_PARCEL_RADIUS_M', '50'))
+# Candidate ids per SQL statement, well under SQLite's bound-variable limit
+QUERY_CHUNK = 500
+# Submission details stored with each document
+SUBMISSION_COLUMNS = ('parcel_id', 'owner', 'latitude', 'longitude')
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercased alphanumeric words - whitespace, punctuation and layout ignored"""
+    return _WORD_PATTERN.findall((text or '').lower())
+
+
+def content_hash(words: List[str]) -> str:
+    return hashlib.sha256(' '.join(words).encode('utf-8')).hexdigest()
+
+
+def minhash(words: List[str]) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of the document's word shingles"""
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # (a * h + b) mod p per permutation, minimised over shingles
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket key per LSH band"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        keys.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True))
+    return keys
+
+
+class DuplicateIndex:
+    """
+    Persistent LSH index backed by SQLite.
+
+    Each stored document keeps its MinHash signature plus one bucket row per
+    band, indexed by (band, bucket). A query only reads the documents sharing
+    at least one bucket, so its cost depends on the number of near matches
+    rather than on the size of the index.
+    """
+
+    def __init__(self, path: str = DUPLICATE_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                request_id TEXT,
+                signature BLOB NOT NULL,
+                word_count INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (content_hash, request_id)
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                document_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+            CREATE INDEX IF NOT EXISTS documents_hash ON documents (content_hash);
+        ''')
+        # Indexes created before submissions were recorded lack these columns
+        existing = {row[1] for row in self._db.execute('PRAGMA table_info(documents)')}
+        for column in SUBMISSION_COLUMNS:
+            if column not in existing:
+                kind = 'REAL' if column in ('latitude', 'longitude') else 'TEXT'
+                self._db.execute(f'ALTER TABLE documents ADD COLUMN {column} {kind}')
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def query(self, text: str, exclude_request_id: Optional[str] = None,
+              threshold: float = FLAG_THRESHOLD, limit: int = 5,
+              submission: Optional[Dict] = None) -> List[Dict]:
+        """
+        Stored documents whose estimated Jaccard similarity is at least threshold,
+        most similar first. Documents from exclude_request_id are ignored.
+
+        With a submission (parcel_id, owner, latitude, longitude), each match
+        says whether it came from the same parcel or the same owner.
+        """
+        words = normalize(text)
+        if len(words) < MIN_WORDS:
+            return []
+        exact = content_hash(words)
+        signature = minhash(words)
+        keys = band_keys(signature)
+
+        with self._lock:
+            candidate_ids = set()
+            for band, key in enumerate(keys):
+                rows = self._db.execute(
+                    'SELECT document_id FROM buckets WHERE band = ? AND bucket = ?', (band, key)
+                ).fetchall()
+                candidate_ids.update(row[0] for row in rows)
+            candidate_ids = sorted(candidate_ids)
+            candidates = []
+            for start in range(0, len(candidate_ids), QUERY_CHUNK):
+                chunk = candidate_ids[start:start + QUERY_CHUNK]
+                candidates.extend(self._db.execute(
+                    'SELECT id, content_hash, request_id, signature, created_at, '
+                    f'{", ".join(SUBMISSION_COLUMNS)} FROM documents WHERE id IN ({",".join("?" * len(chunk))})',
+                    chunk
+                ).fetchall())
+
+        matches = []
+        for document_id, stored_hash, request_id, stored_signature, created_at, *stored in candidates:
+            if exclude_request_id is not None and request_id == exclude_request_id:
+                continue
+            if stored_hash == exact:
+                similarity = 1.0
+            else:
+                similarity = float(np.mean(np.frombuffer(stored_signature, dtype=np.uint32) == signature))
+            if similarity >= threshold:
+                match = {
+                    'document_id': document_id,
+                    'request_id': request_id,
+                    'similarity': round(similarity, 3),
+                    'exact': stored_hash == exact,
+                    'created_at': created_at
+                }
+                match.update(_relation(submission or {}, dict(zip(SUBMISSION_COLUMNS, stored))))
+                matches.append(match)
+        matches.sort(key=lambda m: m['similarity'], reverse=True)
+        return matches[:limit]
+
+    def add(self, text: str, request_id: Optional[str] = None,
+            submission: Optional[Dict] = None) -> Optional[int]:
+        """
+        Store a document, with the submission's parcel_id, owner and
+        coordinates when given. Idempotent per (content, request_id), so several
+        agents recording the same submission store it once. Returns the row id,
+        or None when the text is too short to index or already stored.
+        """
+        words = normalize(text)
+        if len(words) < MIN_WORDS:
+            return None
+        signature = minhash(words)
+        details = _submission_details(submission or {})
+
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO documents (content_hash, request_id, signature, word_count, created_at, '
+                f'{", ".join(SUBMISSION_COLUMNS)}) VALUES (?, ?, ?, ?, ?, {", ".join("?" * len(SUBMISSION_COLUMNS))})',
+                (content_hash(words), request_id, signature.tobytes(), len(words), time.time(),
+                 *(details[column] for column in SUBMISSION_COLUMNS))
+            )
+            if cursor.rowcount == 0:
+                return None
+            document_id = cursor.lastrowid
+            self._db.executemany(
+                'INSERT INTO buckets (band, bucket, document_id) VALUES (?, ?, ?)',
+                [(band, key, document_id) for band, key in enumerate(band_keys(signature))]
+            )
+        return document_id
+
+
+def _submission_details(submission: Dict) -> Dict:
+    """parcel_id, owner (lowercased) and coordinates of a payload, None when absent"""
+    details = {column: submission.get(column) for column in SUBMISSION_COLUMNS}
+    for column in ('parcel_id', 'owner'):
+        if details[column] is not None:
+            details[column] = str(details[column]).strip().lower() or None
+    for column in ('latitude', 'longitude'):
+        try:
+            details[column] = float(details[column]) if details[column] is not None else None
+        except (TypeError, ValueError):
+            details[column] = None
+    return details
+
+
+def _relation(submission: Dict, stored: Dict) -> Dict:
+    """
+    Whether a stored document belongs to the same parcel or owner as a submission.
+
+    Same parcel means an equal parcel_id, or coordinates within
+    SAME_PARCEL_RADIUS_M. When either side lacks parcel details, an equal
+    owner stands in for it.
+    """
+    current = _submission_details(submission)
+    same_parcel = bool(current['parcel_id'] and current['parcel_id'] == stored['parcel_id'])
+    parcel_known = bool(current['parcel_id'] and stored['parcel_id'])
+    if current['latitude'] is not None and current['longitude'] is not None \
+            and stored['latitude'] is not None and stored['longitude'] is not None:
+        parcel_known = True
+        distance = geohash.haversine_m(current['latitude'], current['longitude'],
+                                       stored['latitude'], stored['longitude'])
+        same_parcel = same_parcel or distance <= SAME_PARCEL_RADIUS_M
+    same_owner = bool(current['owner'] and current['owner'] == stored['owner'])
+    return {
+        'same_parcel': same_parcel,
+        'same_owner': same_owner,
+        'resubmission': same_parcel or (same_owner and not parcel_known)
+    }
+
+
+_index: Optional[DuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> DuplicateIndex:
+    """Shared process-wide index, opened on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DuplicateIndex()
+    return _index
+
+
+def check_documents(texts: Iterable[str], request_id=None, record: bool = True,
+                    submission: Optional[Dict] = None) -> Dict:
+    """
+    Compare a submission's documents with everything submitted before.
+
+    Matches from the same request_id are ignored, and the documents are
+    recorded under it afterwards (only when a request_id is given, so
+    anonymous re-runs don't match themselves). `submission` is the analysis
+    payload; its parcel_id, owner and coordinates mark matches that are a
+    resubmission of the same parcel. Those are only flagged - a submission is
+    rejected only for a copy of another parcel's document. An unreadable index
+    does not fail verification, but is reported as `error` so the agents
+    can flag that the check did not run.
+
+    Returns:
+        {'duplicate': bool, 'reject': bool, 'matches': [...], 'error': str or None}
+        where duplicate means a match at least FLAG_THRESHOLD similar and reject
+        a match from another parcel at least REJECT_THRESHOLD similar
+    """
+    request_id = str(request_id) if request_id is not None else None
+    matches = []
+    error = None
+    try:
+        index = get_index()
+        for document_number, text in enumerate(texts, start=1):
+            for match in index.query(text, exclude_request_id=request_id, submission=submission):
+                matches.append(dict(match, document=document_number))
+            if record and request_id is not None:
+                index.add(text, request_id, submission)
+    except (sqlite3.Error, OSError) as e:
+        error = str(e)
+        print(f"Duplicate index unavailable: {e}", file=sys.stderr)
+        metrics.FALLBACKS.labels(component='duplicate_index', reason='index_unavailable').inc()
+
+    # Other parcels' copies first, so the rejection and red flag name them
+    matches.sort(key=lambda m: (not m['resubmission'], m['similarity']), reverse=True)
+    best = max((m['similarity'] for m in matches), default=0.0)
+    best_foreign = max((m['similarity'] for m in matches if not m['resubmission']), default=0.0)
+    metrics.CACHE_REQUESTS.labels(cache='duplicates', result='hit' if matches else 'miss').inc()
+    return {
+        'duplicate': best >= FLAG_THRESHOLD,
+        'reject': best_foreign >= REJECT_THRESHOLD,
+        'matches': matches,
+        'error': error
+    }
+
+
+def duplicate_red_flag(check: Dict) -> Optional[str]:
+    """Human-readable red flag for the closest match, or for a check that could not run"""
+    if not check['matches']:
+        if check.get('error'):
+            return f"Duplicate check unavailable ({check['error']})"
+        return None
+    match = check['matches'][0]
+    source = f"request {match['request_id']}" if match['request_id'] else 'an earlier submission'
+    kind = 'Exact copy' if match['exact'] else f"Near-duplicate ({match['similarity']:.0%} similar)"
+    if match['resubmission']:
+        return f"{kind} of a document from {source} for the same parcel (resubmission)"
+    return f"{kind} of a document from {source}"
+
+
+def duplicate_rejection(check: Dict) -> Dict:
+    """
+    Phase 1 verification fields for a submission rejected as a duplicate,
+    returned without calling a model.
+    """
+    match = check['matches'][0]
+    red_flag = duplicate_red_flag(check)
+    return {
+        "is_land_document": None,
+        "document_type_found": "duplicate submission",
+        "authenticity_score": 0,
+        "missing_fields": [],
+        "red_flags": [red_flag],
+        "findings": f"Rejected: {red_flag}",
+        "duplicate_of": match['request_id'],
+        "duplicate_similarity": match['similarity']
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.duplicateIndex add deed.txt [--request-id 42] [--parcel-id P1] [--owner 0xabc]
+    # python -m src.services.duplicateIndex query deed.txt
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Near-duplicate document index')
+    parser.add_argument('command', choices=['add', 'query'])
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--request-id')
+    parser.add_argument('--parcel-id')
+    parser.add_argument('--owner')
+    args = parser.parse_args()
+    submission = {'parcel_id': args.parcel_id, 'owner': args.owner}
+
+    index = get_index()
+    results = []
+    for path in args.paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        start = time.perf_counter()
+        if args.command == 'add':
+            results.append({'path': path, 'document_id': index.add(text, args.request_id, submission)})
+        else:
+            results.append({
+                'path': path,
+                'matches': index.query(text, exclude_request_id=args.request_id, submission=submission),
+                'query_ms': round((time.perf_counter() - start) * 1000, 3)
+            })
+    print(json.dumps(results, indent=2))
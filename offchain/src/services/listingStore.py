@@ -0,0 +1,328 @@
+"""
+Listing Store
+Memory-mapped columnar store of offline listing/registry prices with a spatial grid index
+"""
+import os
+import sys
+import csv
+import json
+import math
+import shutil
+import tempfile
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.services.priceDigest import DEFAULT_CURRENCY, record_price_array
+
+LISTING_STORE_PATH = os.getenv(
+    'LISTING_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.listings')
+)
+
+COLUMNS = ('lat', 'lon', 'price', 'area')
+DEFAULT_CELL_DEG = 0.01        # ~1.1km grid cells
+DEFAULT_RADIUS_M = 1000
+CHUNK_ROWS = 1_000_000
+MIN_LISTINGS = 5
+EARTH_RADIUS_M = 6371008.8
+
+SQFT_TO_SQM = 0.09290304
+AREA_UNITS = {'sqm': 1.0, 'sqft': SQFT_TO_SQM, 'acre': 4046.8564224, 'hectare': 10000.0}
+
+# Accepted CSV header names for each column
+HEADER_ALIASES = {
+    'lat': ('lat', 'latitude'),
+    'lon': ('lon', 'lng', 'long', 'longitude'),
+    'price': ('price', 'sale_price', 'listing_price', 'amount'),
+    'area': ('area', 'area_sqm', 'size', 'size_sqm')
+}
+
+
+def _grid_shape(cell_deg: float) -> Tuple[int, int]:
+    return int(math.ceil(180.0 / cell_deg)), int(math.ceil(360.0 / cell_deg))
+
+
+def _cell_ids(lat: np.ndarray, lon: np.ndarray, cell_deg: float) -> np.ndarray:
+    rows, cols = _grid_shape(cell_deg)
+    row = np.clip(((lat + 90.0) / cell_deg).astype(np.int64), 0, rows - 1)
+    col = np.clip(((lon + 180.0) / cell_deg).astype(np.int64), 0, cols - 1)
+    return row * cols + col
+
+
+def _resolve_headers(fieldnames: List[str]) -> Dict[str, str]:
+    lookup = {name.strip().lower(): name for name in fieldnames}
+    headers = {}
+    for column, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in lookup:
+                headers[column] = lookup[alias]
+                break
+        else:
+            raise ValueError(f"CSV is missing a '{column}' column (accepted: {', '.join(aliases)})")
+    return headers
+
+
+def _read_chunks(csv_path: str, area_factor: float) -> Iterator[np.ndarray]:
+    """Stream a CSV as (n, 4) float64 chunks, skipping unparseable or non-positive rows"""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        headers = _resolve_headers(reader.fieldnames or [])
+        keys = [headers[c] for c in COLUMNS]
+
+        rows = []
+        for record in reader:
+            try:
+                values = [float(str(record[k]).replace(',', '')) for k in keys]
+            except (TypeError, ValueError):
+                continue
+            if values[2] <= 0 or values[3] <= 0 or not (-90 <= values[0] <= 90 and -180 <= values[1] <= 180):
+                continue
+            values[3] *= area_factor
+            rows.append(values)
+            if len(rows) >= CHUNK_ROWS:
+                yield np.asarray(rows, dtype=np.float64)
+                rows = []
+        if rows:
+            yield np.asarray(rows, dtype=np.float64)
+
+
+def ingest(csv_paths: List[str], store_path: str = LISTING_STORE_PATH,
+           cell_deg: float = DEFAULT_CELL_DEG, area_unit: str = 'sqm', record_digest: bool = True,
+           currency: str = DEFAULT_CURRENCY) -> Dict:
+    """
+    Convert listing CSV exports into a columnar store.
+
+    Rows are streamed in chunks into raw scratch files, then sorted once by
+    grid cell so every cell is a contiguous slice. Memory use is bounded by
+    the chunk size plus the sort permutation, not by the CSV size.
+
+    Layout of store_path:
+        lat.npy, lon.npy, price.npy, area.npy   float32 columns, sorted by cell
+        cell_ids.npy, cell_offsets.npy          grid index (offsets has len+1 entries)
+        meta.json                               row count, grid size, sources
+
+    With record_digest, every chunk's prices are also merged into the
+    per-locality price digest for `currency` (pass False when re-ingesting
+    the same export).
+    """
+    if area_unit not in AREA_UNITS:
+        raise ValueError(f"Unknown area unit '{area_unit}' (use one of {', '.join(AREA_UNITS)})")
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)) or '.', exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix='listings-', dir=os.path.dirname(os.path.abspath(store_path)))
+    build_path = store_path.rstrip(os.sep) + '.building'
+
+    try:
+        # Pass 1: stream CSV rows into raw per-column scratch files
+        raw_files = {c: open(os.path.join(scratch, c + '.raw'), 'wb') for c in COLUMNS}
+        cell_file = open(os.path.join(scratch, 'cell.raw'), 'wb')
+        total = 0
+        try:
+            for csv_path in csv_paths:
+                for chunk in _read_chunks(csv_path, AREA_UNITS[area_unit]):
+                    for i, column in enumerate(COLUMNS):
+                        chunk[:, i].astype(np.float32).tofile(raw_files[column])
+                    _cell_ids(chunk[:, 0], chunk[:, 1], cell_deg).tofile(cell_file)
+                    if record_digest:
+                        try:
+                            record_price_array(chunk[:, 0], chunk[:, 1], chunk[:, 2], currency)
+                        except Exception as e:
+                            print(f"Price digest update failed: {e}", file=sys.stderr)
+                    total += len(chunk)
+                    print(f"Ingested {total:,} rows...", file=sys.stderr)
+        finally:
+            for f in raw_files.values():
+                f.close()
+            cell_file.close()
+
+        if total == 0:
+            raise ValueError('No valid rows found in input')
+
+        # Pass 2: sort by cell and write the final columns
+        cells = np.fromfile(os.path.join(scratch, 'cell.raw'), dtype=np.int64)
+        order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[order]
+        del cells
+
+        if os.path.exists(build_path):
+            shutil.rmtree(build_path)
+        os.makedirs(build_path)
+
+        for column in COLUMNS:
+            source = np.memmap(os.path.join(scratch, column + '.raw'), dtype=np.float32, mode='r', shape=(total,))
+            target = np.lib.format.open_memmap(os.path.join(build_path, column + '.npy'), mode='w+', dtype=np.float32, shape=(total,))
+            for start in range(0, total, CHUNK_ROWS):
+                target[start:start + CHUNK_ROWS] = source[order[start:start + CHUNK_ROWS]]
+            target.flush()
+            del source, target
+
+        cell_ids, starts = np.unique(sorted_cells, return_index=True)
+        offsets = np.append(starts, total).astype(np.int64)
+        np.save(os.path.join(build_path, 'cell_ids.npy'), cell_ids)
+        np.save(os.path.join(build_path, 'cell_offsets.npy'), offsets)
+
+        meta = {
+            'rows': int(total),
+            'cell_deg': cell_deg,
+            'cells': int(len(cell_ids)),
+            'columns': list(COLUMNS),
+            'area_unit': 'sqm',
+            'currency': currency.upper(),
+            'sources': [os.path.basename(p) for p in csv_paths]
+        }
+        with open(os.path.join(build_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        # Swap the finished store in place
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        os.replace(build_path, store_path)
+        return meta
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.rmtree(build_path, ignore_errors=True)
+
+
+class ListingStore:
+    """Read-only view over an ingested store; columns are memory-mapped, not loaded"""
+
+    def __init__(self, store_path: str = LISTING_STORE_PATH):
+        with open(os.path.join(store_path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.cell_deg = self.meta['cell_deg']
+        self.columns = {c: np.load(os.path.join(store_path, c + '.npy'), mmap_mode='r') for c in COLUMNS}
+        self.cell_ids = np.load(os.path.join(store_path, 'cell_ids.npy'))
+        self.cell_offsets = np.load(os.path.join(store_path, 'cell_offsets.npy'))
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    def _row_slices(self, latitude: float, longitude: float, radius_m: float) -> List[slice]:
+        """Contiguous row ranges for every grid cell overlapping the search box"""
+        rows, cols = _grid_shape(self.cell_deg)
+        d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+        d_lon = d_lat / max(math.cos(math.radians(latitude)), 1e-6)
+
+        row_lo = max(0, int((latitude - d_lat + 90.0) / self.cell_deg))
+        row_hi = min(rows - 1, int((latitude + d_lat + 90.0) / self.cell_deg))
+        col_lo = max(0, int((longitude - d_lon + 180.0) / self.cell_deg))
+        col_hi = min(cols - 1, int((longitude + d_lon + 180.0) / self.cell_deg))
+
+        slices = []
+        for row in range(row_lo, row_hi + 1):
+            # Cells of one grid row are adjacent in id order, so one range covers them
+            first = np.searchsorted(self.cell_ids, row * cols + col_lo, side='left')
+            last = np.searchsorted(self.cell_ids, row * cols + col_hi, side='right')
+            if last > first:
+                slices.append(slice(int(self.cell_offsets[first]), int(self.cell_offsets[last])))
+        return slices
+
+    def price_per_sqm_distribution(self, latitude: float, longitude: float,
+                                   radius_m: float = DEFAULT_RADIUS_M) -> Dict:
+        """
+        Price-per-sqm distribution of listings within radius_m of a coordinate.
+
+        Returns:
+            Dictionary with count, mean and p10/p25/p50/p75/p90 price per sqm
+        """
+        slices = self._row_slices(latitude, longitude, radius_m)
+        if not slices:
+            return {'count': 0}
+
+        lat = np.concatenate([self.columns['lat'][s] for s in slices]).astype(np.float64)
+        lon = np.concatenate([self.columns['lon'][s] for s in slices]).astype(np.float64)
+
+        # Vectorised haversine to drop box corners outside the radius
+        phi1 = math.radians(latitude)
+        phi2 = np.radians(lat)
+        a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon - longitude) / 2) ** 2
+        inside = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0))) <= radius_m
+        if not inside.any():
+            return {'count': 0}
+
+        price = np.concatenate([self.columns['price'][s] for s in slices])[inside].astype(np.float64)
+        area = np.concatenate([self.columns['area'][s] for s in slices])[inside].astype(np.float64)
+        per_sqm = price / area
+
+        p10, p25, p50, p75, p90 = np.percentile(per_sqm, [10, 25, 50, 75, 90])
+        return {
+            'count': int(per_sqm.size),
+            'radius_m': radius_m,
+            'mean': float(per_sqm.mean()),
+            'p10': float(p10),
+            'p25': float(p25),
+            'p50': float(p50),
+            'p75': float(p75),
+            'p90': float(p90)
+        }
+
+
+_store: Optional[ListingStore] = None
+
+
+def get_store() -> Optional[ListingStore]:
+    """Shared store for this process, or None if nothing has been ingested"""
+    global _store
+    if _store is None and os.path.exists(os.path.join(LISTING_STORE_PATH, 'meta.json')):
+        _store = ListingStore(LISTING_STORE_PATH)
+    return _store
+
+
+def get_listing_valuation(latitude: float, longitude: float, area_sqm: float,
+                          radius_m: float = DEFAULT_RADIUS_M) -> Dict:
+    """Value a parcel from the median listing price per sqm around it"""
+    store = get_store()
+    distribution = store.price_per_sqm_distribution(latitude, longitude, radius_m) if store else {'count': 0}
+    count = distribution['count']
+
+    if count < MIN_LISTINGS:
+        return {
+            'error': f'Only {count} listing(s) within {radius_m}m',
+            'prices': [],
+            'average_price': 0,
+            'confidence': 0
+        }
+
+    # Tighter interquartile spread → higher confidence
+    spread = (distribution['p75'] - distribution['p25']) / distribution['p50'] if distribution['p50'] > 0 else 1
+    confidence = int(max(40, min(90, 50 + min(count, 50) * 0.6 - spread * 20)))
+    estimated = int(distribution['p50'] * area_sqm) if area_sqm > 0 else 0
+
+    return {
+        'source': 'listings',
+        'average_price': int(distribution['mean'] * area_sqm) if area_sqm > 0 else 0,
+        'median_price': estimated,
+        'min_price': int(distribution['p10'] * area_sqm) if area_sqm > 0 else 0,
+        'max_price': int(distribution['p90'] * area_sqm) if area_sqm > 0 else 0,
+        'price_count': count,
+        'confidence': confidence,
+        'price_per_sqm': int(distribution['p50']),
+        'estimated_valuation': estimated,
+        'distribution': distribution
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.listingStore ingest exports/*.csv [--out DIR] [--cell-deg 0.01] [--area-unit sqft] [--currency INR] [--no-digest]
+    # python -m src.services.listingStore query '{"latitude": .., "longitude": .., "radius_m": 1000}' [--out DIR]
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Listing price store')
+    parser.add_argument('command', choices=['ingest', 'query'])
+    parser.add_argument('inputs', nargs='+', help='CSV files to ingest, or a JSON query')
+    parser.add_argument('--out', default=LISTING_STORE_PATH, help='Store directory')
+    parser.add_argument('--cell-deg', type=float, default=DEFAULT_CELL_DEG, help='Grid cell size in degrees')
+    parser.add_argument('--area-unit', default='sqm', choices=sorted(AREA_UNITS), help='Unit of the area column')
+    parser.add_argument('--currency', default=DEFAULT_CURRENCY, help='Currency of the price column')
+    parser.add_argument('--no-digest', action='store_true', help='Do not merge the prices into the price digest')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        print(json.dumps(ingest(args.inputs, args.out, args.cell_deg, args.area_unit, not args.no_digest, args.currency), indent=2))
+    else:
+        query = json.loads(args.inputs[0])
+        store = ListingStore(args.out)
+        print(json.dumps(store.price_per_sqm_distribution(
+            query['latitude'], query['longitude'], query.get('radius_m', DEFAULT_RADIUS_M)
+        ), indent=2))
@@ -0,0 +1,332 @@
+"""
+Model Router
+Picks the model and max_tokens for each agent call from document size, pre-screen
+confidence, rolling per-model latency/error statistics and the request's budget
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: concurrent agents may drop an update, the stats stay valid
+    fcntl = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.utils.documentArea import AREA_PATTERN
+
+_OFFCHAIN_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODEL_STATS_PATH = os.getenv('MODEL_STATS_PATH', os.path.join(_OFFCHAIN_DIR, '.model-stats.json'))
+MODEL_CATALOG_PATH = os.getenv('MODEL_CATALOG_PATH')
+
+# Per-request budgets when the payload doesn't set latency_budget_s / cost_budget_usd
+DEFAULT_LATENCY_BUDGET = float(os.getenv('ROUTER_LATENCY_BUDGET', '60'))  # seconds per call
+DEFAULT_COST_BUDGET = float(os.getenv('ROUTER_COST_BUDGET', '0.02'))  # USD per call
+
+# Candidate models per agent, cheapest/smallest first. Costs are USD per 1M
+# tokens; `seconds_per_ktok` is the latency prior until real calls are observed.
+# `tier` 1 models handle clear-cut rejects (an obvious non-deed), tier 2 every
+# document that may be accepted or is ambiguous. Tier 3
+# models are never preferred; they take over only when every cheaper model
+# is unhealthy or outside the budget.
+MODEL_CATALOG: Dict[str, List[Dict]] = {
+    'groq': [
+        {'model': 'llama-3.1-8b-instant', 'tier': 1, 'context_tokens': 131072,
+         'input_cost': 0.05, 'output_cost': 0.08, 'seconds_per_ktok': 0.3},
+        {'model': 'llama-3.3-70b-versatile', 'tier': 2, 'context_tokens': 131072,
+         'input_cost': 0.59, 'output_cost': 0.79, 'seconds_per_ktok': 0.8}
+    ],
+    'openrouter': [
+        {'model': 'meta-llama/llama-3.1-8b-instruct', 'tier': 1, 'context_tokens': 131072,
+         'input_cost': 0.02, 'output_cost': 0.05, 'seconds_per_ktok': 2.0},
+        {'model': 'openai/gpt-4o-mini', 'tier': 2, 'context_tokens': 128000,
+         'input_cost': 0.15, 'output_cost': 0.60, 'seconds_per_ktok': 3.0}
+    ],
+    'llama': [
+        # The free model was agent3's only model and stays its default for every case
+        {'model': 'meta-llama/llama-3.1-8b-instruct:free', 'tier': 2, 'context_tokens': 131072,
+         'input_cost': 0.0, 'output_cost': 0.0, 'seconds_per_ktok': 4.0},
+        {'model': 'meta-llama/llama-3.3-70b-instruct', 'tier': 3, 'context_tokens': 131072,
+         'input_cost': 0.13, 'output_cost': 0.40, 'seconds_per_ktok': 4.0}
+    ]
+}
+
+# (clear-cut, ambiguous) completion budgets per phase
+MAX_TOKENS = {
+    'document_verification': (800, 1500),
+    'valuation': (400, 600)
+}
+
+# Pre-screen confidence at or above which a case counts as clear-cut
+CONFIDENT = 0.7
+# Pre-screen land score below which a clear-cut case is a reject
+REJECT_LAND_SCORE = 0.5
+# Rolling error rate above which a model is avoided
+MAX_ERROR_RATE = 0.5
+# Weight of the newest observation in the rolling averages
+EWMA_ALPHA = 0.2
+# Documents longer than this always get the larger completion budget
+LONG_DOCUMENT_TOKENS = 8000
+
+# Mandatory land document fields (same list the agents' prompts check)
+MANDATORY_FIELD_KEYWORDS = {
+    'identification': ('survey no', 'survey number', 'plot no', 'plot number', 'deed no', 'khasra', 'patta'),
+    'owner': ('vendor', 'seller', 'purchaser', 'owner', 'transferor', 'vendee'),
+    'location': ('village', 'district', 'taluk', 'address', 'situated at'),
+    'boundaries': ('boundaries', 'bounded by', 'north by', 'south by', 'east by', 'west by'),
+    'registration': ('sub-registrar', 'sub registrar', 'registration no', 'registered', 'stamp duty')
+}
+LAND_DOCUMENT_TYPES = ('sale deed', 'conveyance deed', 'transfer deed', 'title deed', 'purchase deed', 'property deed')
+NON_LAND_KEYWORDS = ('invoice', 'receipt', 'bill to', 'gstin', 'purchase order', 'quotation', 'payslip')
+
+
+def estimate_tokens(text_or_length) -> int:
+    """Rough token count (~4 characters per token) from text or a character count"""
+    length = text_or_length if isinstance(text_or_length, int) else len(text_or_length or '')
+    return length // 4 + 1
+
+
+def prescreen_documents(texts: Iterable[str]) -> Dict:
+    """
+    Keyword pre-screen of the documents before any LLM call.
+
+    Returns the fraction of mandatory fields present (`land_score`) and how
+    clear-cut the case looks (`confidence`): a complete deed or an obvious
+    non-deed is confident, a partial match is not.
+    """
+    text = '\n'.join(texts).lower()
+    if not text.strip():
+        return {'land_score': 0.0, 'confidence': 0.0, 'missing_fields': list(MANDATORY_FIELD_KEYWORDS) + ['area']}
+
+    missing = [field for field, keywords in MANDATORY_FIELD_KEYWORDS.items()
+               if not any(keyword in text for keyword in keywords)]
+    if not AREA_PATTERN.search(text):
+        missing.append('area')
+    field_score = 1 - len(missing) / (len(MANDATORY_FIELD_KEYWORDS) + 1)
+
+    is_deed = any(kind in text for kind in LAND_DOCUMENT_TYPES)
+    non_land_hits = sum(keyword in text for keyword in NON_LAND_KEYWORDS)
+    if non_land_hits and not is_deed:
+        land_score = min(field_score, 0.2)
+    else:
+        land_score = min(1.0, field_score + (0.1 if is_deed else 0))
+
+    return {
+        'land_score': round(land_score, 2),
+        'confidence': round(abs(land_score - 0.5) * 2, 2),
+        'missing_fields': missing
+    }
+
+
+class ModelStats:
+    """
+    Rolling latency and error rate per model, shared by all agent processes
+    through a small JSON file (each update is a locked read-modify-write).
+    """
+
+    def __init__(self, path: str = MODEL_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, model: str, seconds: float, tokens: int, error: bool) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                stats = self.load()
+                entry = stats.get(model) or {'calls': 0, 'error_rate': 0.0}
+                entry['calls'] += 1
+                entry['error_rate'] = _ewma(entry['error_rate'], 1.0 if error else 0.0)
+                if not error and tokens > 0:
+                    observed = seconds / tokens * 1000
+                    previous = entry.get('seconds_per_ktok')
+                    entry['seconds_per_ktok'] = observed if previous is None else _ewma(previous, observed)
+                entry['updated_at'] = time.time()
+                stats[model] = entry
+
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(stats, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _ewma(previous: float, value: float) -> float:
+    return previous + EWMA_ALPHA * (value - previous)
+
+
+_stats: Optional[ModelStats] = None
+_catalog: Optional[Dict[str, List[Dict]]] = None
+
+
+def get_stats() -> ModelStats:
+    global _stats
+    if _stats is None:
+        _stats = ModelStats()
+    return _stats
+
+
+def get_catalog() -> Dict[str, List[Dict]]:
+    """MODEL_CATALOG, or the JSON file at MODEL_CATALOG_PATH when set"""
+    global _catalog
+    if _catalog is None:
+        _catalog = MODEL_CATALOG
+        if MODEL_CATALOG_PATH:
+            with open(MODEL_CATALOG_PATH, 'r', encoding='utf-8') as f:
+                _catalog = json.load(f)
+    return _catalog
+
+
+class Route:
+    """The model choice for one call and why it was made"""
+
+    def __init__(self, agent: str, model: str, max_tokens: int, prompt_tokens: int,
+                 expected_seconds: float, expected_cost: float, reason: str):
+        self.agent = agent
+        self.model = model
+        self.max_tokens = max_tokens
+        self.prompt_tokens = prompt_tokens
+        self.expected_seconds = expected_seconds
+        self.expected_cost = expected_cost
+        self.reason = reason
+        self.used_tokens: Optional[int] = None
+
+    def record_usage(self, usage=None, completion_tokens: Optional[int] = None) -> None:
+        """
+        Tokens the call actually used, from an OpenAI-style usage object or a
+        completion token count (e.g. chunks of an aborted stream). The latency
+        statistics use these instead of the prompt estimate plus max_tokens.
+        """
+        prompt = getattr(usage, 'prompt_tokens', None) or self.prompt_tokens
+        completion = getattr(usage, 'completion_tokens', None) or completion_tokens
+        if completion is not None:
+            self.used_tokens = prompt + completion
+
+    def to_dict(self) -> Dict:
+        return {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'prompt_tokens': self.prompt_tokens,
+            'expected_seconds': round(self.expected_seconds, 2),
+            'expected_cost_usd': round(self.expected_cost, 6),
+            'reason': self.reason
+        }
+
+
+def route_request(agent: str, prompt_tokens: int, confidence: Optional[float] = None,
+                  budget: Optional[Dict] = None, phase: str = 'document_verification',
+                  document_tokens: int = 0, land_score: Optional[float] = None) -> Route:
+    """
+    Choose the model and max_tokens for one agent call.
+
+    Args:
+        agent: Agent name (AGENT_NAME), selects the candidate models
+        prompt_tokens: Estimated prompt size
+        confidence: Pre-screen confidence; None means unknown (treated as ambiguous)
+        budget: Optional {'latency_budget_s', 'cost_budget_usd'} from the payload
+        phase: 'document_verification' or 'valuation'
+        document_tokens: Estimated size of the documents in the prompt
+        land_score: Pre-screen land score; a clear-cut case below REJECT_LAND_SCORE
+            is a reject and may use a tier 1 model
+
+    The cheapest model that is capable enough for the case, healthy and within
+    both budgets wins. If none qualifies, the capability requirement is dropped,
+    and if still none fits the budget, the model expected to finish soonest is used.
+    """
+    budget = budget or {}
+    latency_budget = float(budget.get('latency_budget_s', DEFAULT_LATENCY_BUDGET))
+    cost_budget = float(budget.get('cost_budget_usd', DEFAULT_COST_BUDGET))
+
+    clear_cut = confidence is not None and confidence >= CONFIDENT
+    short_tokens, long_tokens = MAX_TOKENS.get(phase, MAX_TOKENS['document_verification'])
+    max_tokens = short_tokens if clear_cut and document_tokens < LONG_DOCUMENT_TOKENS else long_tokens
+    # A small model may confirm an obvious non-deed, but never approve a deed
+    clear_reject = clear_cut and land_score is not None and land_score < REJECT_LAND_SCORE
+    required_tier = 1 if clear_reject else 2
+
+    stats = get_stats().load()
+    candidates = []
+    for entry in get_catalog()[agent]:
+        if entry['context_tokens'] < prompt_tokens + max_tokens:
+            continue
+        observed = stats.get(entry['model'], {})
+        seconds_per_ktok = observed.get('seconds_per_ktok') or entry['seconds_per_ktok']
+        candidates.append({
+            'entry': entry,
+            'seconds': seconds_per_ktok * (prompt_tokens + max_tokens) / 1000,
+            'cost': (prompt_tokens * entry['input_cost'] + max_tokens * entry['output_cost']) / 1e6,
+            'healthy': observed.get('error_rate', 0.0) <= MAX_ERROR_RATE
+        })
+
+    if not candidates:
+        raise ValueError(f"Documents too large for every {agent} model ({prompt_tokens} prompt tokens)")
+
+    def affordable(candidate):
+        return candidate['healthy'] and candidate['seconds'] <= latency_budget and candidate['cost'] <= cost_budget
+
+    capable = [c for c in candidates if c['entry']['tier'] >= required_tier and affordable(c)]
+    if capable:
+        choice = min(capable, key=lambda c: (c['cost'], c['seconds']))
+        reason = 'clear-cut reject' if clear_reject else ('clear-cut case' if clear_cut else 'ambiguous case')
+    else:
+        within_budget = [c for c in candidates if affordable(c)]
+        if within_budget:
+            choice = max(within_budget, key=lambda c: (c['entry']['tier'], -c['cost']))
+            reason = 'budget-limited'
+        else:
+            choice = min(candidates, key=lambda c: (not c['healthy'], c['seconds']))
+            reason = 'over budget - fastest available'
+
+    return Route(agent, choice['entry']['model'], max_tokens, prompt_tokens,
+                 choice['seconds'], choice['cost'], reason)
+
+
+@contextmanager
+def track_route(route: Route):
+    """
+    Feed the call's latency (or failure) back into the rolling statistics.
+
+    Call route.record_usage() inside the block; without it the estimate of
+    prompt tokens plus max_tokens is used.
+    """
+    started = time.perf_counter()
+    try:
+        yield route
+    except Exception:
+        get_stats().record(route.model, time.perf_counter() - started, 0, error=True)
+        raise
+    tokens = route.used_tokens or route.prompt_tokens + route.max_tokens
+    get_stats().record(route.model, time.perf_counter() - started, tokens, error=False)
+
+
+if __name__ == "__main__":
+    # python -m src.services.modelRouter '{"agent": "groq", "document_tokens": 3000, "confidence": 0.9, "land_score": 0.05}'
+    from src.utils.cli import read_payload
+
+    request = read_payload()
+    route = route_request(
+        request['agent'],
+        request.get('prompt_tokens') or request.get('document_tokens', 0) + 1000,
+        request.get('confidence'),
+        request.get('budget'),
+        request.get('phase', 'document_verification'),
+        request.get('document_tokens', 0),
+        request.get('land_score')
+    )
+    print(json.dumps(route.to_dict(), indent=2))
@@ -0,0 +1,129 @@
+/**
+ * Analysis Pipeline Client
+ * Sends requests to one long-lived `analysisPipeline --serve` process, so every
+ * request shares its stage queues (concurrency limits, priorities and load shedding)
+ * and concurrent satellite fetches for neighbouring parcels can be coalesced
+ */
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import path from 'path';
+import readline from 'readline';
+import { logger } from '../utils/logger';
+
+// Longest a single request may take before its promise is rejected
+const REQUEST_TIMEOUT_MS = Number(process.env.PIPELINE_TIMEOUT_MS || 120000);
+// Downloading 4x 2048x2048 images takes time
+const SATELLITE_TIMEOUT_MS = Number(process.env.PIPELINE_SATELLITE_TIMEOUT_MS || 180000);
+
+/**
+ * The pipeline shed the request (HTTP 429 semantics): too many requests in
+ * flight, a full stage queue or a passed deadline. Retry later.
+ */
+export class PipelineBusyError extends Error {
+  readonly status = 429;
+
+  constructor(message: string) {
+    super(message);
+    this.name = 'PipelineBusyError';
+  }
+}
+
+interface PendingRequest {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
+let server: ChildProcessWithoutNullStreams | null = null;
+const pending = new Map<string, PendingRequest>();
+let nextId = 0;
+
+function settle(id: string): PendingRequest | undefined {
+  const request = pending.get(id);
+  if (request) {
+    clearTimeout(request.timer);
+    pending.delete(id);
+  }
+  return request;
+}
+
+function startServer(): ChildProcessWithoutNullStreams {
+  const pythonPath = process.env.PYTHON_PATH || 'python';
+  const offchainDir = path.join(__dirname, '..', '..');
+  const child = spawn(pythonPath, ['-m', 'src.services.analysisPipeline', '--serve'], { cwd: offchainDir });
+  logger.info(`🧵 Started analysis pipeline server (pid ${child.pid})`);
+
+  readline.createInterface({ input: child.stdout }).on('line', (line) => {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      logger.warn(`⚠️  Unreadable pipeline response: ${line}`);
+      return;
+    }
+
+    const request = settle(String(message.id));
+    if (!request) {
+      return;
+    }
+    if (message.status === 200) {
+      request.resolve(message.result);
+    } else if (message.status === 429) {
+      request.reject(new PipelineBusyError(message.error));
+    } else {
+      request.reject(new Error(`Analysis pipeline error (${message.status}): ${message.error}`));
+    }
+  });
+
+  // Agent debug output
+  child.stderr.on('data', (data) => {
+    logger.debug(data.toString().trimEnd());
+  });
+
+  child.on('close', (code) => {
+    logger.warn(`⚠️  Analysis pipeline server exited (code ${code})`);
+    if (server === child) {
+      server = null;
+    }
+    for (const id of Array.from(pending.keys())) {
+      settle(id)?.reject(new Error('Analysis pipeline server exited'));
+    }
+  });
+
+  return child;
+}
+
+function sendRequest(op: string, payload: any, timeoutMs: number, label: string): Promise<any> {
+  if (!server) {
+    server = startServer();
+  }
+  const child = server;
+  const id = String(++nextId);
+
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      settle(id);
+      reject(new Error(`${label} timeout (${timeoutMs / 1000}s)`));
+    }, timeoutMs);
+    pending.set(id, { resolve, reject, timer });
+    child.stdin.write(JSON.stringify({ id, op, payload }) + '\n');
+  });
+}
+
+/**
+ * Run the three agents for one analysis package.
+ * Resolves to { satellite_data, market_data, agents: [agent1, agent2, agent3] };
+ * rejects with PipelineBusyError when the pipeline sheds the request.
+ */
+export function runAnalysisPipeline(payload: any): Promise<any> {
+  return sendRequest('analysis', payload, REQUEST_TIMEOUT_MS, 'Analysis pipeline');
+}
+
+/**
+ * Fetch satellite data for a point through the pipeline's satellite stage.
+ * Resolves to the satellite_service.py result (with `coalesced: true` when
+ * the images were rendered from a raster shared with neighbouring requests);
+ * rejects with PipelineBusyError when the pipeline sheds the request.
+ */
+export function fetchSatellite(latitude: number, longitude: number): Promise<any> {
+  return sendRequest('satellite', { latitude, longitude }, SATELLITE_TIMEOUT_MS, 'Satellite service');
+}
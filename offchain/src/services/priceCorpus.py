@@ -0,0 +1,208 @@
+"""
+Price Corpus
+Bulk price extraction over crawled listing pages and search snippets, sharded across processes
+"""
+import os
+import re
+import sys
+import json
+import html
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.services.priceOracle import extract_price_mentions
+from src.utils import geohash
+from src.utils.cli import encode_frame
+
+BATCH_DOCUMENTS = 500
+GEOHASH_PRECISION = 7
+HTML_EXTENSIONS = ('.html', '.htm')
+
+# Fields of a JSONL record holding text to scan, in output order
+TEXT_FIELDS = ('title', 'snippet', 'text', 'content', 'description')
+HTML_FIELDS = ('html', 'body')
+ID_FIELDS = ('id', 'url', 'link')
+
+_SKIPPED_ELEMENTS = re.compile(r'<(script|style|noscript)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_TAGS = re.compile(r'<[^>]+>')
+_SPACES = re.compile(r'\s+')
+
+
+def html_to_text(markup: str) -> str:
+    """Visible text of an HTML page (scripts, styles and tags dropped)"""
+    text = _TAGS.sub(' ', _SKIPPED_ELEMENTS.sub(' ', markup))
+    return _SPACES.sub(' ', html.unescape(text)).strip()
+
+
+def _coordinates(record: Dict) -> Optional[Tuple[float, float]]:
+    lat = record.get('latitude', record.get('lat'))
+    lon = record.get('longitude', record.get('lon', record.get('lng')))
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def extract_document(record: Dict, precision: int = GEOHASH_PRECISION) -> Optional[Dict]:
+    """
+    Compact price record for one corpus document, or None if it has no prices.
+
+    Output: {'id', 'prices': [[amount, currency, unit], ...], 'geohash' and/or 'location'}
+    where unit is 'total', 'per_sqft' or 'per_sqm', so unit prices are never
+    mixed into whole-property baselines
+    """
+    parts = [str(record[field]) for field in TEXT_FIELDS if record.get(field)]
+    parts.extend(html_to_text(str(record[field])) for field in HTML_FIELDS if record.get(field))
+    mentions = extract_price_mentions(' '.join(parts))
+    if not mentions:
+        return None
+
+    result = {
+        'id': next((record[field] for field in ID_FIELDS if record.get(field) is not None), None),
+        # Repeated mentions of the same price (title + snippet) are kept once
+        'prices': [list(mention) for mention in dict.fromkeys(mentions)]
+    }
+    coordinates = _coordinates(record)
+    if coordinates is not None:
+        result['geohash'] = geohash.encode(coordinates[0], coordinates[1], precision)
+    if record.get('location'):
+        result['location'] = record['location']
+    return result
+
+
+def _extract_batch(batch: List[Tuple[str, str]], precision: int, output_format: str) -> Tuple[bytes, int, int]:
+    """
+    Worker: parse and extract one batch of raw corpus entries.
+
+    Entries are ('jsonl', line) or ('html', path). Returns the encoded output
+    for the batch plus (documents read, documents with prices) so the parent
+    process only moves bytes.
+    """
+    chunks = []
+    found = 0
+    for kind, entry in batch:
+        if kind == 'html':
+            with open(entry, 'r', encoding='utf-8', errors='replace') as f:
+                record = {'id': entry, 'html': f.read()}
+        else:
+            try:
+                record = json.loads(entry)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+
+        result = extract_document(record, precision)
+        if result is None:
+            continue
+        found += 1
+        if output_format == 'msgpack':
+            chunks.append(encode_frame(result))
+        else:
+            chunks.append(json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+    return b''.join(chunks), len(batch), found
+
+
+def iter_corpus(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Stream corpus entries from JSONL files, HTML files and directories of
+    either ('-' reads JSONL from stdin). Lines are not parsed here; workers do it.
+    """
+    for path in paths:
+        if path == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield 'jsonl', line
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield from iter_corpus([os.path.join(root, name)])
+        elif path.lower().endswith(HTML_EXTENSIONS):
+            yield 'html', path
+        elif path.lower().endswith(('.jsonl', '.json', '.ndjson')):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if line.strip():
+                        yield 'jsonl', line
+
+
+def _batches(entries: Iterator[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def extract_corpus(paths: List[str], out, workers: Optional[int] = None, output_format: str = 'json',
+                   batch_size: int = BATCH_DOCUMENTS, precision: int = GEOHASH_PRECISION) -> Dict:
+    """
+    Extract prices from a corpus into `out` (a binary stream), in input order.
+
+    The corpus is read lazily in batches; at most two batches per worker are
+    in flight, so memory stays flat however large the corpus is and each
+    core always has the next batch ready.
+
+    Returns:
+        Counts of documents read and documents with prices, plus throughput
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    documents = 0
+    with_prices = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in _batches(iter_corpus(paths), batch_size):
+            pending.append(pool.submit(_extract_batch, batch, precision, output_format))
+            if len(pending) >= workers * 2:
+                data, read, found = pending.popleft().result()
+                out.write(data)
+                documents += read
+                with_prices += found
+        while pending:
+            data, read, found = pending.popleft().result()
+            out.write(data)
+            documents += read
+            with_prices += found
+
+    elapsed = time.perf_counter() - start
+    return {
+        'documents': documents,
+        'documents_with_prices': with_prices,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'documents_per_second': round(documents / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.priceCorpus crawl.jsonl pages/ [--out prices.jsonl] [--workers 8] [--format msgpack]
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bulk price extraction over a JSONL/HTML corpus')
+    parser.add_argument('inputs', nargs='+', help="JSONL files, HTML files or directories ('-' for stdin)")
+    parser.add_argument('--out', help='Output file (default stdout)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--format', default='json', choices=['json', 'msgpack'],
+                        help='JSON lines or length-prefixed msgpack frames')
+    parser.add_argument('--batch', type=int, default=BATCH_DOCUMENTS, help='Documents per worker task')
+    parser.add_argument('--precision', type=int, default=GEOHASH_PRECISION, help='Geohash precision of the tags')
+    args = parser.parse_args()
+
+    if args.out:
+        with open(args.out, 'wb') as out:
+            summary = extract_corpus(args.inputs, out, args.workers, args.format, args.batch, args.precision)
+    else:
+        summary = extract_corpus(args.inputs, sys.stdout.buffer, args.workers, args.format, args.batch, args.precision)
+    print(json.dumps(summary), file=sys.stderr)
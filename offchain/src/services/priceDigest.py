@@ -0,0 +1,347 @@
+"""
+Price Digest
+Persistent per-locality t-digest of market prices with time decay
+"""
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.utils import geohash
+
+PRICE_DIGEST_PATH = os.getenv(
+    'PRICE_DIGEST_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.price-digest', 'digests.sqlite')
+)
+
+# Localities are geohash cells (precision 5 is ~4.9 x 4.9 km)
+LOCALITY_PRECISION = int(os.getenv('PRICE_DIGEST_PRECISION', '5'))
+# Older prices count half as much every half-life
+HALF_LIFE_DAYS = float(os.getenv('PRICE_DIGEST_HALF_LIFE_DAYS', '90'))
+# Decayed weight a locality needs before its statistics are used
+MIN_WEIGHT = float(os.getenv('PRICE_DIGEST_MIN_WEIGHT', '10'))
+COMPRESSION = 100
+TRIM = (0.1, 0.9)
+# Digests are kept per kind of price and currency (metric 'total:USD'), so
+# rupee and dollar prices, or per-sqft and whole-property prices, never merge
+PRICE_KINDS = ('total', 'per_sqft', 'per_sqm')
+# Currency of valuations and of listing exports that don't say otherwise
+DEFAULT_CURRENCY = os.getenv('PRICE_DIGEST_CURRENCY', 'USD').upper()
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl): a sorted list of (mean, weight)
+    centroids, small near the tails and larger in the middle, so quantiles
+    stay accurate at the extremes. Size is bounded by ~COMPRESSION centroids
+    however many values are added.
+    """
+
+    def __init__(self, compression: float = COMPRESSION, means=None, weights=None,
+                 minimum: float = math.inf, maximum: float = -math.inf):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def total_weight(self) -> float:
+        return float(self.weights.sum())
+
+    def __len__(self) -> int:
+        return len(self.means)
+
+    def _scale(self, q: float) -> float:
+        # k1 scale function: centroid size shrinks towards q = 0 and q = 1
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        if total <= 0:
+            self.means, self.weights = means[:0], weights[:0]
+            return
+
+        merged_means = [means[0]]
+        merged_weights = [weights[0]]
+        weight_before = 0.0
+        k_lower = self._scale(0.0)
+        for mean, weight in zip(means[1:], weights[1:]):
+            proposed = merged_weights[-1] + weight
+            if self._scale((weight_before + proposed) / total) - k_lower <= 1:
+                merged_means[-1] += (mean - merged_means[-1]) * weight / proposed
+                merged_weights[-1] = proposed
+            else:
+                weight_before += merged_weights[-1]
+                k_lower = self._scale(weight_before / total)
+                merged_means.append(mean)
+                merged_weights.append(weight)
+        self.means = np.asarray(merged_means)
+        self.weights = np.asarray(merged_weights)
+
+    def add(self, values: Sequence[float], weight: float = 1.0):
+        """Add values, each with the same weight"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self._compress(
+            np.concatenate([self.means, values]),
+            np.concatenate([self.weights, np.full(values.size, weight)])
+        )
+
+    def merge(self, other: 'TDigest'):
+        if not len(other):
+            return
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def decay(self, factor: float):
+        """Scale every weight (0 < factor <= 1) so older data counts for less"""
+        self.weights = self.weights * factor
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not len(self):
+            return None
+        if len(self) == 1:
+            return float(self.means[0])
+        total = self.total_weight
+        target = min(max(q, 0.0), 1.0) * total
+        centres = np.cumsum(self.weights) - self.weights / 2
+        if target <= centres[0]:
+            # Between the minimum and the first centroid
+            fraction = target / centres[0] if centres[0] > 0 else 0
+            return float(self.minimum + (self.means[0] - self.minimum) * fraction)
+        if target >= centres[-1]:
+            fraction = (target - centres[-1]) / (total - centres[-1]) if total > centres[-1] else 0
+            return float(self.means[-1] + (self.maximum - self.means[-1]) * fraction)
+        upper = int(np.searchsorted(centres, target, side='right'))
+        lower = upper - 1
+        fraction = (target - centres[lower]) / (centres[upper] - centres[lower])
+        return float(self.means[lower] + (self.means[upper] - self.means[lower]) * fraction)
+
+    def trimmed_mean(self, low: float = TRIM[0], high: float = TRIM[1]) -> Optional[float]:
+        """Weighted mean of the part of the distribution between two quantiles"""
+        if not len(self):
+            return None
+        total = self.total_weight
+        ends = np.cumsum(self.weights)
+        starts = ends - self.weights
+        overlap = np.clip(np.minimum(ends, high * total) - np.maximum(starts, low * total), 0, None)
+        if overlap.sum() <= 0:
+            return self.quantile((low + high) / 2)
+        return float((self.means * overlap).sum() / overlap.sum())
+
+    def to_bytes(self) -> bytes:
+        return np.stack([self.means, self.weights]).astype(np.float64).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, minimum: float, maximum: float,
+                   compression: float = COMPRESSION) -> 'TDigest':
+        pairs = np.frombuffer(data, dtype=np.float64).reshape(2, -1) if data else np.zeros((2, 0))
+        return cls(compression, pairs[0].copy(), pairs[1].copy(), minimum, maximum)
+
+
+def digest_metric(kind: str = 'total', currency: str = DEFAULT_CURRENCY) -> str:
+    """Metric key of a digest, e.g. 'total:USD' or 'per_sqft:INR'"""
+    if kind not in PRICE_KINDS:
+        raise ValueError(f"Unknown price kind '{kind}' (use one of {', '.join(PRICE_KINDS)})")
+    if not currency:
+        raise ValueError('Prices need a currency to be recorded')
+    return f"{kind}:{currency.upper()}"
+
+
+def _decay_factor(seconds: float, half_life_days: float = HALF_LIFE_DAYS) -> float:
+    if seconds <= 0 or half_life_days <= 0:
+        return 1.0
+    return 0.5 ** (seconds / (half_life_days * 86400))
+
+
+def locality_cells(latitudes: np.ndarray, longitudes: np.ndarray,
+                   precision: int = LOCALITY_PRECISION) -> List[str]:
+    """Geohash cell of every coordinate (vectorized geohash.encode)"""
+    bit_count = precision * 5
+    lon_bits = (bit_count + 1) // 2
+    lat_bits = bit_count // 2
+    lon_index = np.clip(((np.asarray(longitudes) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_index = np.clip(((np.asarray(latitudes) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+
+    # Interleave bits, longitude first, most significant first
+    codes = np.zeros(lon_index.shape, dtype=np.int64)
+    for bit in range(bit_count):
+        if bit % 2 == 0:
+            value = (lon_index >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_index >> (lat_bits - 1 - bit // 2)) & 1
+        codes = (codes << 1) | value
+
+    cells = []
+    for code in codes.tolist():
+        cells.append(''.join(geohash.BASE32[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision)))
+    return cells
+
+
+class PriceDigestStore:
+    """
+    One t-digest per (locality, metric) in SQLite, where metric is a
+    digest_metric() key. Rows of older versions (metric 'price', currencies
+    mixed) are never read.
+
+    Updates decay the stored digest to the current time and merge the new
+    prices in a single transaction, so concurrent agent and batch processes
+    can share the file. Reads apply the decay without writing.
+    """
+
+    def __init__(self, path: str = PRICE_DIGEST_PATH, half_life_days: float = HALF_LIFE_DAYS):
+        self.path = path
+        self.half_life_days = half_life_days
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS digests (
+                locality TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                centroids BLOB NOT NULL,
+                minimum REAL NOT NULL,
+                maximum REAL NOT NULL,
+                value_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (locality, metric)
+            )
+        ''')
+
+    def _read(self, locality: str, metric: str, now: float):
+        row = self._db.execute(
+            'SELECT centroids, minimum, maximum, value_count, updated_at FROM digests WHERE locality = ? AND metric = ?',
+            (locality, metric)
+        ).fetchone()
+        if row is None:
+            return TDigest(), 0, None
+        digest = TDigest.from_bytes(row[0], row[1], row[2])
+        digest.decay(_decay_factor(now - row[4], self.half_life_days))
+        return digest, row[3], row[4]
+
+    def add_many(self, prices_by_locality: Dict[str, Iterable[float]], metric: str, weight: float = 1.0):
+        """Merge prices into several localities in one transaction"""
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for locality, prices in prices_by_locality.items():
+                    prices = [p for p in prices if p is not None and p > 0]
+                    if not prices:
+                        continue
+                    digest, count, _ = self._read(locality, metric, now)
+                    digest.add(prices, weight)
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (locality, metric, digest.to_bytes(), digest.minimum, digest.maximum,
+                         count + len(prices), now)
+                    )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def add(self, locality: str, prices: Iterable[float], metric: str, weight: float = 1.0):
+        self.add_many({locality: prices}, metric, weight)
+
+    def summary(self, locality: str, metric: str, percentiles: Sequence[int] = (10, 25, 75, 90)) -> Dict:
+        """Median, trimmed mean and percentiles of a locality's decayed digest"""
+        now = time.time()
+        with self._lock:
+            digest, count, updated_at = self._read(locality, metric, now)
+        summary = {
+            'locality': locality,
+            'metric': metric,
+            'weight': round(digest.total_weight, 2),
+            'value_count': count,
+            'updated_at': updated_at
+        }
+        if len(digest):
+            summary['median'] = round(digest.quantile(0.5), 2)
+            summary['trimmed_mean'] = round(digest.trimmed_mean(), 2)
+            summary['percentiles'] = {f"p{p}": round(digest.quantile(p / 100), 2) for p in percentiles}
+        return summary
+
+
+_store: Optional[PriceDigestStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PriceDigestStore:
+    """Shared process-wide store, opened on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PriceDigestStore()
+    return _store
+
+
+def locality(latitude: float, longitude: float) -> str:
+    return geohash.encode(latitude, longitude, LOCALITY_PRECISION)
+
+
+def record_prices(latitude: float, longitude: float, prices: Iterable[float],
+                  currency: str = DEFAULT_CURRENCY, kind: str = 'total'):
+    """Merge one lookup's prices (all in one currency and kind) into the locality around a point"""
+    get_store().add(locality(latitude, longitude), prices, digest_metric(kind, currency))
+
+
+def record_price_array(latitudes: np.ndarray, longitudes: np.ndarray, prices: np.ndarray,
+                       currency: str = DEFAULT_CURRENCY, kind: str = 'total'):
+    """Merge a column chunk of located prices (e.g. a listing export), grouped by locality"""
+    metric = digest_metric(kind, currency)
+    cells = np.asarray(locality_cells(latitudes, longitudes))
+    prices = np.asarray(prices, dtype=np.float64)
+    order = np.argsort(cells, kind='stable')
+    unique, starts = np.unique(cells[order], return_index=True)
+    bounds = list(starts[1:]) + [len(order)]
+    get_store().add_many(
+        {cell: prices[order[start:end]] for cell, start, end in zip(unique.tolist(), starts, bounds)},
+        metric
+    )
+
+
+def locality_summary(latitude: float, longitude: float, currency: str = DEFAULT_CURRENCY,
+                     kind: str = 'total') -> Optional[Dict]:
+    """Locality statistics for one currency and kind, or None until it has MIN_WEIGHT of (decayed) prices"""
+    summary = get_store().summary(locality(latitude, longitude), digest_metric(kind, currency))
+    if summary['weight'] < MIN_WEIGHT or 'median' not in summary:
+        return None
+    summary['currency'] = currency.upper()
+    summary['kind'] = kind
+    return summary
+
+
+if __name__ == "__main__":
+    # python -m src.services.priceDigest add '{"latitude": .., "longitude": .., "prices": [..], "currency": "INR"}'
+    # python -m src.services.priceDigest query '{"latitude": .., "longitude": .., "kind": "per_sqft"}'
+    if len(sys.argv) < 3 or sys.argv[1] not in ('add', 'query'):
+        print("Usage: priceDigest.py add|query '<json>'", file=sys.stderr)
+        sys.exit(1)
+
+    data = json.loads(sys.argv[2])
+    currency = data.get('currency', DEFAULT_CURRENCY)
+    kind = data.get('kind', 'total')
+    metric = digest_metric(kind, currency)
+    if sys.argv[1] == 'add':
+        record_prices(data['latitude'], data['longitude'], data['prices'], currency, kind)
+    start = time.perf_counter()
+    result = get_store().summary(locality(data['latitude'], data['longitude']), metric)
+    result['query_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    print(json.dumps(result, indent=2))
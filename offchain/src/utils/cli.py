@@ -0,0 +1,185 @@
+"""
+CLI helpers
+Shared entry-point handling for the Python services
+"""
+import sys
+import json
+import struct
+from fnmatch import fnmatch
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+
+# Options that take a value, so their values are not mistaken for payloads
+VALUE_OPTIONS = ('--input', '--phase', '--format', '--omit', '--radii', '--indices')
+
+OUTPUT_FORMATS = ('json', 'msgpack')
+
+# msgpack frames are prefixed with their length as a 4-byte big-endian integer
+FRAME_HEADER = struct.Struct('>I')
+
+# Fields dropped by `--omit large`: free text, image URLs and price sources.
+# Local `*_path` fields stay: the orchestrator uploads and cleans up those files.
+LARGE_FIELDS = ('reasoning', 'findings', 'note', 'sources', '*_url')
+
+
+def _positional(args: List[str]) -> List[str]:
+    positional = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith('--'):
+            positional.append(arg)
+    return positional
+
+
+def positional_args(argv: Optional[List[str]] = None) -> List[str]:
+    """Arguments that are neither options nor option values"""
+    return _positional(sys.argv[1:] if argv is None else argv)
+
+
+def _option(args: List[str], name: str) -> Optional[str]:
+    if name not in args:
+        return None
+    index = args.index(name)
+    if index + 1 >= len(args):
+        raise ValueError(f'{name} requires a value')
+    return args[index + 1]
+
+
+def read_list_option(name: str, argv: Optional[List[str]] = None) -> Optional[List[str]]:
+    """Comma-separated values of a value option, or None if it is absent"""
+    value = _option(sys.argv[1:] if argv is None else argv, name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def read_payload(argv: Optional[List[str]] = None) -> Dict:
+    """
+    Read the request payload for a script entry point.
+
+    Supported forms, in order:
+        --input <path>   JSON payload read from a file
+        @<path>          same as --input
+        '<json>'         inline JSON argument (kept for existing callers)
+        (nothing)        JSON streamed from stdin
+
+    Large documents should be passed as `document_refs` rather than inline
+    text so the payload itself stays small.
+    """
+    args = sys.argv[1:] if argv is None else argv
+
+    if '--input' in args:
+        index = args.index('--input')
+        if index + 1 >= len(args):
+            raise ValueError('--input requires a file path')
+        with open(args[index + 1], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    positional = _positional(args)
+    if positional:
+        if positional[0].startswith('@'):
+            with open(positional[0][1:], 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return json.loads(positional[0])
+
+    return json.load(sys.stdin)
+
+
+def read_phase(argv: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Agent phase requested with --phase (`documents` or `valuation`).
+
+    `documents` runs only the document verification, which needs no
+    satellite data; `valuation` (the default) runs the full analysis and
+    reuses a `document_verification` result from the payload if present.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if '--phase' not in args:
+        return None
+
+    index = args.index('--phase')
+    phase = args[index + 1] if index + 1 < len(args) else None
+    if phase not in ('documents', 'valuation'):
+        raise ValueError("--phase must be 'documents' or 'valuation'")
+    return phase
+
+
+def read_output_options(argv: Optional[List[str]] = None) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Output format and omitted fields requested on the command line.
+
+        --format json|msgpack   msgpack writes length-prefixed frames (default json)
+        --omit a,b,...          drop these keys at any depth; glob patterns such as
+                                `*_url` work, and `large` expands to LARGE_FIELDS
+    """
+    args = sys.argv[1:] if argv is None else argv
+
+    output_format = _option(args, '--format') or 'json'
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"--format must be one of {', '.join(OUTPUT_FORMATS)}")
+
+    omit = []
+    for field in (_option(args, '--omit') or '').split(','):
+        field = field.strip()
+        if field == 'large':
+            omit.extend(LARGE_FIELDS)
+        elif field:
+            omit.append(field)
+    return output_format, tuple(omit)
+
+
+def strip_fields(value, omit: Tuple[str, ...]):
+    """Copy of value without the keys matching any omit pattern"""
+    if not omit:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: strip_fields(item, omit) for key, item in value.items()
+            if not any(fnmatch(key, pattern) for pattern in omit)
+        }
+    if isinstance(value, list):
+        return [strip_fields(item, omit) for item in value]
+    return value
+
+
+def encode_frame(result) -> bytes:
+    """One length-prefixed msgpack frame"""
+    import msgpack
+
+    body = msgpack.packb(result, use_bin_type=True)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def iter_frames(stream: BinaryIO) -> Iterator:
+    """Decode length-prefixed msgpack frames until the stream ends"""
+    import msgpack
+
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        (length,) = FRAME_HEADER.unpack(header)
+        yield msgpack.unpackb(stream.read(length), raw=False)
+
+
+def write_result(result, argv: Optional[List[str]] = None, indent: Optional[int] = None) -> None:
+    """
+    Write a result (or one streamed event) to stdout in the requested format.
+
+    JSON results are one line each, as before (or pretty-printed with
+    `indent`, for entry points that always printed that way); msgpack
+    results are one frame each, so several events can share the stream.
+    """
+    output_format, omit = read_output_options(argv)
+    result = strip_fields(result, omit)
+
+    if output_format == 'msgpack':
+        sys.stdout.flush()
+        sys.stdout.buffer.write(encode_frame(result))
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(result, indent=indent), flush=True)
@@ -0,0 +1,84 @@
+"""
+Document area helpers
+Parse documented land areas and reconcile them with satellite measurements
+"""
+import re
+from typing import Optional
+
+# Square metres per unit
+AREA_UNITS = {
+    'sqm': 1.0,
+    'sq m': 1.0,
+    'sq. m': 1.0,
+    'sq.m': 1.0,
+    'square metre': 1.0,
+    'square meter': 1.0,
+    'm2': 1.0,
+    'sqft': 0.09290304,
+    'sq ft': 0.09290304,
+    'sq. ft': 0.09290304,
+    'sq.ft': 0.09290304,
+    'square feet': 0.09290304,
+    'square foot': 0.09290304,
+    'sqyd': 0.83612736,
+    'sq yd': 0.83612736,
+    'square yard': 0.83612736,
+    'gaj': 0.83612736,
+    'cent': 40.468564224,
+    'acre': 4046.8564224,
+    'hectare': 10000.0,
+    'ha': 10000.0,
+    'ground': 222.967296,
+}
+
+_UNIT_PATTERN = '|'.join(sorted((re.escape(u) for u in AREA_UNITS), key=len, reverse=True))
+AREA_PATTERN = re.compile(
+    rf'(\d{{1,3}}(?:,\d{{2,3}})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*({_UNIT_PATTERN})s?\b',
+    re.IGNORECASE
+)
+
+AREA_MISMATCH_TOLERANCE = 0.2
+
+
+def parse_area_sqm(text) -> Optional[float]:
+    """First area with units found in text, converted to square metres"""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text) if text > 0 else None
+
+    match = AREA_PATTERN.search(str(text))
+    if not match:
+        return None
+    value = float(match.group(1).replace(',', ''))
+    unit = match.group(2).lower()
+    return value * AREA_UNITS[unit] if value > 0 else None
+
+
+def area_mismatch(documented_sqm: Optional[float], satellite_sqm: Optional[float],
+                  tolerance: float = AREA_MISMATCH_TOLERANCE) -> Optional[float]:
+    """
+    Relative difference between documented and satellite area when it exceeds
+    the tolerance, otherwise None (also None when either area is unknown).
+    """
+    if not documented_sqm or not satellite_sqm or satellite_sqm <= 0:
+        return None
+    difference = abs(documented_sqm - satellite_sqm) / satellite_sqm
+    return difference if difference > tolerance else None
+
+
+DOCUMENTED_AREA_LINE = re.compile(r'^\s*\**\s*DOCUMENTED AREA\s*\**\s*:\s*(.*)$', re.IGNORECASE | re.MULTILINE)
+
+
+def split_documented_area(text: str):
+    """
+    Pull the trailing "DOCUMENTED AREA: ..." line out of a prose verdict.
+
+    Returns:
+        (text without that line, documented area in sqm or None)
+    """
+    match = DOCUMENTED_AREA_LINE.search(text or '')
+    if not match:
+        return text, None
+    cleaned = (text[:match.start()] + text[match.end():]).strip()
+    return cleaned, parse_area_sqm(match.group(1))
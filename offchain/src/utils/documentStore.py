@@ -0,0 +1,208 @@
+"""
+Document Store
+Resolves document references (file paths or content hashes) to lazily loaded, memory-mapped text
+"""
+import os
+import re
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+from src.utils import metrics
+
+# Content-addressed store: <DOCUMENT_STORE_DIR>/<sha256[:2]>/<sha256>
+DOCUMENT_STORE_DIR = os.getenv(
+    'DOCUMENT_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.document-store')
+)
+
+HASH_PREFIX = 'sha256:'
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Documents kept open by the process-wide cache; older ones are closed and dropped
+DOCUMENT_CACHE_SIZE = int(os.getenv('DOCUMENT_CACHE_SIZE', '64'))
+
+
+class StoredDocument:
+    """
+    A document backed by a memory-mapped file.
+
+    Nothing is read until the text is needed. Previews and lengths are served
+    straight from the mapping, and the decoded text is built once and reused.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._text: Optional[str] = None
+
+    def _mapping(self) -> Optional[mmap.mmap]:
+        if self._map is None and self._file is None:
+            self._file = open(self.path, 'rb')
+            # mmap cannot map empty files
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    @property
+    def text(self) -> str:
+        """Full document text, decoded on first access"""
+        text = self._text
+        if text is None:
+            with self._lock:
+                if self._text is None:
+                    mapping = self._mapping()
+                    self._text = mapping[:].decode('utf-8', errors='replace') if mapping is not None else ''
+                text = self._text
+        return text
+
+    def preview(self, length: int = 100) -> str:
+        """First characters of the document without decoding the whole file"""
+        text = self._text
+        if text is not None:
+            return text[:length]
+        with self._lock:
+            mapping = self._mapping()
+            if mapping is None:
+                return ''
+            # UTF-8 is at most 4 bytes per character
+            return mapping[:length * 4].decode('utf-8', errors='ignore')[:length]
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def close(self):
+        """Release the mapping and the decoded text; both are rebuilt on next access"""
+        with self._lock:
+            self._text = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class InlineDocument:
+    """A document passed inline in the payload (legacy `document_contents`)"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def preview(self, length: int = 100) -> str:
+        return self.text[:length]
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def close(self):
+        pass
+
+
+Document = Union[StoredDocument, InlineDocument]
+
+# Process-wide LRU cache so agents running in the same process share one copy of each text
+_documents: 'OrderedDict[str, StoredDocument]' = OrderedDict()
+_documents_lock = threading.Lock()
+
+
+def hash_path(content_hash: str) -> str:
+    """Location of a content hash inside the local store"""
+    content_hash = content_hash.lower()
+    if content_hash.startswith(HASH_PREFIX):
+        content_hash = content_hash[len(HASH_PREFIX):]
+    if not HASH_PATTERN.match(content_hash):
+        raise ValueError(f"Invalid document hash: {content_hash!r}")
+    return os.path.join(DOCUMENT_STORE_DIR, content_hash[:2], content_hash)
+
+
+def resolve_reference(ref: Union[str, Dict]) -> str:
+    """
+    Turn a document reference into a file path.
+
+    Accepts "sha256:<hex>", a plain file path, or a dict with a `sha256`,
+    `hash` or `path` key.
+    """
+    if isinstance(ref, dict):
+        content_hash = ref.get('sha256') or ref.get('hash')
+        if content_hash:
+            return hash_path(content_hash)
+        ref = ref.get('path', '')
+
+    if not ref:
+        raise ValueError('Empty document reference')
+    if ref.lower().startswith(HASH_PREFIX):
+        return hash_path(ref)
+    return ref
+
+
+def open_document(ref: Union[str, Dict]) -> StoredDocument:
+    """Get the shared, lazily loaded document for a reference"""
+    path = os.path.realpath(resolve_reference(ref))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Document not found: {ref}")
+
+    evicted = []
+    with _documents_lock:
+        document = _documents.get(path)
+        if document is None:
+            document = StoredDocument(path)
+            _documents[path] = document
+            metrics.CACHE_REQUESTS.labels(cache='documents', result='miss').inc()
+            while len(_documents) > DOCUMENT_CACHE_SIZE:
+                evicted.append(_documents.popitem(last=False)[1])
+        else:
+            _documents.move_to_end(path)
+            metrics.CACHE_REQUESTS.labels(cache='documents', result='hit').inc()
+
+    # Holders of an evicted document can keep using it; it reopens lazily
+    for old in evicted:
+        old.close()
+    return document
+
+
+def load_documents(data: Dict) -> List[Document]:
+    """
+    Collect the documents of an analysis payload.
+
+    `document_refs` (paths or content hashes) are preferred; inline
+    `document_contents` strings are still accepted for existing callers.
+    """
+    documents: List[Document] = []
+    for ref in data.get('document_refs') or []:
+        documents.append(open_document(ref))
+    for content in data.get('document_contents') or []:
+        documents.append(InlineDocument(content))
+    return documents
+
+
+def put_document(text: Union[str, bytes]) -> str:
+    """Write a document into the content-addressed store and return its reference"""
+    content = text.encode('utf-8') if isinstance(text, str) else text
+    content_hash = hashlib.sha256(content).hexdigest()
+    path = hash_path(content_hash)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    return HASH_PREFIX + content_hash
+
+
+if __name__ == "__main__":
+    # Store files and print their references: python -m src.utils.documentStore deed.txt ...
+    import sys
+    import json
+
+    refs = []
+    for file_path in sys.argv[1:]:
+        with open(file_path, 'rb') as f:
+            refs.append(put_document(f.read()))
+    print(json.dumps(refs))
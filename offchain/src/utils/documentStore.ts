@@ -0,0 +1,32 @@
+/**
+ * Document Store
+ * Writes document text into the content-addressed store read by the Python agents
+ * (src/utils/documentStore.py), so payloads carry `document_refs` instead of the text
+ */
+import crypto from 'crypto';
+import fs from 'fs';
+import path from 'path';
+
+// Same layout as the Python side: <DOCUMENT_STORE_DIR>/<sha256[:2]>/<sha256>
+export const DOCUMENT_STORE_DIR = process.env.DOCUMENT_STORE_DIR
+  || path.join(__dirname, '..', '..', '.document-store');
+
+const HASH_PREFIX = 'sha256:';
+
+/**
+ * Store a document and return its `sha256:<hex>` reference
+ */
+export function putDocument(content: string | Buffer): string {
+  const buffer = typeof content === 'string' ? Buffer.from(content, 'utf-8') : content;
+  const contentHash = crypto.createHash('sha256').update(buffer).digest('hex');
+  const filePath = path.join(DOCUMENT_STORE_DIR, contentHash.substring(0, 2), contentHash);
+
+  if (!fs.existsSync(filePath)) {
+    fs.mkdirSync(path.dirname(filePath), { recursive: true });
+    const tmpPath = `${filePath}.${process.pid}.tmp`;
+    fs.writeFileSync(tmpPath, buffer);
+    fs.renameSync(tmpPath, filePath);
+  }
+
+  return HASH_PREFIX + contentHash;
+}
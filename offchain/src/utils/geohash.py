@@ -0,0 +1,90 @@
+"""
+Geohash helpers
+Encoding, neighbour lookup and distance utilities for spatial indexes
+"""
+import math
+from typing import List, Tuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_M = 6371008.8
+
+
+def encode(latitude: float, longitude: float, precision: int = 7) -> str:
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Height and width of a geohash cell in degrees (lat, lon)"""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def neighbours(latitude: float, longitude: float, precision: int) -> List[str]:
+    """The cell containing a coordinate plus its eight surrounding cells"""
+    lat_step, lon_step = cell_size(precision)
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            lat = max(-90.0, min(90.0, latitude + d_lat * lat_step))
+            lon = ((longitude + d_lon * lon_step + 180.0) % 360.0) - 180.0
+            cell = encode(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def covered_radius_m(latitude: float, precision: int) -> float:
+    """
+    Distance from a coordinate that its neighbour block is guaranteed to cover.
+
+    The point lies somewhere in the centre cell, so every location closer
+    than one cell height/width is inside one of the nine cells.
+    """
+    lat_step, lon_step = cell_size(precision)
+    metres_per_degree = math.pi * EARTH_RADIUS_M / 180.0
+    return min(lat_step, lon_step * math.cos(math.radians(latitude))) * metres_per_degree
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in metres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,76 @@
+"""
+Image tiles
+Turns a full-size satellite render into a small WebP preview plus a tile pyramid
+"""
+import os
+import math
+from typing import Dict
+
+from PIL import Image
+
+TILE_SIZE = 256
+PREVIEW_SIZE = 512
+TILE_FORMATS = {'webp': 'WEBP', 'png': 'PNG'}
+
+
+def _save(image: Image.Image, path: str, tile_format: str, quality: int) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if tile_format == 'webp':
+        image.save(path, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(path, 'PNG', optimize=True)
+    return os.path.getsize(path)
+
+
+def build_pyramid(source_path: str, out_dir: str, tile_format: str = 'webp',
+                  tile_size: int = TILE_SIZE, preview_size: int = PREVIEW_SIZE,
+                  quality: int = 80, max_zoom: int = None) -> Dict:
+    """
+    Write `<out_dir>/preview.webp` and a `{z}/{x}/{y}.<ext>` tile pyramid.
+
+    Zoom 0 is the whole image in one tile; each level doubles the resolution
+    up to the source size (or `max_zoom`). Viewers fetch the preview for
+    thumbnails and only the tiles of the zoom level they display.
+
+    Returns:
+        Manifest with the preview path, tile template, levels and bytes written
+    """
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f"tile_format must be one of {', '.join(TILE_FORMATS)}")
+
+    with Image.open(source_path) as source:
+        image = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+
+    preview = image.copy()
+    preview.thumbnail((preview_size, preview_size), Image.LANCZOS)
+    preview_path = os.path.join(out_dir, 'preview.webp')
+    total_bytes = _save(preview, preview_path, 'webp', quality)
+
+    top_zoom = max(0, math.ceil(math.log2(max(image.size) / tile_size)))
+    if max_zoom is not None:
+        top_zoom = min(top_zoom, max_zoom)
+
+    tile_count = 0
+    for zoom in range(top_zoom + 1):
+        # Longest side spans 2^zoom tiles; edge tiles of non-square images are padded
+        scale = tile_size * 2 ** zoom / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        level = image.resize(size, Image.LANCZOS) if size != image.size else image
+        for x in range(math.ceil(size[0] / tile_size)):
+            for y in range(math.ceil(size[1] / tile_size)):
+                tile = level.crop((x * tile_size, y * tile_size, (x + 1) * tile_size, (y + 1) * tile_size))
+                total_bytes += _save(tile, os.path.join(out_dir, str(zoom), str(x), f"{y}.{tile_format}"),
+                                     tile_format, quality)
+                tile_count += 1
+
+    return {
+        'dir': out_dir,
+        'preview_path': preview_path,
+        'tile_template': f"{{z}}/{{x}}/{{y}}.{tile_format}",
+        'tile_size': tile_size,
+        'min_zoom': 0,
+        'max_zoom': top_zoom,
+        'tile_count': tile_count,
+        'bytes': total_bytes,
+        'source_bytes': os.path.getsize(source_path)
+    }
@@ -0,0 +1,152 @@
+"""
+Job Queue
+Bounded priority queues with per-stage concurrency, deadlines and load shedding
+"""
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from src.utils import metrics
+
+
+class QueueFull(Exception):
+    """The stage already has its maximum number of queued jobs"""
+
+
+class DeadlineExceeded(Exception):
+    """The job's deadline passed before it could start"""
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'future', 'deadline', 'enqueued_at')
+
+    def __init__(self, fn: Callable, args: tuple, deadline: Optional[float]):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+
+
+def _failed(error: Exception) -> Future:
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+class StageQueue:
+    """
+    Priority queue in front of one pipeline stage.
+
+    At most `max_in_flight` jobs run at once (one worker thread each). Waiting
+    jobs are ordered by priority (higher first), then earliest deadline, then
+    arrival. Jobs are refused when `max_depth` jobs are already waiting, and
+    dropped instead of started when their deadline has passed. Either way the
+    caller gets a Future that raises QueueFull or DeadlineExceeded.
+
+    Deadlines are time.time() timestamps.
+    """
+
+    def __init__(self, stage: str, max_in_flight: int, max_depth: Optional[int] = None):
+        self.stage = stage
+        self.max_in_flight = max_in_flight
+        self.max_depth = max_depth
+        self._heap: List = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"{stage}-worker-{i}", daemon=True)
+            for i in range(max_in_flight)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def submit(self, fn: Callable, *args, priority: int = 0, deadline: Optional[float] = None) -> Future:
+        """Queue fn(*args); returns a Future for its result"""
+        if deadline is not None and deadline <= time.time():
+            metrics.QUEUE_REJECTIONS.labels(stage=self.stage, reason='expired').inc()
+            return _failed(DeadlineExceeded(f"{self.stage}: deadline passed before queueing"))
+
+        job = _Job(fn, args, deadline)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.stage} queue is shut down")
+            if self.max_depth is not None and len(self._heap) >= self.max_depth:
+                metrics.QUEUE_REJECTIONS.labels(stage=self.stage, reason='full').inc()
+                return _failed(QueueFull(f"{self.stage}: {len(self._heap)} jobs already waiting"))
+            key = (-priority, deadline if deadline is not None else float('inf'), next(self._sequence))
+            heapq.heappush(self._heap, (key, job))
+            metrics.QUEUE_DEPTH.labels(stage=self.stage).set(len(self._heap))
+            self._condition.notify()
+        return job.future
+
+    def run(self, fn: Callable, *args, priority: int = 0, deadline: Optional[float] = None):
+        """Queue fn(*args) and wait for its result"""
+        return self.submit(fn, *args, priority=priority, deadline=deadline).result()
+
+    def _next_job(self) -> Optional[_Job]:
+        with self._condition:
+            while not self._heap and not self._closed:
+                self._condition.wait()
+            if not self._heap:
+                return None
+            _, job = heapq.heappop(self._heap)
+            metrics.QUEUE_DEPTH.labels(stage=self.stage).set(len(self._heap))
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            metrics.QUEUE_WAIT_SECONDS.labels(stage=self.stage).observe(time.monotonic() - job.enqueued_at)
+            if job.deadline is not None and job.deadline <= time.time():
+                metrics.QUEUE_REJECTIONS.labels(stage=self.stage, reason='expired').inc()
+                job.future.set_exception(DeadlineExceeded(f"{self.stage}: deadline passed while queued"))
+                continue
+
+            metrics.QUEUE_IN_FLIGHT.labels(stage=self.stage).inc()
+            try:
+                job.future.set_result(job.fn(*job.args))
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                metrics.QUEUE_IN_FLIGHT.labels(stage=self.stage).dec()
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs; workers exit once the queue is drained"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+class StageQueues:
+    """One StageQueue per pipeline stage"""
+
+    def __init__(self, limits: Dict[str, int], max_depth: Optional[int] = None):
+        self.queues = {stage: StageQueue(stage, limit, max_depth) for stage, limit in limits.items()}
+
+    def __getitem__(self, stage: str) -> StageQueue:
+        return self.queues[stage]
+
+    def submit(self, stage: str, fn: Callable, *args, priority: int = 0,
+               deadline: Optional[float] = None) -> Future:
+        return self.queues[stage].submit(fn, *args, priority=priority, deadline=deadline)
+
+    def shutdown(self, wait: bool = True):
+        for queue in self.queues.values():
+            queue.shutdown(wait)
@@ -0,0 +1,250 @@
+"""
+LLM streaming helpers
+Stream chat completions, pick verdict fields out of the partial text and stop early on a hard reject
+"""
+import re
+import json
+import time
+from typing import Dict, List, Optional
+
+from src.utils import metrics
+
+
+class JsonFieldScanner:
+    """
+    Incrementally pulls completed top-level scalar fields out of a streamed JSON object.
+
+    Feed it text chunks as they arrive; `fields` holds every top-level string,
+    number, boolean or null value as soon as it is complete. Nested objects and
+    arrays are skipped, and anything before the opening brace (e.g. a code
+    fence) is ignored.
+    """
+
+    def __init__(self):
+        self.fields: Dict = {}
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token: List[str] = []
+        self._key: Optional[str] = None
+        self._expect_value = False
+
+    def feed(self, chunk: str) -> None:
+        for char in chunk:
+            if self._in_string:
+                self._feed_string(char)
+            elif char == '"':
+                self._in_string = True
+                self._token = []
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._flush_literal()
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ':':
+                    self._expect_value = True
+                elif char == ',':
+                    self._flush_literal()
+                    self._key = None
+                    self._expect_value = False
+                elif char.isspace():
+                    self._flush_literal()
+                elif self._expect_value:
+                    self._token.append(char)
+
+    def _feed_string(self, char: str) -> None:
+        if self._escape:
+            self._escape = False
+        elif char == '\\':
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._depth == 1:
+                value = json.loads('"' + ''.join(self._token) + '"')
+                if self._expect_value and self._key is not None:
+                    self.fields[self._key] = value
+                    self._key = None
+                else:
+                    self._key = value
+                self._token = []
+            return
+        if self._depth == 1:
+            self._token.append(char)
+
+    def _flush_literal(self) -> None:
+        if self._depth != 1 or not self._token or self._key is None:
+            self._token = []
+            return
+        try:
+            self.fields[self._key] = json.loads(''.join(self._token))
+        except ValueError:
+            pass
+        self._token = []
+        self._key = None
+
+
+class JsonVerdictScanner(JsonFieldScanner):
+    """Verdict fields of agent1's JSON verification"""
+
+    @property
+    def verdict(self) -> Optional[Dict]:
+        if 'is_land_document' in self.fields and 'authenticity_score' in self.fields:
+            return {
+                'is_land_document': self.fields['is_land_document'],
+                'authenticity_score': self.fields['authenticity_score']
+            }
+        return None
+
+    @property
+    def hard_reject(self) -> bool:
+        # Wait for the score so document_type_found (emitted before it) is in too
+        verdict = self.verdict
+        return verdict is not None and verdict['is_land_document'] is False
+
+
+# Tolerates markdown emphasis around the label and value, e.g. "**LAND DOCUMENT:** NO"
+VERDICT_LINE = re.compile(r'^\W*LAND DOCUMENT\W*:\W*(YES|NO)\b\W*(.*)$', re.IGNORECASE)
+SCORE_LINE = re.compile(r'^\W*AUTHENTICITY SCORE\W*:\W*(\d+)', re.IGNORECASE)
+
+
+class ProseVerdictScanner:
+    """
+    Verdict lines at the top of a prose verification:
+
+        LAND DOCUMENT: YES | NO - <reason>
+        AUTHENTICITY SCORE: <0-100>
+    """
+
+    def __init__(self):
+        self.fields: Dict = {}
+        self._buffer = ''
+
+    def feed(self, chunk: str) -> None:
+        self._buffer += chunk
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            self._parse_line(line)
+
+    def _parse_line(self, line: str) -> None:
+        match = VERDICT_LINE.match(line)
+        if match and 'is_land_document' not in self.fields:
+            self.fields['is_land_document'] = match.group(1).upper() == 'YES'
+            if match.group(2):
+                self.fields['verdict_reason'] = match.group(2).strip(' *_')
+            return
+        match = SCORE_LINE.match(line)
+        if match and 'authenticity_score' not in self.fields:
+            self.fields['authenticity_score'] = int(match.group(1))
+
+    @property
+    def verdict(self) -> Optional[Dict]:
+        if self.fields.get('is_land_document') is False:
+            return {'is_land_document': False, 'authenticity_score': self.fields.get('authenticity_score', 0)}
+        if 'is_land_document' in self.fields and 'authenticity_score' in self.fields:
+            return {
+                'is_land_document': True,
+                'authenticity_score': self.fields['authenticity_score']
+            }
+        return None
+
+    @property
+    def hard_reject(self) -> bool:
+        return self.fields.get('is_land_document') is False
+
+
+def strip_verdict_lines(text: str) -> str:
+    """Prose verification without its LAND DOCUMENT / AUTHENTICITY SCORE lines"""
+    lines = [line for line in (text or '').split('\n')
+             if not VERDICT_LINE.match(line) and not SCORE_LINE.match(line)]
+    return '\n'.join(lines).strip()
+
+
+def parse_json_text(text: str) -> Dict:
+    """The JSON object in a completion, tolerating code fences around it"""
+    start = text.find('{')
+    end = text.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError(f"No JSON object in completion: {text[:200]}")
+    return json.loads(text[start:end + 1])
+
+
+def _usage(chunk):
+    usage = getattr(chunk, 'usage', None)
+    if usage is None:
+        # Groq reports usage on the last chunk under x_groq
+        usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+    return usage
+
+
+class StreamedCompletion:
+    """Text of a streamed completion plus what was learned while it streamed"""
+
+    def __init__(self, text: str, fields: Dict, verdict: Optional[Dict], aborted: bool,
+                 usage=None, completion_tokens: int = 0):
+        self.text = text
+        self.fields = fields
+        self.verdict = verdict
+        self.aborted = aborted
+        self.usage = usage
+        # Provider count when reported, otherwise the number of content chunks
+        self.completion_tokens = completion_tokens
+
+
+def stream_completion(client, service: str, operation: str, agent: str, model: str,
+                      messages: List[Dict], scanner, **params) -> StreamedCompletion:
+    """
+    Run a streaming chat completion through a verdict scanner.
+
+    Records time to first token and time to verdict, and closes the stream as
+    soon as the scanner reports a hard reject so no more tokens are generated.
+    Token usage comes from the provider when it reports it; an aborted stream
+    has none, so its chunk count is recorded as the completion token estimate.
+    """
+    labels = {'agent': agent, 'model': model}
+    started = time.perf_counter()
+    parts: List[str] = []
+    usage = None
+    chunks = 0
+    verdict_seen = False
+    aborted = False
+
+    with metrics.track_call(service, operation):
+        stream = client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+        try:
+            for chunk in stream:
+                usage = _usage(chunk) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+
+                if not parts:
+                    metrics.LLM_TIME_TO_FIRST_TOKEN.labels(**labels).observe(time.perf_counter() - started)
+                chunks += 1
+                parts.append(delta)
+                scanner.feed(delta)
+
+                if not verdict_seen and scanner.verdict is not None:
+                    verdict_seen = True
+                    metrics.LLM_TIME_TO_VERDICT.labels(**labels).observe(time.perf_counter() - started)
+                if scanner.hard_reject:
+                    aborted = True
+                    metrics.LLM_EARLY_ABORTS.labels(**labels).inc()
+                    break
+        finally:
+            stream.close()
+
+    # A trailing line without a newline still counts for prose scanners
+    scanner.feed('\n')
+
+    completion_tokens = chunks
+    if usage is not None:
+        metrics.record_usage(agent, model, usage)
+        completion_tokens = getattr(usage, 'completion_tokens', None) or chunks
+    elif chunks:
+        metrics.LLM_TOKENS.labels(agent=agent, model=model, kind='completion').inc(chunks)
+
+    return StreamedCompletion(''.join(parts), dict(scanner.fields), scanner.verdict, aborted,
+                              usage, completion_tokens)
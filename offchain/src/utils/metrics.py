@@ -0,0 +1,181 @@
+"""
+Metrics
+Prometheus instrumentation for the Python valuation services (prometheus_client)
+
+Exporters (both optional, enabled by environment):
+    METRICS_PORT              serve /metrics over HTTP from a daemon thread
+    METRICS_TEXTFILE          write the metrics to a .prom file at exit, for
+                              node_exporter's textfile collector (suits the
+                              short-lived agent/satellite processes)
+    PROMETHEUS_MULTIPROC_DIR  prometheus_client multiprocess mode: every process
+                              writes its samples here and both exporters report
+                              the sum over all processes. Defaults to
+                              <METRICS_TEXTFILE>.d when only the textfile is set.
+"""
+import os
+import sys
+import time
+import atexit
+from contextlib import contextmanager
+
+# Multiprocess mode is picked when prometheus_client is imported, so the
+# directory has to be in the environment first
+if os.getenv('METRICS_TEXTFILE') and not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.getenv('METRICS_TEXTFILE') + '.d'
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess,
+    start_http_server, write_to_textfile
+)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45, 90, 180)
+
+
+# --- Metric definitions -------------------------------------------------------
+
+EXTERNAL_CALL_SECONDS = Histogram(
+    'valuation_external_call_seconds',
+    'Latency of external calls (Earth Engine, image downloads, Custom Search, LLM providers)',
+    ('service', 'operation'), buckets=LATENCY_BUCKETS
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    'valuation_external_call_errors',
+    'External calls that raised or returned an error',
+    ('service', 'operation')
+)
+FALLBACKS = Counter(
+    'valuation_fallbacks',
+    'Degraded paths taken, e.g. no market prices found or template reasoning used',
+    ('component', 'reason')
+)
+LLM_TOKENS = Counter(
+    'valuation_llm_tokens',
+    'LLM tokens used, by agent, model and kind (prompt/completion)',
+    ('agent', 'model', 'kind')
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    'valuation_llm_time_to_first_token_seconds',
+    'Time from sending a streamed LLM request to its first content token',
+    ('agent', 'model'), buckets=LATENCY_BUCKETS
+)
+LLM_TIME_TO_VERDICT = Histogram(
+    'valuation_llm_time_to_verdict_seconds',
+    'Time from sending a streamed verification request until is_land_document/authenticity_score are known',
+    ('agent', 'model'), buckets=LATENCY_BUCKETS
+)
+LLM_EARLY_ABORTS = Counter(
+    'valuation_llm_early_aborts',
+    'Streamed verifications cancelled early on a hard reject (not a land document)',
+    ('agent', 'model')
+)
+IMAGE_BYTES = Counter(
+    'valuation_image_bytes',
+    'Satellite image bytes downloaded',
+    ('kind',)
+)
+AGENT_ERRORS = Counter(
+    'valuation_agent_errors',
+    'Agent phases that returned an error result, by agent and phase',
+    ('agent', 'phase')
+)
+QUEUE_DEPTH = Gauge(
+    'valuation_queue_depth',
+    'Jobs waiting in each pipeline stage queue',
+    ('stage',), multiprocess_mode='livesum'
+)
+QUEUE_IN_FLIGHT = Gauge(
+    'valuation_queue_in_flight',
+    'Jobs currently running in each pipeline stage',
+    ('stage',), multiprocess_mode='livesum'
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'valuation_queue_wait_seconds',
+    'Time jobs spent queued before starting (or being dropped)',
+    ('stage',), buckets=LATENCY_BUCKETS
+)
+QUEUE_REJECTIONS = Counter(
+    'valuation_queue_rejections',
+    'Jobs shed by a stage queue, by stage and reason (full/expired)',
+    ('stage', 'reason')
+)
+CACHE_REQUESTS = Counter(
+    'valuation_cache_requests',
+    'Local cache and index lookups, by cache and result (hit/miss)',
+    ('cache', 'result')
+)
+
+
+@contextmanager
+def track_call(service: str, operation: str):
+    """Time an external call and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.labels(service=service, operation=operation).inc()
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service=service, operation=operation).observe(time.perf_counter() - start)
+
+
+def record_usage(agent: str, model: str, usage) -> None:
+    """Count prompt/completion tokens from an OpenAI-style usage object"""
+    if usage is None:
+        return
+    prompt = getattr(usage, 'prompt_tokens', None) or 0
+    completion = getattr(usage, 'completion_tokens', None) or 0
+    if prompt:
+        LLM_TOKENS.labels(agent=agent, model=model, kind='prompt').inc(prompt)
+    if completion:
+        LLM_TOKENS.labels(agent=agent, model=model, kind='completion').inc(completion)
+
+
+# --- Exposition ---------------------------------------------------------------
+
+def exposition_registry():
+    """Registry to export: all processes in multiprocess mode, else this one"""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+_exporters_started = False
+
+
+def start_exporters() -> None:
+    """Start whichever exporters are configured in the environment (idempotent)"""
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+
+    if MULTIPROC_DIR:
+        # Live gauges of this process stop counting once it exits
+        atexit.register(multiprocess.mark_process_dead, os.getpid())
+
+    port = os.getenv('METRICS_PORT')
+    if port:
+        try:
+            start_http_server(int(port), addr='127.0.0.1', registry=exposition_registry())
+        except OSError as e:
+            # In multiprocess mode the process holding the port serves these metrics too
+            scope = 'served by the process holding the port' if MULTIPROC_DIR else 'not served over HTTP'
+            print(f"⚠️  Metrics port {port} unavailable ({e}); this process's metrics are {scope}", file=sys.stderr)
+
+    textfile = os.getenv('METRICS_TEXTFILE')
+    if textfile:
+        os.makedirs(os.path.dirname(os.path.abspath(textfile)), exist_ok=True)
+        atexit.register(write_textfile, textfile)
+
+
+def write_textfile(path: str) -> None:
+    """Write the exported metrics to a textfile-collector file (atomic replace)"""
+    try:
+        write_to_textfile(path, exposition_registry())
+    except OSError as e:
+        print(f"⚠️  Could not write metrics textfile {path}: {e}", file=sys.stderr)
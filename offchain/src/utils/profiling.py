@@ -0,0 +1,175 @@
+"""
+Profiling
+Opt-in per-request profiles written as collapsed stacks for flamegraph tools
+"""
+import os
+import re
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.profiles')
+)
+# Profile every request, not only those asking for it with --profile or "profile": true
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+# 'sample' writes <tag>.folded (wall clock, includes time blocked on sockets);
+# 'cprofile' writes <tag>.prof for pstats/snakeviz
+PROFILE_MODES = ('sample', 'cprofile')
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')
+SAMPLE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+# Frames kept per sampled stack (innermost first); deeper stacks are cut at the root side
+MAX_STACK_DEPTH = int(os.getenv('PROFILE_MAX_DEPTH', '64'))
+TRUNCATED_LABEL = '[truncated]'
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def profiling_requested(data: Optional[Dict] = None, argv: Optional[List[str]] = None) -> bool:
+    """True when PROFILE_REQUESTS is set, --profile is passed or the payload has "profile": true"""
+    if PROFILE_REQUESTS:
+        return True
+    if '--profile' in (sys.argv[1:] if argv is None else argv):
+        return True
+    return bool(data and data.get('profile'))
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler.
+
+    A daemon thread records the stack of every other thread each interval and
+    counts identical stacks. Each line of the output is
+    `<thread>;<outermost frame>;...;<innermost frame> <samples>`, the collapsed
+    format read by flamegraph.pl, speedscope and inferno.
+
+    Stacks deeper than max_depth keep their innermost frames under a
+    `[truncated]` frame. `sampling_seconds` is the time spent taking samples,
+    so the sampler's own overhead can be checked against the request time.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, max_depth: int = MAX_STACK_DEPTH):
+        self.interval = interval
+        self.max_depth = max(1, max_depth)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self._labels: Dict = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            start = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    code = frame.f_code
+                    label = self._labels.get(code)
+                    if label is None:
+                        label = self._labels[code] = _frame_label(code)
+                    labels.append(label)
+                    frame = frame.f_back
+                if frame is not None:
+                    labels.append(TRUNCATED_LABEL)
+                labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+            self.sampling_seconds += time.perf_counter() - start
+
+    def summary(self, elapsed: float) -> str:
+        """Samples taken against those expected, and the share of time spent sampling"""
+        expected = int(elapsed / self.interval) if self.interval > 0 else 0
+        overhead = self.sampling_seconds / elapsed if elapsed > 0 else 0.0
+        return (f"{self.samples}/{expected} samples at {self.interval * 1000:g} ms, "
+                f"sampler overhead {overhead:.1%}")
+
+    def write(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_path(name: str, request_id=None, extension: str = 'folded') -> str:
+    """`<PROFILE_DIR>/<name>-<request id>-<timestamp>.<extension>`"""
+    tag = _UNSAFE_CHARS.sub('_', str(request_id)) if request_id is not None else f"pid{os.getpid()}"
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return os.path.join(PROFILE_DIR, f"{name}-{tag}-{stamp}-{os.getpid()}.{extension}")
+
+
+@contextmanager
+def profile_request(name: str, data: Optional[Dict] = None,
+                    argv: Optional[List[str]] = None) -> Iterator[Optional[str]]:
+    """
+    Profile the enclosed block if profiling was requested for it.
+
+    Yields the path the profile will be written to, or None when profiling is
+    off (in which case nothing else happens). The file is tagged with the
+    payload's request_id.
+    """
+    if not profiling_requested(data, argv):
+        yield None
+        return
+
+    mode = PROFILE_MODE if PROFILE_MODE in PROFILE_MODES else 'sample'
+    path = profile_path(name, (data or {}).get('request_id'), 'prof' if mode == 'cprofile' else 'folded')
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler()
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        yield path
+    finally:
+        elapsed = time.perf_counter() - start
+        if mode == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(path)
+            details = f"{elapsed:.2f}s"
+        else:
+            profiler.stop()
+            profiler.write(path)
+            details = f"{elapsed:.2f}s, {profiler.summary(elapsed)}"
+        print(f"Profile for {name} ({details}) written to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # python -m src.utils.profiling <profile.folded> [top]
+    # Self time per frame from a collapsed-stack profile
+    path = sys.argv[1]
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    self_samples: Counter = Counter()
+    total = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            self_samples[stack.rsplit(';', 1)[-1]] += int(count)
+            total += int(count)
+
+    for label, count in self_samples.most_common(top):
+        print(f"{count / total:7.1%}  {count:6d}  {label}")
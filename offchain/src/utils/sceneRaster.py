@@ -0,0 +1,149 @@
+"""
+Scene raster
+Per-parcel statistics and image crops computed locally from one shared Sentinel-2 raster
+"""
+import math
+import numpy as np
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+# Bands fetched for a shared raster: everything the views and indices need
+RASTER_BANDS = ('B2', 'B3', 'B4', 'B8', 'B11')
+PIXEL_M = 10
+METERS_PER_DEGREE = 111320.0
+
+# Normalized difference indices: (band a, band b) -> (a - b) / (a + b)
+INDEX_BANDS = {
+    'ndvi': ('B8', 'B4'),    # vegetation
+    'ndbi': ('B11', 'B8'),   # built-up
+    'ndwi': ('B3', 'B8')     # open water
+}
+
+# Linear colour ramp stops for palette views
+PALETTE_COLORS = {
+    'red': (255, 0, 0),
+    'yellow': (255, 255, 0),
+    'green': (0, 128, 0)
+}
+
+
+def degrees_for_meters(meters: float, latitude: float) -> Tuple[float, float]:
+    """(lat, lon) degree offsets spanning `meters` at a latitude"""
+    return (meters / METERS_PER_DEGREE,
+            meters / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6)))
+
+
+def grid_dimensions(west: float, south: float, east: float, north: float) -> Tuple[int, int]:
+    """(width, height) in pixels of a bounding box at PIXEL_M resolution"""
+    mid_latitude = (south + north) / 2
+    lat_step, lon_step = degrees_for_meters(PIXEL_M, mid_latitude)
+    return max(1, math.ceil((east - west) / lon_step)), max(1, math.ceil((north - south) / lat_step))
+
+
+class SceneRaster:
+    """
+    Multi-band raster over a lat/lon bounding box (EPSG:4326 grid, row 0 at
+    the north edge). Pixels that are 0 in every band are treated as no data
+    (masked clouds, or outside the scene).
+    """
+
+    def __init__(self, bands: Dict[str, np.ndarray], west: float, south: float, east: float, north: float):
+        self.bands = {name: np.asarray(values, dtype=np.float32) for name, values in bands.items()}
+        self.height, self.width = next(iter(self.bands.values())).shape
+        self.west, self.south, self.east, self.north = west, south, east, north
+        self.lat_step = (north - south) / self.height
+        self.lon_step = (east - west) / self.width
+        self.valid = np.any(np.stack([values != 0 for values in self.bands.values()]), axis=0)
+        self._indices: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_npy(cls, array: np.ndarray, west: float, south: float, east: float, north: float) -> 'SceneRaster':
+        """From the structured array of an Earth Engine NPY download (one field per band)"""
+        return cls({name: array[name] for name in array.dtype.names}, west, south, east, north)
+
+    def index(self, name: str) -> np.ndarray:
+        """Normalized difference index; NaN where there is no data"""
+        if name not in self._indices:
+            a, b = (self.bands[band] for band in INDEX_BANDS[name])
+            total = a + b
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.where(self.valid & (total != 0), (a - b) / total, np.nan)
+            self._indices[name] = values.astype(np.float32)
+        return self._indices[name]
+
+    def _window(self, latitude: float, longitude: float, radius_m: float) -> Tuple[slice, slice]:
+        lat_offset, lon_offset = degrees_for_meters(radius_m, latitude)
+        top = max(0, int((self.north - (latitude + lat_offset)) / self.lat_step))
+        bottom = min(self.height, math.ceil((self.north - (latitude - lat_offset)) / self.lat_step))
+        left = max(0, int((longitude - lon_offset - self.west) / self.lon_step))
+        right = min(self.width, math.ceil((longitude + lon_offset - self.west) / self.lon_step))
+        return slice(top, bottom), slice(left, right)
+
+    def _disc(self, latitude: float, longitude: float, radius_m: float) -> Tuple[Tuple[slice, slice], np.ndarray]:
+        """Window around a point and the mask of pixel centres within radius_m"""
+        rows, cols = self._window(latitude, longitude, radius_m)
+        pixel_lat = self.north - (np.arange(rows.start, rows.stop) + 0.5) * self.lat_step
+        pixel_lon = self.west + (np.arange(cols.start, cols.stop) + 0.5) * self.lon_step
+        dy = (pixel_lat[:, None] - latitude) * METERS_PER_DEGREE
+        dx = (pixel_lon[None, :] - longitude) * METERS_PER_DEGREE * math.cos(math.radians(latitude))
+        return (rows, cols), dx ** 2 + dy ** 2 <= radius_m ** 2
+
+    def index_values(self, name: str, latitude: float, longitude: float, radius_m: float) -> np.ndarray:
+        """Valid index values of the pixels within radius_m of a point"""
+        window, disc = self._disc(latitude, longitude, radius_m)
+        values = self.index(name)[window][disc]
+        return values[~np.isnan(values)]
+
+    def mean_index(self, name: str, latitude: float, longitude: float, radius_m: float):
+        values = self.index_values(name, latitude, longitude, radius_m)
+        return float(values.mean()) if values.size else None
+
+    def roi_statistics(self, latitude: float, longitude: float, radii: List[float],
+                       indices: List[str], percentiles: List[int]) -> Dict:
+        """{radius: {index: {mean, stddev, p10, ...}}}, the same shape as the Earth Engine path"""
+        nested = {}
+        for radius in radii:
+            by_index = {}
+            for name in indices:
+                values = self.index_values(name, latitude, longitude, radius)
+                stats = {'mean': None, 'stddev': None}
+                stats.update({f"p{p}": None for p in percentiles})
+                if values.size:
+                    stats['mean'] = round(float(values.mean()), 4)
+                    stats['stddev'] = round(float(values.std(ddof=1)) if values.size > 1 else 0.0, 4)
+                    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                        stats[f"p{p}"] = round(float(value), 4)
+                by_index[name] = stats
+            nested[str(radius)] = by_index
+        return nested
+
+    def render(self, params: Dict, latitude: float, longitude: float, half_size_m: float,
+               size: int) -> Image.Image:
+        """
+        Square crop around a point, styled like an Earth Engine thumbnail:
+        params has either 'bands' (three bands, with min/max/gamma) or an
+        index 'index' with min/max/palette.
+        """
+        window = self._window(latitude, longitude, half_size_m)
+        low, high = params.get('min', 0), params.get('max', 1)
+
+        if 'palette' in params:
+            values = self.index(params.get('index', 'ndvi'))[window]
+            scaled = np.clip((np.nan_to_num(values, nan=low) - low) / (high - low), 0, 1)
+            stops = np.array([PALETTE_COLORS[color] for color in params['palette']], dtype=np.float32)
+            position = scaled * (len(stops) - 1)
+            lower = np.minimum(position.astype(int), len(stops) - 2)
+            fraction = (position - lower)[..., None]
+            rgb = stops[lower] * (1 - fraction) + stops[lower + 1] * fraction
+        else:
+            stacked = np.stack([self.bands[band][window] for band in params['bands']], axis=-1)
+            scaled = np.clip((stacked - low) / (high - low), 0, 1)
+            if params.get('gamma'):
+                scaled = scaled ** (1 / params['gamma'])
+            rgb = scaled * 255
+
+        rgb[~self.valid[window]] = 0
+        image = Image.fromarray(rgb.astype(np.uint8), 'RGB')
+        scale = size / max(image.size)
+        return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BICUBIC)
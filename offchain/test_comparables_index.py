@@ -0,0 +1,80 @@
+"""
+Checks for the geohash helpers and the comparables index
+Run: python test_comparables_index.py (or pytest)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils import geohash
+from src.services.comparablesIndex import ComparablesIndex
+
+
+def test_geohash_encode():
+    assert geohash.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash.encode(13.08, 80.27, 6) == geohash.encode(13.0801, 80.2701, 6)
+
+
+def test_geohash_neighbours():
+    cells = geohash.neighbours(13.08, 80.27, 6)
+    assert len(cells) == 9
+    assert cells[4] == geohash.encode(13.08, 80.27, 6)
+    lat_step, lon_step = geohash.cell_size(6)
+    assert geohash.encode(13.08 + lat_step, 80.27, 6) in cells
+    assert geohash.encode(13.08, 80.27 - lon_step, 6) in cells
+    assert geohash.encode(13.08 + 2 * lat_step, 80.27, 6) not in cells
+
+
+def _index(directory):
+    return ComparablesIndex(os.path.join(directory, 'valuations.sqlite'))
+
+
+def test_nearest_crosses_cell_edges():
+    with tempfile.TemporaryDirectory() as directory:
+        index = _index(directory)
+        lat_step, lon_step = geohash.cell_size(6)
+        # Query just inside a cell edge: the closest comparable sits two cells over
+        # the edge, so the fine 3x3 block holds only the farther ones
+        lat = (int(13.08 / lat_step) + 1) * lat_step - 1e-6
+        index.add(lat + 1.05 * lat_step, 80.27, 100000, 100, parcel_id='near')
+        for i in range(5):
+            index.add(lat - 1.5 * lat_step, 80.27 + (i - 2) * 0.2 * lon_step, 100000, 100, parcel_id=f'far-{i}')
+
+        nearest = index.nearest(lat, 80.27, k=1)
+        assert nearest[0]['parcel_id'] == 'near'
+
+
+def test_parcel_keeps_latest_valuation():
+    with tempfile.TemporaryDirectory() as directory:
+        index = _index(directory)
+        assert index.add(13.08, 80.27, 100000, 100, parcel_id='p1', request_id='r1')
+        assert index.add(13.08, 80.27, 150000, 100, parcel_id='p1', request_id='r2')
+        assert index.add(13.08, 80.27, 999999, 100, parcel_id='p1', request_id='r2') is None
+        # Without an id, the same coordinates are the same parcel
+        index.add(13.09, 80.28, 100000, 100)
+        index.add(13.09, 80.28, 120000, 100)
+
+        assert len(index) == 2
+        assert index.nearest(13.08, 80.27, k=1)[0]['valuation'] == 150000
+        assert index.nearest(13.09, 80.28, k=1)[0]['valuation'] == 120000
+
+
+def test_price_baseline_weights_by_distance():
+    with tempfile.TemporaryDirectory() as directory:
+        index = _index(directory)
+        index.add(13.0800, 80.2700, 100000, 100, parcel_id='close')   # 1000/sqm, ~0 m
+        index.add(13.0845, 80.2700, 300000, 100, parcel_id='distant')  # 3000/sqm, ~500 m
+
+        baseline = index.price_baseline(13.08, 80.27)
+        assert baseline['comparable_count'] == 2
+        # 1/d^2 with a 25 m floor: (1000/625 + 3000/250000) / (1/625 + 1/250000)
+        assert abs(baseline['price_per_sqm'] - 1004.99) < 1
+        assert index.price_baseline(14.5, 78.0)['comparable_count'] == 0
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} comparables index checks passed")
@@ -0,0 +1,162 @@
+"""
+Checks for the near-duplicate document index (MinHash/LSH thresholds, same-parcel resubmissions)
+Run: python test_duplicate_index.py (or pytest)
+"""
+import os
+import sys
+import random
+import sqlite3
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services import duplicateIndex
+from src.services.duplicateIndex import DuplicateIndex, check_documents, duplicate_red_flag
+
+
+def _deed(seed, words=200):
+    rng = random.Random(seed)
+    return ' '.join(f"w{rng.randrange(100000)}" for _ in range(words))
+
+
+def _edit(text, count, seed=0):
+    """Replace `count` evenly spaced words"""
+    words = text.split()
+    for i in range(count):
+        words[(i + 1) * len(words) // (count + 1)] = f"edit{seed}x{i}"
+    return ' '.join(words)
+
+
+class _SharedIndex:
+    """Point check_documents at a temporary index"""
+
+    def __init__(self, directory):
+        self.index = DuplicateIndex(os.path.join(directory, 'index.sqlite'))
+
+    def __enter__(self):
+        self.previous = duplicateIndex._index
+        duplicateIndex._index = self.index
+        return self.index
+
+    def __exit__(self, *exc):
+        duplicateIndex._index = self.previous
+
+
+def test_near_duplicate_flagged_unrelated_ignored():
+    with tempfile.TemporaryDirectory() as directory:
+        index = DuplicateIndex(os.path.join(directory, 'index.sqlite'))
+        original = _deed(1)
+        index.add(original, 'r1')
+
+        exact = index.query(original)
+        assert exact and exact[0]['exact'] and exact[0]['similarity'] == 1.0
+        # Two words changed out of 200: ~90% of the shingles survive
+        near = index.query(_edit(original, 2))
+        assert near and 0.8 <= near[0]['similarity'] < 1.0 and not near[0]['exact']
+        # Half the text replaced: ~1/3 Jaccard, below the flag threshold
+        half = original.split()[:100] + _deed(2).split()[:100]
+        assert index.query(' '.join(half)) == []
+        assert index.query(_deed(3)) == []
+        # Too short to compare, and own request ignored
+        assert index.query('w1 w2 w3') == []
+        assert index.query(original, exclude_request_id='r1') == []
+
+
+def test_cross_parcel_copy_rejected():
+    with tempfile.TemporaryDirectory() as directory, _SharedIndex(directory):
+        deed = _deed(4)
+        check_documents([deed], 'r1', submission={'parcel_id': 'P-1', 'owner': '0xAAA'})
+        check = check_documents([deed], 'r2', submission={'parcel_id': 'P-2', 'owner': '0xBBB'})
+        assert check['duplicate'] and check['reject'] and check['error'] is None
+        match = check['matches'][0]
+        assert match['request_id'] == 'r1' and not match['resubmission']
+        assert 'same parcel' not in duplicate_red_flag(check)
+
+
+def test_same_parcel_resubmission_only_flagged():
+    with tempfile.TemporaryDirectory() as directory, _SharedIndex(directory):
+        deed = _deed(5)
+        check_documents([deed], 'r1', submission={'parcel_id': 'P-1', 'latitude': 13.08, 'longitude': 80.27})
+
+        by_id = check_documents([deed], 'r2', submission={'parcel_id': 'p-1 '}, record=False)
+        assert by_id['duplicate'] and not by_id['reject']
+        assert by_id['matches'][0]['same_parcel']
+        assert 'resubmission' in duplicate_red_flag(by_id)
+
+        # No parcel_id, but ~20 m from the first submission
+        nearby = check_documents([deed], 'r3', submission={'latitude': 13.08018, 'longitude': 80.27}, record=False)
+        assert nearby['duplicate'] and not nearby['reject']
+
+        # ~1 km away is another parcel
+        far = check_documents([deed], 'r4', submission={'latitude': 13.09, 'longitude': 80.27}, record=False)
+        assert far['reject']
+        # Neither parcel details nor owner to compare: not known to be a resubmission
+        assert check_documents([deed], 'r5', record=False)['reject']
+
+
+def test_same_owner_stands_in_without_parcel_details():
+    with tempfile.TemporaryDirectory() as directory, _SharedIndex(directory):
+        deed = _deed(6)
+        check_documents([deed], 'r1', submission={'owner': '0xAbC'})
+        same_owner = check_documents([deed], 'r2', submission={'owner': '0xabc'})
+        assert same_owner['duplicate'] and not same_owner['reject']
+        assert same_owner['matches'][0]['same_owner']
+        other_owner = check_documents([deed], 'r3', submission={'owner': '0xdef'}, record=False)
+        assert other_owner['reject']
+
+
+def test_rejection_names_other_parcel_before_resubmission():
+    with tempfile.TemporaryDirectory() as directory, _SharedIndex(directory):
+        deed = _deed(7)
+        check_documents([deed], 'mine', submission={'parcel_id': 'P-1'})
+        check_documents([deed], 'theirs', submission={'parcel_id': 'P-9'})
+        check = check_documents([deed], 'again', submission={'parcel_id': 'P-1'})
+        # Both are exact copies; the other parcel's one decides the outcome
+        assert check['reject']
+        assert check['matches'][0]['request_id'] == 'theirs'
+
+
+def test_candidates_queried_in_chunks():
+    with tempfile.TemporaryDirectory() as directory:
+        index = DuplicateIndex(os.path.join(directory, 'index.sqlite'))
+        deed = _deed(8)
+        for i in range(25):
+            index.add(deed, f"r{i}")
+        chunk = duplicateIndex.QUERY_CHUNK
+        duplicateIndex.QUERY_CHUNK = 7
+        try:
+            matches = index.query(deed, limit=100)
+        finally:
+            duplicateIndex.QUERY_CHUNK = chunk
+        assert sorted(m['request_id'] for m in matches) == sorted(f"r{i}" for i in range(25))
+
+
+def test_older_index_gains_submission_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.sqlite')
+        db = sqlite3.connect(path)
+        db.execute('''CREATE TABLE documents (
+            id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL, request_id TEXT,
+            signature BLOB NOT NULL, word_count INTEGER NOT NULL, created_at REAL NOT NULL,
+            UNIQUE (content_hash, request_id))''')
+        db.commit()
+        db.close()
+
+        index = DuplicateIndex(path)
+        deed = _deed(9)
+        index.add(deed, 'r1', {'parcel_id': 'P-1'})
+        assert index.query(deed, submission={'parcel_id': 'P-1'})[0]['same_parcel']
+
+
+def test_unreadable_index_reported():
+    with tempfile.TemporaryDirectory() as directory, _SharedIndex(directory) as index:
+        index._db.close()
+        check = check_documents([_deed(10)], 'r1')
+        assert check['error'] and not check['duplicate'] and not check['reject']
+        assert duplicate_red_flag(check).startswith('Duplicate check unavailable')
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} duplicate index checks passed")
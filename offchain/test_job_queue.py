@@ -0,0 +1,140 @@
+"""
+Checks for the stage queues and the pipeline server's admission control
+Run: python test_job_queue.py (or pytest)
+"""
+import io
+import os
+import sys
+import json
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.jobQueue import DeadlineExceeded, QueueFull, StageQueue, StageQueues
+
+
+def _blocked_queue(max_depth=None):
+    """A one-worker queue whose worker is held until the returned event is set"""
+    queue = StageQueue('test', 1, max_depth)
+    release = threading.Event()
+    started = threading.Event()
+    queue.submit(lambda: (started.set(), release.wait()))
+    started.wait(5)
+    return queue, release
+
+
+def test_heap_order_priority_deadline_arrival():
+    queue, release = _blocked_queue()
+    order = []
+    now = time.time()
+    futures = [
+        queue.submit(order.append, 'low'),
+        queue.submit(order.append, 'high-late', priority=5, deadline=now + 60),
+        queue.submit(order.append, 'high-soon', priority=5, deadline=now + 30),
+        queue.submit(order.append, 'high-none-1', priority=5),
+        queue.submit(order.append, 'high-none-2', priority=5),
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    queue.shutdown()
+    assert order == ['high-soon', 'high-late', 'high-none-1', 'high-none-2', 'low']
+
+
+def test_max_depth_rejects():
+    queue, release = _blocked_queue(max_depth=2)
+    accepted = [queue.submit(lambda: 'ok') for _ in range(2)]
+    rejected = queue.submit(lambda: 'ok')
+    try:
+        rejected.result(1)
+        raise AssertionError('expected QueueFull')
+    except QueueFull:
+        pass
+    release.set()
+    assert [future.result(5) for future in accepted] == ['ok', 'ok']
+    queue.shutdown()
+
+
+def test_deadline_expiry():
+    queue, release = _blocked_queue()
+    try:
+        queue.submit(lambda: 'late', deadline=time.time() - 1).result(1)
+        raise AssertionError('expected DeadlineExceeded before queueing')
+    except DeadlineExceeded:
+        pass
+
+    ran = []
+    expiring = queue.submit(ran.append, 'x', deadline=time.time() + 0.05)
+    time.sleep(0.1)
+    release.set()
+    try:
+        expiring.result(5)
+        raise AssertionError('expected DeadlineExceeded while queued')
+    except DeadlineExceeded:
+        pass
+    queue.shutdown()
+    assert ran == []
+
+
+def _pipeline():
+    # The agents read their API keys at import time
+    for key in ('GROQ_API_KEY', 'OPENROUTER_API_KEY'):
+        os.environ.setdefault(key, 'test')
+    from src.services import analysisPipeline
+    return analysisPipeline
+
+
+def _serve(pipeline, lines, analysis, max_requests=4):
+    original = pipeline.run_property_analysis
+    pipeline.run_property_analysis = analysis
+    queues = StageQueues({'agents': 1})
+    responses = io.StringIO()
+    try:
+        pipeline.serve(io.StringIO(''.join(json.dumps(line) + '\n' for line in lines)), responses, queues, max_requests)
+    finally:
+        pipeline.run_property_analysis = original
+        queues.shutdown()
+    return {message['id']: message for message in map(json.loads, responses.getvalue().splitlines())}
+
+
+def test_serve_sheds_with_429():
+    pipeline = _pipeline()
+
+    def analysis(payload, queues):
+        if payload.get('full'):
+            raise QueueFull('satellite: 32 jobs already waiting')
+        agents = [pipeline._shed_result(name, DeadlineExceeded('agents: deadline passed'))
+                  for name in ('groq', 'openrouter', 'llama')]
+        if payload.get('ok'):
+            agents[0] = {'valuation': 1, 'confidence': 50, 'agent': 'groq'}
+        return {'satellite_data': {}, 'market_data': {}, 'agents': agents}
+
+    answers = _serve(pipeline, [
+        {'id': 'a', 'payload': {'ok': True}},
+        {'id': 'b', 'payload': {'full': True}},
+        {'id': 'c', 'payload': {}},
+    ], analysis)
+    assert answers['a']['status'] == 200
+    assert answers['b']['status'] == 429 and 'jobs already waiting' in answers['b']['error']
+    assert answers['c']['status'] == 429
+
+
+def test_serve_limits_requests_in_flight():
+    pipeline = _pipeline()
+    release = threading.Event()
+
+    def analysis(payload, queues):
+        release.wait(5)
+        return {'satellite_data': {}, 'market_data': {}, 'agents': [{'valuation': 1}]}
+
+    # The third request arrives while both slots are taken
+    threading.Timer(0.5, release.set).start()
+    answers = _serve(pipeline, [{'id': str(i), 'payload': {}} for i in range(3)], analysis, max_requests=2)
+    assert [answers[str(i)]['status'] for i in range(3)] == [200, 200, 429]
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} job queue checks passed")
@@ -0,0 +1,78 @@
+"""
+Checks for the memory-mapped listing store
+Run: python test_listing_store.py (or pytest)
+"""
+import os
+import sys
+import csv
+import math
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services.listingStore import ListingStore, ingest, SQFT_TO_SQM
+
+
+def _write_csv(path, rows, header=('latitude', 'lng', 'sale_price', 'area')):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 6371008.8 * math.asin(min(1.0, math.sqrt(a)))
+
+
+def test_ingest_skips_bad_rows_and_converts_area():
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'listings.csv')
+        _write_csv(csv_path, [
+            (13.08, 80.27, '1,000,000', 1000),
+            (13.08, 80.27, 'call for price', 1000),
+            (13.08, 80.27, -5, 1000),
+            (95.0, 80.27, 1000, 1000),
+        ])
+        meta = ingest([csv_path], os.path.join(directory, 'store'), area_unit='sqft', record_digest=False)
+        assert meta['rows'] == 1
+
+        store = ListingStore(os.path.join(directory, 'store'))
+        distribution = store.price_per_sqm_distribution(13.08, 80.27, 100)
+        assert distribution['count'] == 1
+        assert abs(distribution['p50'] - 1000 / SQFT_TO_SQM) / distribution['p50'] < 1e-5
+
+
+def test_distribution_matches_brute_force():
+    rng = np.random.default_rng(7)
+    lats = 13.08 + rng.uniform(-0.03, 0.03, 2000)
+    lons = 80.27 + rng.uniform(-0.03, 0.03, 2000)
+    prices = rng.uniform(1e5, 1e6, 2000)
+    areas = rng.uniform(50, 500, 2000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'listings.csv')
+        _write_csv(csv_path, zip(lats, lons, prices, areas))
+        # Small cells so the 1 km query spans many grid rows and columns
+        ingest([csv_path], os.path.join(directory, 'store'), cell_deg=0.002, record_digest=False)
+        store = ListingStore(os.path.join(directory, 'store'))
+
+        distribution = store.price_per_sqm_distribution(13.08, 80.27, 1000)
+        expected = np.array([
+            np.float32(p) / np.float32(a) for lat, lon, p, a in zip(lats, lons, prices, areas)
+            if _haversine_m(13.08, 80.27, float(np.float32(lat)), float(np.float32(lon))) <= 1000
+        ], dtype=np.float64)
+
+        assert distribution['count'] == len(expected)
+        assert abs(distribution['p50'] - np.percentile(expected, 50)) / distribution['p50'] < 1e-5
+        assert store.price_per_sqm_distribution(0.0, 0.0, 1000) == {'count': 0}
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} listing store checks passed")
@@ -0,0 +1,110 @@
+"""
+Checks for the streamed verdict scanners and early abort
+Run: python test_llm_stream.py (or pytest)
+"""
+import os
+import sys
+import random
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.llmStream import (
+    JsonVerdictScanner, ProseVerdictScanner, stream_completion, strip_verdict_lines
+)
+
+JSON_REJECT = '''```json
+{
+  "document_type_found": "Invoice \\"INV-7\\"",
+  "missing_fields": ["survey number", "boundaries"],
+  "details": {"is_land_document": true, "authenticity_score": 99},
+  "is_land_document": false,
+  "authenticity_score": 0,
+  "findings": "Not a deed"
+}
+```'''
+
+
+def _feed_in_chunks(scanner, text, seed):
+    rng = random.Random(seed)
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 7)
+        scanner.feed(text[position:position + size])
+        position += size
+    return scanner
+
+
+def test_json_scanner_any_chunking():
+    for seed in range(20):
+        scanner = _feed_in_chunks(JsonVerdictScanner(), JSON_REJECT, seed)
+        assert scanner.fields == {
+            'document_type_found': 'Invoice "INV-7"',
+            'is_land_document': False,
+            'authenticity_score': 0,
+            'findings': 'Not a deed'
+        }
+        assert scanner.verdict == {'is_land_document': False, 'authenticity_score': 0}
+        assert scanner.hard_reject
+
+
+def test_json_scanner_waits_for_score():
+    scanner = JsonVerdictScanner()
+    scanner.feed('{"is_land_document": false, "document_type_found": "Receipt", ')
+    assert scanner.verdict is None and not scanner.hard_reject
+    scanner.feed('"authenticity_score": 5}')
+    assert scanner.hard_reject
+
+
+def test_prose_scanner():
+    scanner = ProseVerdictScanner()
+    _feed_in_chunks(scanner, '**LAND DOCUMENT:** NO - this is a rental agreement**\nThe document', 1)
+    assert scanner.hard_reject
+    assert scanner.fields['verdict_reason'] == 'this is a rental agreement'
+    assert scanner.verdict == {'is_land_document': False, 'authenticity_score': 0}
+
+    scanner = ProseVerdictScanner()
+    scanner.feed('LAND DOCUMENT: YES\n')
+    assert scanner.verdict is None and not scanner.hard_reject
+    scanner.feed('**AUTHENTICITY SCORE:** 78\nSurvey number present.')
+    assert scanner.verdict == {'is_land_document': True, 'authenticity_score': 78}
+    assert strip_verdict_lines('LAND DOCUMENT: YES\nAUTHENTICITY SCORE: 78\nSurvey number present.') == 'Survey number present.'
+
+
+class _FakeStream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for part in self.parts:
+            self.consumed += 1
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+
+    def close(self):
+        self.closed = True
+
+
+def _client(stream):
+    create = lambda **kwargs: stream
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_stream_aborts_on_hard_reject():
+    stream = _FakeStream(['LAND DOCUMENT: NO - invoice\n', 'AUTHENTICITY', ' SCORE: 0\n', 'long reasoning'] * 5)
+    completion = stream_completion(_client(stream), 'test', 'verify', 'agent', 'model', [], ProseVerdictScanner())
+    assert completion.aborted and stream.closed
+    assert stream.consumed == 1
+    assert completion.verdict['is_land_document'] is False
+
+    stream = _FakeStream(['LAND DOCUMENT: YES\n', 'AUTHENTICITY SCORE: 80\n', 'Fine.'])
+    completion = stream_completion(_client(stream), 'test', 'verify', 'agent', 'model', [], ProseVerdictScanner())
+    assert not completion.aborted and stream.consumed == 3
+    assert completion.text.endswith('Fine.')
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} stream scanner checks passed")
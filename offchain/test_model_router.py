@@ -0,0 +1,87 @@
+"""
+Checks for the model router: tier choice, budgets and usage-fed statistics
+Run: python test_model_router.py (or pytest)
+"""
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services import modelRouter
+from src.services.modelRouter import ModelStats, prescreen_documents, route_request, track_route
+
+DEED = """SALE DEED. Survey No. 123/4, Village Kovur, Taluk Sriperumbudur, District Kanchipuram.
+Vendor: R. Kumar, 12 Main Road. Total extent 2400 sq ft. Bounded by: North by road,
+South by plot 5. Registered at the Sub-Registrar office."""
+INVOICE = "INVOICE #443. Bill to: Acme Traders. GSTIN 33AAAAA0000A1Z5. Amount due 12,000."
+
+
+def _with_stats(test):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            previous = modelRouter._stats
+            modelRouter._stats = ModelStats(os.path.join(directory, 'stats.json'))
+            try:
+                test()
+            finally:
+                modelRouter._stats = previous
+    run.__name__ = test.__name__
+    return run
+
+
+@_with_stats
+def test_only_clear_rejects_use_tier_1():
+    invoice = prescreen_documents([INVOICE])
+    deed = prescreen_documents([DEED])
+    assert invoice['confidence'] >= modelRouter.CONFIDENT and invoice['land_score'] < 0.5
+    assert deed['confidence'] >= modelRouter.CONFIDENT and deed['land_score'] > 0.5
+
+    reject = route_request('groq', 1500, invoice['confidence'], land_score=invoice['land_score'])
+    accept = route_request('groq', 1500, deed['confidence'], land_score=deed['land_score'])
+    unknown = route_request('groq', 1500, deed['confidence'])
+    assert reject.model == 'llama-3.1-8b-instant' and reject.reason == 'clear-cut reject'
+    assert accept.model == 'llama-3.3-70b-versatile'
+    assert unknown.model == 'llama-3.3-70b-versatile'
+    # Both clear-cut cases get the short completion budget
+    assert reject.max_tokens == accept.max_tokens == 800
+
+
+@_with_stats
+def test_budget_and_health_fallbacks():
+    cheap = route_request('groq', 1500, 0.2, budget={'cost_budget_usd': 0.0005})
+    assert cheap.model == 'llama-3.1-8b-instant' and cheap.reason == 'budget-limited'
+
+    for _ in range(10):
+        modelRouter.get_stats().record('llama-3.3-70b-versatile', 1.0, 0, error=True)
+    assert route_request('groq', 1500, 0.2).model == 'llama-3.1-8b-instant'
+    # agent3's paid model only takes over when the free one is unhealthy
+    assert route_request('llama', 1500, 0.2).model == 'meta-llama/llama-3.1-8b-instruct:free'
+
+
+@_with_stats
+def test_usage_feeds_latency_statistics():
+    recorded = []
+    stats = modelRouter.get_stats()
+    original = stats.record
+    stats.record = lambda model, seconds, tokens, error: (recorded.append(tokens), original(model, seconds, tokens, error))
+
+    route = route_request('openrouter', 1000, 0.2)
+    with track_route(route):
+        route.record_usage(SimpleNamespace(prompt_tokens=900, completion_tokens=100))
+    estimated = route_request('openrouter', 1000, 0.2)
+    with track_route(estimated):
+        pass
+    aborted = route_request('openrouter', 1000, 0.2)
+    with track_route(aborted):
+        aborted.record_usage(None, completion_tokens=12)
+
+    assert recorded == [1000, 1000 + estimated.max_tokens, 1012]
+    assert stats.load()[route.model]['calls'] == 3
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} model router checks passed")
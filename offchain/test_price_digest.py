@@ -0,0 +1,154 @@
+"""
+Checks for the locality price digest (t-digest accuracy, decay, per-currency keys)
+Run: python test_price_digest.py (or pytest)
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services import priceDigest
+from src.services.priceDigest import (
+    PriceDigestStore, TDigest, digest_metric, locality_summary, record_price_array, record_prices
+)
+
+
+class _SharedStore:
+    """Point the module-level helpers at a temporary store"""
+
+    def __init__(self, directory, **kwargs):
+        self.store = PriceDigestStore(os.path.join(directory, 'digests.sqlite'), **kwargs)
+
+    def __enter__(self):
+        self.previous = priceDigest._store
+        priceDigest._store = self.store
+        return self.store
+
+    def __exit__(self, *exc):
+        priceDigest._store = self.previous
+
+
+def test_quantiles_close_to_exact():
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(13, 0.6, 50000)
+    digest = TDigest()
+    for chunk in np.array_split(values, 50):
+        digest.add(chunk)
+
+    assert len(digest) <= 2 * priceDigest.COMPRESSION
+    assert digest.total_weight == len(values)
+    ordered = np.sort(values)
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        # Rank error: where the estimate falls in the exact distribution
+        rank = np.searchsorted(ordered, digest.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.01, (q, rank)
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+    inside = ordered[int(0.1 * len(values)):int(0.9 * len(values))]
+    assert abs(digest.trimmed_mean() / inside.mean() - 1) < 0.01
+
+
+def test_merge_matches_single_digest():
+    rng = np.random.default_rng(3)
+    a, b = rng.normal(100, 10, 5000), rng.normal(200, 10, 5000)
+    merged = TDigest()
+    merged.add(a)
+    other = TDigest()
+    other.add(b)
+    merged.merge(other)
+    assert abs(merged.quantile(0.5) - 150) < 20
+    assert merged.quantile(0.25) < 110 and merged.quantile(0.75) > 190
+
+
+def test_weights_halve_every_half_life():
+    with tempfile.TemporaryDirectory() as directory:
+        store = PriceDigestStore(os.path.join(directory, 'digests.sqlite'), half_life_days=1)
+        metric = digest_metric('total', 'USD')
+        store.add('tdr1w', [100000] * 40, metric)
+        # Age the stored digest by two half-lives
+        store._db.execute('UPDATE digests SET updated_at = updated_at - ?', (2 * 86400,))
+        assert abs(store.summary('tdr1w', metric)['weight'] - 10) < 0.01
+
+        # New prices count fully against the decayed old ones
+        store.add('tdr1w', [300000] * 30, metric)
+        summary = store.summary('tdr1w', metric)
+        assert abs(summary['weight'] - 40) < 0.01 and summary['value_count'] == 70
+        assert summary['median'] > 200000
+
+
+def test_currencies_and_kinds_never_merge():
+    with tempfile.TemporaryDirectory() as directory, _SharedStore(directory):
+        record_prices(13.08, 80.27, [4500000] * 20, 'INR')
+        record_prices(13.08, 80.27, [60000] * 20, 'usd')
+        record_price_array(np.full(20, 13.08), np.full(20, 80.27), np.full(20, 5000.0), 'INR', 'per_sqft')
+
+        inr = locality_summary(13.08, 80.27, 'INR')
+        usd = locality_summary(13.08, 80.27, 'USD')
+        per_sqft = locality_summary(13.08, 80.27, 'INR', 'per_sqft')
+        assert inr['median'] == 4500000 and inr['currency'] == 'INR'
+        assert usd['median'] == 60000 and usd['value_count'] == 20
+        assert per_sqft['median'] == 5000 and per_sqft['kind'] == 'per_sqft'
+        assert locality_summary(13.08, 80.27, 'EUR') is None
+
+        try:
+            record_prices(13.08, 80.27, [1], None)
+            raise AssertionError('expected ValueError for a price without currency')
+        except ValueError:
+            pass
+
+
+def test_oracle_override_needs_matching_currency():
+    for key in ('GROQ_API_KEY', 'OPENROUTER_API_KEY'):
+        os.environ.setdefault(key, 'test')
+    from src.services import priceOracle
+
+    searches = {
+        'usd': {'average_price': 500000, 'median_price': 500000, 'price_count': 3, 'confidence': 65,
+                'currency': 'USD'},
+        'inr': {'average_price': 4000000, 'median_price': 4000000, 'price_count': 3, 'confidence': 65,
+                'currency': 'INR'},
+        'none': {'error': 'No prices found', 'prices': [], 'average_price': 0, 'confidence': 0},
+    }
+    no_data = lambda *args, **kwargs: {'error': 'no data'}
+    originals = (priceOracle.get_comparables_valuation, priceOracle.get_listing_valuation,
+                 priceOracle.search_property_prices)
+    priceOracle.get_comparables_valuation = no_data
+    priceOracle.get_listing_valuation = no_data
+    try:
+        with tempfile.TemporaryDirectory() as directory, _SharedStore(directory):
+            record_prices(13.08, 80.27, [4500000] * 20, 'INR')
+            results = {}
+            for name, search in searches.items():
+                priceOracle.search_property_prices = lambda *args, search=search: dict(search)
+                results[name] = priceOracle.get_market_valuation('Chennai', 13.08, 80.27, 200)
+    finally:
+        (priceOracle.get_comparables_valuation, priceOracle.get_listing_valuation,
+         priceOracle.search_property_prices) = originals
+
+    # An INR digest must not replace dollar prices, nor stand in for a failed search
+    assert results['usd']['average_price'] == 500000 and 'locality_stats' not in results['usd']
+    assert results['inr']['average_price'] == 4500000 and results['inr']['batch_average_price'] == 4000000
+    assert results['none'].get('source') != 'price_digest'
+
+
+def test_search_prices_grouped_by_currency():
+    for key in ('GROQ_API_KEY', 'OPENROUTER_API_KEY'):
+        os.environ.setdefault(key, 'test')
+    from src.services.priceOracle import collect_prices, prices_by_currency
+
+    prices, sources = collect_prices([
+        {'title': 'Plot Rs 45,00,000', 'snippet': 'also 50 lakh', 'link': 'a'},
+        {'title': 'House $450,000', 'snippet': '', 'link': 'b'},
+    ])
+    assert sorted(prices) == [450000.0, 4500000.0, 5000000.0]
+    assert prices_by_currency(sources) == {'INR': [4500000.0, 5000000.0], 'USD': [450000.0]}
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} price digest checks passed")
@@ -0,0 +1,46 @@
+"""
+Regression checks for the price oracle's text extraction
+Run: python test_price_patterns.py (or pytest)
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.services.priceOracle import extract_price_mentions, extract_prices_from_text
+from src.services.priceCorpus import extract_document
+
+CASES = [
+    ('Plot for sale Rs 45,00,000', [(4500000.0, 'INR', 'total')]),
+    ('₹12,34,567 only', [(1234567.0, 'INR', 'total')]),
+    ('INR 1,25,00,000 negotiable', [(12500000.0, 'INR', 'total')]),
+    ('Rs. 4,500,000 (western grouping)', [(4500000.0, 'INR', 'total')]),
+    ('Villa at $1,234,567.89', [(1234567.89, 'USD', 'total')]),
+    ('£567,890 freehold', [(567890.0, 'GBP', 'total')]),
+    ('Asking 1.5 crore', [(15000000.0, 'INR', 'total')]),
+    ('₹5,000 per sq ft', [(5000.0, 'INR', 'per_sqft')]),
+    ('Land at 4,500 per square feet', [(4500.0, None, 'per_sqft')]),
+    ('7,500 per sq m', [(7500.0, None, 'per_sqm')]),
+    ('€3,200/m² in the centre', [(3200.0, 'EUR', 'per_sqm')]),
+]
+
+
+def test_price_mentions():
+    for text, expected in CASES:
+        assert extract_price_mentions(text) == expected, f"{text!r}: {extract_price_mentions(text)}"
+
+
+def test_unit_prices_kept_out_of_totals():
+    text = 'Plot 50 lakh, ₹4,500 per sq ft, nearby house Rs 75,00,000'
+    assert sorted(extract_prices_from_text(text)) == [5000000.0, 7500000.0]
+
+
+def test_corpus_records_carry_units():
+    record = extract_document({'id': 'a', 'title': '₹4,500 per sq ft', 'snippet': 'Rs 45,00,000 ₹4,500 per sq ft'})
+    assert record['prices'] == [[4500.0, 'INR', 'per_sqft'], [4500000.0, 'INR', 'total']]
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} price extraction checks passed ({len(CASES)} cases)")
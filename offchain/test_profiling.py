@@ -0,0 +1,62 @@
+"""
+Checks for the sampling profiler (stack depth cap, sample accounting)
+Run: python test_profiling.py (or pytest)
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.profiling import StackSampler, TRUNCATED_LABEL
+
+
+def _recurse(depth, seconds):
+    if depth == 0:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+        return
+    _recurse(depth - 1, seconds)
+
+
+def test_deep_stacks_truncated():
+    sampler = StackSampler(interval=0.002, max_depth=10)
+    sampler.start()
+    _recurse(50, 0.1)
+    sampler.stop()
+
+    assert sampler.samples > 0
+    deep = [stack for stack in sampler.stacks if '_recurse' in stack]
+    assert deep
+    for stack in deep:
+        frames = stack.split(';')
+        # thread name, truncation marker, then the 10 innermost frames
+        assert frames[1] == TRUNCATED_LABEL and len(frames) == 12
+
+
+def test_summary_reports_samples_and_overhead():
+    sampler = StackSampler(interval=0.005)
+    sampler.start()
+    start = time.perf_counter()
+    time.sleep(0.1)
+    sampler.stop()
+    elapsed = time.perf_counter() - start
+
+    assert 0 < sampler.sampling_seconds < elapsed
+    summary = sampler.summary(elapsed)
+    assert f"{sampler.samples}/" in summary and 'sampler overhead' in summary
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profile.folded')
+        sampler.write(path)
+        with open(path, encoding='utf-8') as f:
+            counts = [int(line.rsplit(' ', 1)[1]) for line in f]
+        assert sum(counts) >= sampler.samples
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} profiling checks passed")
@@ -0,0 +1,42 @@
+"""
+Checks for the CLI result options: msgpack framing and --omit
+Run: python test_result_framing.py (or pytest)
+"""
+import io
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.utils.cli import encode_frame, iter_frames, read_output_options, strip_fields
+
+EVENTS = [
+    {'event': 'metrics', 'area_sqm': 31393.4, 'ndvi': 0.42, 'tiles': {'rgb': {'levels': [0, 1, 2]}}},
+    {'event': 'images', 'rgb_image_path': '/tmp/rgb.png', 'note': 'Sentinel-2 ' * 200},
+    {'valuation': 450000, 'confidence': 82, 'risk_factors': [], 'raw': b'\x00\x01'},
+    {}
+]
+
+
+def test_frames_round_trip():
+    stream = io.BytesIO(b''.join(encode_frame(event) for event in EVENTS))
+    assert list(iter_frames(stream)) == EVENTS
+
+
+def test_truncated_frame_stops_cleanly():
+    data = encode_frame(EVENTS[0]) + encode_frame(EVENTS[1])[:2]
+    assert list(iter_frames(io.BytesIO(data))) == EVENTS[:1]
+
+
+def test_omit_large_keeps_local_paths():
+    output_format, omit = read_output_options(['--format', 'msgpack', '--omit', 'large,ndvi'])
+    assert output_format == 'msgpack'
+    stripped = strip_fields(EVENTS[1], omit)
+    assert stripped == {'event': 'images', 'rgb_image_path': '/tmp/rgb.png'}
+    assert 'ndvi' not in strip_fields(EVENTS[0], omit)
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} result framing checks passed")
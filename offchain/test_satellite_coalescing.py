@@ -0,0 +1,107 @@
+"""
+Checks for satellite request coalescing (opt-in per caller, shared raster, marked output)
+Run: python test_satellite_coalescing.py (or pytest)
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The agents read their API keys at import time
+for key in ('GROQ_API_KEY', 'OPENROUTER_API_KEY'):
+    os.environ.setdefault(key, 'test')
+import satellite_service
+from src.services import analysisPipeline
+from src.utils.jobQueue import StageQueues
+from src.utils.sceneRaster import RASTER_BANDS, SceneRaster, degrees_for_meters
+
+
+class _Patched:
+    """Temporarily replace module attributes"""
+
+    def __init__(self, *patches):
+        self.patches = patches
+
+    def __enter__(self):
+        self.saved = [(module, name, getattr(module, name)) for module, name, _ in self.patches]
+        for module, name, value in self.patches:
+            setattr(module, name, value)
+
+    def __exit__(self, *exc):
+        for module, name, value in self.saved:
+            setattr(module, name, value)
+
+
+def _raster(points, scene_mode):
+    reach = max(reach for _, _, reach in points)
+    lat_offset, lon_offset = degrees_for_meters(reach, points[0][0])
+    rng = np.random.default_rng(0)
+    bands = {band: rng.integers(500, 3000, (160, 160)) for band in RASTER_BANDS}
+    raster = SceneRaster(bands, points[0][1] - lon_offset, points[0][0] - lat_offset,
+                         points[0][1] + lon_offset, points[0][0] + lat_offset)
+    return {'cloud_coverage': 3.0, 'image_date': '2026-10-01', 'scene_count': 4}, raster
+
+
+def _cleanup(result):
+    for key, value in result.items():
+        if key.endswith('_path') and value and os.path.exists(value):
+            os.remove(value)
+
+
+def test_one_shot_calls_do_not_coalesce():
+    def no_earth_engine():
+        raise RuntimeError('earth engine not available')
+
+    def shared_scene(*args):
+        raise AssertionError('a one-shot request must not wait for neighbours')
+
+    with _Patched((satellite_service, 'SATELLITE_COALESCE_WINDOW_MS', 50.0),
+                  (satellite_service, '_initialize_earth_engine', no_earth_engine),
+                  (satellite_service, '_shared_scene', shared_scene)):
+        try:
+            satellite_service.fetch_satellite_data(13.08, 80.27)
+            raise AssertionError('expected the direct Earth Engine path to fail')
+        except Exception as e:
+            assert 'earth engine not available' in str(e)
+
+
+def test_server_requests_share_one_raster():
+    fetches = []
+
+    def fetch(points, scene_mode):
+        fetches.append(list(points))
+        return _raster(points, scene_mode)
+
+    queues = StageQueues({'satellite': 1})
+    results = {}
+
+    def request(name, latitude):
+        results[name] = analysisPipeline.fetch_satellite({'latitude': latitude, 'longitude': 80.27}, queues)
+
+    with _Patched((satellite_service, 'SATELLITE_COALESCE_WINDOW_MS', 200.0),
+                  (analysisPipeline, 'SATELLITE_COALESCE_WINDOW_MS', 200.0),
+                  (satellite_service, '_fetch_shared_raster', fetch)):
+        threads = [threading.Thread(target=request, args=(name, 13.0800 + i * 0.0005))
+                   for i, name in enumerate(('a', 'b'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+    queues.shutdown()
+
+    assert len(fetches) == 1 and len(fetches[0]) == 2
+    for result in results.values():
+        _cleanup(result)
+        assert result['coalesced'] is True and result['coalesced_requests'] == 2
+        assert result['image_size_px'] == satellite_service.COALESCE_CROP_SIZE
+        assert result['image_extent_m'] == 2 * satellite_service.COALESCE_CROP_M
+        assert result['rgb_image_url'] is None and -1 <= result['ndvi'] <= 1
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+    print(f"✅ {len(tests)} satellite coalescing checks passed")